@@ -0,0 +1,187 @@
+from typing import Optional
+
+import falcon
+import falcon.asgi
+from falcon_cors import CORS
+
+from config import config
+from model.admission import AdmissionMiddleware
+from model.auth import Auth
+from model.auth_async import AsyncAuth
+from model.cache import Cache
+from model.circuit import CircuitBreaker, DirectoryUnavailable, StaleResponseMiddleware, mark_stale
+from model.compression import CompressionMiddleware
+from model.db import DatabaseFactory
+from model.db_async import AsyncDatabaseBridge
+from model.deadline import DeadlineMiddleware
+from model.ldap_budget import OperationBudgetMiddleware
+from model.mailer import Mailer
+from model.media import MediaFormats, RequireMedia
+from model.metrics import Metrics, MetricsApi, AsyncMetricsApi
+from model.passwords import passwords
+from model.profiler import Profiler
+from model.view_api import ViewsApi
+from model.view_api_async import AsyncViewsApi
+
+_deadline_header = (config['deadline'] if 'deadline' in config else {}).get('header', 'X-Request-Timeout')
+
+cors = CORS(
+    allow_origins_list=config['allowOrigins'],
+    allow_headers_list=['Content-Type', 'Authorization'] + ([_deadline_header] if _deadline_header else []),
+    allow_methods_list=['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+)
+
+
+class MaxBody:
+    def __init__(self, max_size=1*1024*1025):
+        self._max_size = max_size
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response):
+        length = req.content_length
+        if length is not None and length > self._max_size:
+            msg = ('The size of the request is too large. The body must not '
+                   'exceed ' + str(self._max_size) + ' bytes in length.')
+            raise falcon.HTTPPayloadTooLarge('Request body is too large', msg)
+
+    async def process_request_async(self, req: falcon.Request, resp: falcon.Response):
+        self.process_request(req, resp)
+
+
+class AsyncCorsMiddleware:
+    def __init__(self, middleware):
+        self.middleware = middleware
+
+    async def process_resource(self, req: falcon.asgi.Request, resp: falcon.asgi.Response, resource, params):
+        self.middleware.process_resource(req, resp, resource, params)
+
+
+class Application:
+    """Creates and wires all components of the API on top of the given database factory."""
+
+    def __init__(self, db_factory: DatabaseFactory):
+        self.db_factory = db_factory
+
+        metrics_config = config['metrics'] if 'metrics' in config else {}
+        self.metrics: Optional[Metrics] = None
+        if metrics_config.get('enabled', False):
+            self.metrics = Metrics(metrics_config.get('token'))
+            db_factory.observers.append(self.metrics.database_observer)
+
+        budget_config = config['ldapBudget'] if 'ldapBudget' in config else {}
+        self.operation_budget: Optional[OperationBudgetMiddleware] = None
+        if budget_config.get('enabled', False):
+            self.operation_budget = OperationBudgetMiddleware(budget_config)
+            db_factory.observers.append(self.operation_budget.observer)
+
+        deadline_config = config['deadline'] if 'deadline' in config else {}
+        self.deadline: Optional[DeadlineMiddleware] = None
+        if deadline_config.get('enabled', False):
+            self.deadline = DeadlineMiddleware(deadline_config)
+
+        breaker_config = config['ldap'].get('circuitBreaker', {})
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+        if breaker_config.get('enabled', False):
+            self.circuit_breaker = CircuitBreaker(breaker_config)
+            # First, such that rejected operations are not reported to the other observers
+            db_factory.observers.insert(0, self.circuit_breaker)
+            if self.metrics is not None:
+                self.circuit_breaker.state_observers.append(self.metrics.observe_circuit)
+
+        compression_config = config['compression'] if 'compression' in config else {}
+        self.compression: Optional[CompressionMiddleware] = None
+        if compression_config.get('enabled', False):
+            self.compression = CompressionMiddleware(compression_config)
+
+        profiler_config = config['profiler'] if 'profiler' in config else {}
+        self.profiler: Optional[Profiler] = None
+        if profiler_config.get('enabled', False):
+            self.profiler = Profiler(profiler_config)
+
+        self.media = MediaFormats(config['media'] if 'media' in config else {})
+        passwords.configure(config['passwords'] if 'passwords' in config else {})
+
+        cache_config = config['cache'] if 'cache' in config else {}
+        self.cache: Optional[Cache] = None
+        if cache_config.get('enabled', False):
+            self.cache = Cache(cache_config)
+            if self.metrics is not None:
+                self.cache.lookup_observers.append(self.metrics.observe_cache)
+            self.cache.stale_errors = (DirectoryUnavailable,)
+            self.cache.stale_observers.append(mark_stale)
+
+        self.views = ViewsApi(
+            db_factory, config['views'], container_check=config['ldap'].get('containerCheck', 'concurrent'),
+            cache=self.cache,
+        )
+        self.auth = Auth(self.views.views, db_factory, config['auth'], cache=self.cache)
+        self.mailer = Mailer(config['mail'])
+        if self.metrics is not None:
+            self.mailer.send_observers.append(self.metrics.observe_smtp)
+            self.auth.throttle.throttle_observers.append(self.metrics.observe_throttle)
+
+        admission_config = config['admission'] if 'admission' in config else {}
+        self.admission: Optional[AdmissionMiddleware] = None
+        if admission_config.get('enabled', False):
+            self.admission = AdmissionMiddleware(admission_config, self.auth.throttle.client_ip)
+            if self.metrics is not None:
+                self.admission.reject_observers.append(self.metrics.observe_admission)
+
+        self.app = self.create_app()
+
+    def _middleware(self) -> list:
+        middleware = []
+        if self.deadline is not None:
+            middleware.append(self.deadline)
+        if self.metrics is not None:
+            middleware.append(self.metrics.middleware)
+        if self.compression is not None:
+            # Responses are processed in reverse order, thus this compresses the final body
+            middleware.append(self.compression)
+        if self.operation_budget is not None:
+            middleware.append(self.operation_budget)
+        if self.cache is not None and self.cache.stale_ttl > 0:
+            middleware.append(StaleResponseMiddleware())
+        return middleware
+
+    def _resource_middleware(self) -> list:
+        # After the auth middleware, which sets the user to queue by and to check the profiling permission of
+        middleware = []
+        if self.admission is not None:
+            middleware.append(self.admission)
+        if self.profiler is not None:
+            middleware.append(self.profiler.middleware)
+        return middleware
+
+    def create_app(self) -> falcon.API:
+        app = falcon.API(
+            middleware=self._middleware() + [
+                cors.middleware, self.auth.auth_middleware, RequireMedia(self.media), MaxBody()
+            ] + self._resource_middleware(),
+        )
+        self.media.install(app)
+
+        self.views.register(app, self.auth.relogin)
+        self.auth.register(app, self.mailer)
+        if self.metrics is not None:
+            MetricsApi(self.metrics).register(app)
+        if self.profiler is not None:
+            self.profiler.register(app)
+        return app
+
+    def create_asgi_app(self, bridge: AsyncDatabaseBridge) -> falcon.asgi.App:
+        async_auth = AsyncAuth(self.auth, bridge)
+
+        app = falcon.asgi.App(
+            middleware=self._middleware() + [
+                AsyncCorsMiddleware(cors.middleware), async_auth.auth_middleware, RequireMedia(self.media), MaxBody()
+            ] + self._resource_middleware(),
+        )
+        self.media.install(app)
+
+        AsyncViewsApi(self.views, bridge).register(app, self.auth.relogin)
+        async_auth.register(app, self.mailer)
+        if self.metrics is not None:
+            AsyncMetricsApi(self.metrics).register(app)
+        if self.profiler is not None:
+            self.profiler.register_async(app)
+        return app
@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+"""
+ASGI entry point. Serve with any ASGI server, e.g. `uvicorn asgi:app`.
+
+Shares the components with `server`, blocking directory and mail calls run on a thread pool.
+"""
+from config import config
+from model.db_async import AsyncDatabaseBridge
+import server
+
+bridge = AsyncDatabaseBridge(config['asgi'] if 'asgi' in config else {})
+app = server.application.create_asgi_app(bridge)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+End-to-end benchmark of the HTTP API on the mock directory, in-process with Falcon's testing client.
+
+For every directory size, the app is built on a generated directory (see `db_mock_generator`) and every endpoint is
+requested sequentially. Reports throughput, latency percentiles and directory operations per request as JSON, such that
+runs can be compared across commits.
+
+Usage: python -m bench.api [--sizes 100,10000] [--requests 200] [--rtt 0] [--output results.json]
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import falcon.testing
+
+from bench.common import BENCH_PASSWORD, create_generated_app, permitted_user, login_header, percentiles
+from db_mock import MockDatabaseFactory
+from model.ldap_budget import OperationBudgetObserver, track_operations
+
+RequestFn = Callable[[falcon.testing.TestClient, Dict[str, Any], int], falcon.testing.Result]
+
+
+def _login(client: falcon.testing.TestClient, context: Dict[str, Any], index: int) -> falcon.testing.Result:
+    return client.simulate_post('/jwt-auth', json={'username': context['user'], 'password': BENCH_PASSWORD})
+
+
+def _config(client: falcon.testing.TestClient, context: Dict[str, Any], index: int) -> falcon.testing.Result:
+    return client.simulate_get('/config', headers=context['headers'])
+
+
+def _list_users(client: falcon.testing.TestClient, context: Dict[str, Any], index: int) -> falcon.testing.Result:
+    return client.simulate_get('/users', headers=context['headers'])
+
+
+def _list_users_columns(
+        client: falcon.testing.TestClient, context: Dict[str, Any], index: int
+) -> falcon.testing.Result:
+    return client.simulate_get('/users', params={'format': 'columns'}, headers=context['headers'])
+
+
+def _get_user(client: falcon.testing.TestClient, context: Dict[str, Any], index: int) -> falcon.testing.Result:
+    return client.simulate_get('/users/' + context['other_user'], headers=context['headers'])
+
+
+def _get_self(client: falcon.testing.TestClient, context: Dict[str, Any], index: int) -> falcon.testing.Result:
+    return client.simulate_get('/users/self', headers=context['headers'])
+
+
+def _patch_user(client: falcon.testing.TestClient, context: Dict[str, Any], index: int) -> falcon.testing.Result:
+    return client.simulate_patch('/users/' + context['other_user'], headers=context['headers'], json={
+        'user': {'givenName': 'Patched' if index % 2 == 0 else 'Bench'},
+    })
+
+
+def _create_user(client: falcon.testing.TestClient, context: Dict[str, Any], index: int) -> falcon.testing.Result:
+    uid = 'bench-{}-{}'.format(context['run'], index)
+    return client.simulate_post('/users', headers=context['headers'], json={
+        'user': {
+            'uid': uid, 'givenName': 'Bench', 'sn': 'User', 'mail': uid + '@example.com', 'mobile': '0123 456789',
+            'isAdmin': False, 'isSuperuser': False, 'isNew': True,
+        },
+    })
+
+
+ENDPOINTS: List[Tuple[str, str, RequestFn]] = [
+    ('POST', '/jwt-auth', _login),
+    ('GET', '/config', _config),
+    ('GET', '/users', _list_users),
+    ('GET', '/users?format=columns', _list_users_columns),
+    ('GET', '/users/{pk}', _get_user),
+    ('GET', '/users/self', _get_self),
+    ('PATCH', '/users/{pk}', _patch_user),
+    ('POST', '/users', _create_user),
+]
+
+
+def bench_endpoint(
+        client: falcon.testing.TestClient, context: Dict[str, Any], request: RequestFn, requests: int, max_time: float
+) -> Dict[str, Any]:
+    latencies = []
+    operations = []
+    start = time.perf_counter()
+    for index in range(requests):
+        with track_operations(call_sites=False) as tracked:
+            request_start = time.perf_counter()
+            result = request(client, context, index)
+            latencies.append(time.perf_counter() - request_start)
+        assert result.status_code == 200, result.text
+        operations.append(tracked.count)
+        if time.perf_counter() - start > max_time:
+            break
+    duration = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'duration': duration,
+        'throughput': len(latencies) / duration,
+        'latency': percentiles(latencies),
+        'ldapOperations': sum(operations) / len(operations),
+    }
+
+
+def bench_size(
+        users: int, requests: int, max_time: float, rtt: float, snapshot_dir: Optional[str],
+        endpoints: Optional[List[str]],
+) -> List[Dict[str, Any]]:
+    groups, teams = max(3, users // 200), max(1, users // 2000)
+    start = time.perf_counter()
+    application, db_factory = create_generated_app(users, groups, teams, seed=0, snapshot_dir=snapshot_dir)
+    setup = time.perf_counter() - start
+    _ensure_operation_observer(db_factory)
+    db_factory.network.rtt = rtt
+
+    user = permitted_user(application, db_factory)
+    other_user = next(
+        uid for uid in ('user{}'.format(index) for index in range(users)) if uid != user
+    )
+    context = {
+        'user': user,
+        'other_user': other_user,
+        'headers': login_header(application.auth, user),
+        'run': int(time.time()),
+    }
+    client = falcon.testing.TestClient(application.app)
+
+    results = []
+    for method, route, request in ENDPOINTS:
+        name = '{} {}'.format(method, route)
+        if endpoints is not None and name not in endpoints:
+            continue
+        result = bench_endpoint(client, context, request, requests, max_time)
+        results.append({
+            'users': users, 'groups': groups, 'teams': teams, 'rtt': rtt, 'setup': setup, 'endpoint': name, **result
+        })
+        print("{:>8} users  {:<26} {:8.1f} req/s  p50 {:7.2f}ms  p99 {:7.2f}ms  {:6.1f} ops/req".format(
+            users, name, result['throughput'], result['latency']['p50'] * 1000, result['latency']['p99'] * 1000,
+            result['ldapOperations']
+        ), file=sys.stderr)
+    return results
+
+
+def _ensure_operation_observer(db_factory: MockDatabaseFactory):
+    if not any(isinstance(observer, OperationBudgetObserver) for observer in db_factory.observers):
+        db_factory.observers.append(OperationBudgetObserver())
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,10000', help="Comma separated numbers of users")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint")
+    parser.add_argument('--max-time', type=float, default=10, help="Maximum seconds per endpoint")
+    parser.add_argument('--rtt', type=float, default=0.0, help="Simulated directory round trip time in seconds")
+    parser.add_argument('--endpoint', action='append', help="Only run this endpoint (e.g. 'GET /users')")
+    parser.add_argument('--snapshot-dir', help="Directory to cache the generated directories in")
+    parser.add_argument('--output', help="Write the results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = []
+    for users in (int(size) for size in args.sizes.split(',')):
+        results.extend(bench_size(users, args.requests, args.max_time, args.rtt, args.snapshot_dir, args.endpoint))
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'falcon': falcon.__version__,
+        'timestamp': time.time(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
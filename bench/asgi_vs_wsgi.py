@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Compares the WSGI and the ASGI entry point under concurrent load, with a simulated directory round trip time.
+
+The WSGI app is driven by a fixed number of threads (1 equals a gunicorn sync worker), the ASGI app by one event loop
+with all requests in flight at once.
+
+Usage: python -m bench.asgi_vs_wsgi [--concurrency 200] [--rtt 0.01] [--wsgi-threads 1]
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+
+import falcon.testing
+
+from bench.common import create_mock_app, login_header, percentiles
+from model.db_async import AsyncDatabaseBridge
+
+
+def run_wsgi(app, headers: Dict[str, str], requests: int, threads: int) -> Dict[str, Any]:
+    client = falcon.testing.TestClient(app, headers=headers)
+
+    def request(_):
+        start = time.perf_counter()
+        result = client.simulate_get('/users/self')
+        assert result.status_code == 200, result.text
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(request, range(requests)))
+    duration = time.perf_counter() - start
+    return {'mode': 'wsgi', 'threads': threads, 'requests': requests, 'duration': duration,
+            'throughput': requests / duration, 'latency': percentiles(latencies)}
+
+
+def run_asgi(app, headers: Dict[str, str], requests: int, pool_size: int) -> Dict[str, Any]:
+    async def main():
+        async with falcon.testing.ASGIConductor(app, headers=headers) as conductor:
+            async def request():
+                start = time.perf_counter()
+                result = await conductor.simulate_get('/users/self')
+                assert result.status_code == 200, result.text
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            latencies = await asyncio.gather(*(request() for _ in range(requests)))
+            return time.perf_counter() - start, latencies
+
+    duration, latencies = asyncio.run(main())
+    return {'mode': 'asgi', 'threads': pool_size, 'requests': requests, 'duration': duration,
+            'throughput': requests / duration, 'latency': percentiles(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=200, help="Requests in flight (and total requests)")
+    parser.add_argument('--rtt', type=float, default=0.01, help="Simulated directory round trip time in seconds")
+    parser.add_argument('--wsgi-threads', type=int, default=1, help="Threads serving the WSGI app")
+    parser.add_argument('--pool-size', type=int, default=200, help="Thread pool size of the ASGI bridge")
+    args = parser.parse_args()
+
+    application, db_factory = create_mock_app(users=10)
+    headers = login_header(application.auth)
+    db_factory.network.rtt = args.rtt
+
+    bridge = AsyncDatabaseBridge({'threadPoolSize': args.pool_size})
+    asgi_app = application.create_asgi_app(bridge)
+
+    results = [
+        run_wsgi(application.app, headers, args.concurrency, args.wsgi_threads),
+        run_asgi(asgi_app, headers, args.concurrency, args.pool_size),
+    ]
+    bridge.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
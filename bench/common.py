@@ -0,0 +1,119 @@
+"""Shared setup of the benchmarks: the application on top of the in-memory mock directory."""
+import os
+import statistics
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Tuple, Callable, Optional
+
+import ldap3
+import passlib.hash
+
+from application import Application
+from config import config
+from db_mock import MockDatabaseFactory
+from db_mock_generator import generate_directory
+from model.db import LdapMods
+
+BENCH_PASSWORD = 'benchmark-password'
+
+
+def _bench_application(db_factory: MockDatabaseFactory) -> Application:
+    application = Application(db_factory)
+    # Benchmarks log in repeatedly as the same user from one client, measure the logins instead of the rate limits
+    application.auth.throttle.limits.clear()
+    return application
+
+
+def create_mock_app(users: int = 10) -> Tuple[Application, MockDatabaseFactory]:
+    """Creates the application on a fresh mock directory containing `users` users, all member of the admin group."""
+    db_factory = MockDatabaseFactory(config['ldap'], mod_timestamp=datetime(2019, 1, 1))
+    application = _bench_application(db_factory)
+    views = application.views
+
+    superuser = {permission: True for permission in config['views'][config['auth']['view']]['permissions']}
+    superuser['primaryKey'] = 'unknown'
+
+    groups_view = views.views['groups']
+    for group in ('admin', 'superuser', 'new'):
+        groups_view.create_detail(superuser, {'group': {'cn': group}})
+
+    users_view = views.views['users']
+    # Hash once, the mock only verifies salted SHA1
+    password_hash = passlib.hash.ldap_salted_sha1.hash(BENCH_PASSWORD)
+    for idx in range(users):
+        uid = 'user{}'.format(idx)
+        users_view.create_detail(superuser, {
+            'user': {
+                'uid': uid,
+                'givenName': 'Bench',
+                'sn': 'User',
+                'mail': '{}@localhost.localdomain'.format(uid),
+                'mobile': '0123 456789',
+                'isAdmin': True,
+                'isSuperuser': False,
+                'isNew': False,
+            },
+        })
+        db_factory.connection.modify(users_view.get_dn(uid), {
+            'userPassword': [(LdapMods.REPLACE, [password_hash])],
+            'objectClass': [(LdapMods.ADD, ['simpleSecurityObject'])],
+        })
+    return application, db_factory
+
+
+def create_generated_app(
+        users: int, groups: int = 0, teams: int = 0, seed: int = 0, snapshot_dir: Optional[str] = None
+) -> Tuple[Application, MockDatabaseFactory]:
+    """
+    Creates the application on a generated mock directory (see `db_mock_generator`), all users have `BENCH_PASSWORD`.
+    With `snapshot_dir`, the generated directory is stored there and restored by later runs.
+    """
+    db_factory = MockDatabaseFactory(config['ldap'], mod_timestamp=datetime(2019, 1, 1))
+    snapshot = None
+    if snapshot_dir is not None:
+        snapshot = os.path.join(snapshot_dir, 'directory-{}-{}-{}-{}.snapshot'.format(users, groups, teams, seed))
+    if snapshot is not None and os.path.exists(snapshot):
+        db_factory.directory.restore(snapshot)
+    else:
+        generate_directory(
+            db_factory, config, {'users': users, 'groups': groups, 'teams': teams}, seed=seed, password=BENCH_PASSWORD
+        )
+        if snapshot is not None:
+            os.makedirs(snapshot_dir, exist_ok=True)
+            db_factory.directory.snapshot(snapshot)
+    return _bench_application(db_factory), db_factory
+
+
+def permitted_user(application: Application, db_factory: MockDatabaseFactory) -> str:
+    """Gets the primary key of a user having the (first) permission of the auth view, e.g. an admin."""
+    auth_config = config['views'][config['auth']['view']]
+    field = auth_config['list'][auth_config['permissions'][0]]
+    group_dn = application.views.views[field['foreignView']].get_dn(field['memberOf'])
+    member_dn = db_factory.data[group_dn]['member'][0]
+    return ldap3.utils.dn.parse_dn(member_dn)[0][1]
+
+
+def login_header(auth, primary_key: str = 'user0') -> Dict[str, str]:
+    token = auth.relogin(primary_key)['token']
+    return {'Authorization': '{} {}'.format(auth.header_prefix, token)}
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def pick(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        'mean': statistics.mean(ordered),
+        'p50': pick(0.5),
+        'p90': pick(0.9),
+        'p99': pick(0.99),
+        'max': ordered[-1],
+    }
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+"""
+Closed-loop load test of a single worker on the mock directory with simulated directory latency.
+
+Every virtual user sends a request of the mix, waits for the response and sends the next one. The number of virtual
+users rises step by step, each step reports throughput, latency percentiles, the utilization of the request pool
+(server threads for WSGI, the directory thread pool for ASGI) and the cache hit ratio, and the step where throughput
+stops growing is reported as saturation point.
+
+WSGI runs on the pool server of `serve.py` over HTTP, ASGI in-process (there is no ASGI server dependency).
+
+Usage: python -m bench.load [--mode wsgi] [--concurrency 1,2,4,8,16,32,64] [--rtt 0.005] [--output curve.json]
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Tuple, Callable, Optional
+
+import falcon.testing
+
+from bench.common import BENCH_PASSWORD, create_generated_app, permitted_user, login_header, percentiles
+from model.db_async import AsyncDatabaseBridge
+from model.metrics import Metrics
+from serve import PoolWSGIServer
+
+# Request of the mix: (method, path, body)
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+
+class RequestMix:
+    """Weighted mix of mostly authenticated reads, some writes and logins."""
+
+    def __init__(self, weights: Dict[str, float], users: List[str], login_user: str, seed: int):
+        self.kinds = list(weights)
+        self.weights = [weights[kind] for kind in self.kinds]
+        self.users = users
+        self.login_user = login_user
+        self.random = random.Random(seed)
+
+    def next(self) -> Request:
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind == 'self':
+            return 'GET', '/users/self', None
+        if kind == 'get':
+            return 'GET', '/users/' + self.random.choice(self.users), None
+        if kind == 'config':
+            return 'GET', '/config', None
+        if kind == 'list':
+            return 'GET', '/users', None
+        if kind == 'patch':
+            return 'PATCH', '/users/' + self.random.choice(self.users), {
+                'user': {'givenName': self.random.choice(('Load', 'Test'))},
+            }
+        if kind == 'login':
+            return 'POST', '/jwt-auth', {'username': self.login_user, 'password': BENCH_PASSWORD}
+        raise ValueError("Unknown request kind {}".format(kind))
+
+
+class UtilizationSampler:
+    """Samples the number of busy pool slots in a fixed interval."""
+
+    def __init__(self, busy: Callable[[], int], size: int, interval: float = 0.005):
+        self.busy = busy
+        self.size = size
+        self.interval = interval
+        self.samples: List[int] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append(self.busy())
+
+    def __enter__(self) -> 'UtilizationSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+
+    def result(self) -> Dict[str, float]:
+        if not self.samples:
+            return {'mean': 0.0, 'saturated': 0.0, 'queued': 0.0, 'peak': 0}
+        return {
+            'mean': sum(min(busy, self.size) for busy in self.samples) / len(self.samples) / self.size,
+            # Fraction of the time all slots were busy (requests queue up)
+            'saturated': sum(1 for busy in self.samples if busy >= self.size) / len(self.samples),
+            # Mean number of calls waiting for a slot (only visible for the directory thread pool)
+            'queued': sum(max(0, busy - self.size) for busy in self.samples) / len(self.samples),
+            'peak': max(self.samples),
+        }
+
+
+def _cache_counts(metrics: Optional[Metrics]) -> Tuple[float, float]:
+    if metrics is None:
+        return 0, 0
+    hits = misses = 0.0
+    for line in metrics.cache_requests.expose():
+        if line.startswith('#'):
+            continue
+        if 'result="hit"' in line:
+            hits += float(line.rsplit(' ', 1)[1])
+        elif 'result="miss"' in line:
+            misses += float(line.rsplit(' ', 1)[1])
+    return hits, misses
+
+
+def _step_result(
+        concurrency: int, duration: float, latencies: List[float], errors: int, utilization: Dict[str, float],
+        cache_before: Tuple[float, float], cache_after: Tuple[float, float],
+) -> Dict[str, Any]:
+    hits, misses = cache_after[0] - cache_before[0], cache_after[1] - cache_before[1]
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / duration,
+        'latency': percentiles(latencies) if latencies else None,
+        'poolUtilization': utilization,
+        'cacheHitRatio': hits / (hits + misses) if hits + misses > 0 else None,
+    }
+
+
+def run_wsgi_step(
+        server: PoolWSGIServer, headers: Dict[str, str], mix: RequestMix, concurrency: int, duration: float,
+        keep_alive: bool,
+) -> Tuple[float, List[float], int]:
+    host, port = server.server_address[:2]
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def virtual_user():
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        while time.perf_counter() < deadline:
+            with lock:
+                method, path, body = mix.next()
+            request_headers = dict(headers, Accept='application/json')
+            if not keep_alive:
+                request_headers['Connection'] = 'close'
+            data = None
+            if body is not None:
+                data = json.dumps(body).encode()
+                request_headers['Content-Type'] = 'application/json'
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, body=data, headers=request_headers)
+                response = connection.getresponse()
+                response.read()
+                failed = response.status >= 400
+            except (OSError, http.client.HTTPException):
+                failed = True
+                connection.close()
+            elapsed = time.perf_counter() - start
+            if not keep_alive:
+                connection.close()
+            with lock:
+                latencies.append(elapsed)
+                if failed:
+                    errors[0] += 1
+        connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=virtual_user, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, errors[0]
+
+
+def run_asgi_step(
+        app, headers: Dict[str, str], mix: RequestMix, concurrency: int, duration: float
+) -> Tuple[float, List[float], int]:
+    latencies: List[float] = []
+    errors = [0]
+
+    async def main():
+        async with falcon.testing.ASGIConductor(app, headers=headers) as conductor:
+            deadline = time.perf_counter() + duration
+
+            async def virtual_user():
+                while time.perf_counter() < deadline:
+                    method, path, body = mix.next()
+                    start = time.perf_counter()
+                    result = await conductor.simulate_request(method, path, json=body)
+                    latencies.append(time.perf_counter() - start)
+                    if result.status_code >= 400:
+                        errors[0] += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+            return time.perf_counter() - start
+
+    return asyncio.run(main()), latencies, errors[0]
+
+
+def find_saturation(steps: List[Dict[str, Any]], growth: float = 1.05) -> Optional[int]:
+    """Gets the concurrency after which the throughput grows by less than `growth`."""
+    best = 0.0
+    for step, next_step in zip(steps, steps[1:]):
+        best = max(best, step['throughput'])
+        if next_step['throughput'] < best * growth:
+            return step['concurrency']
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--concurrency', default='1,2,4,8,16,32,64', help="Comma separated virtual users per step")
+    parser.add_argument('--step-duration', type=float, default=5.0, help="Seconds per step")
+    parser.add_argument('--threads', type=int, default=8, help="Server threads (WSGI) or directory pool size (ASGI)")
+    parser.add_argument('--keep-alive', action='store_true', help="Reuse the connection of a virtual user (WSGI)")
+    parser.add_argument('--users', type=int, default=1000, help="Users in the generated directory")
+    parser.add_argument('--rtt', type=float, default=0.005, help="Simulated directory round trip time in seconds")
+    parser.add_argument('--per-entry', type=float, default=0.0, help="Simulated time per returned entry in seconds")
+    parser.add_argument(
+        '--mix', default='self=40,get=40,config=5,patch=10,login=5',
+        help="Weights of the request kinds (self, get, config, list, patch, login)"
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the curve to this file instead of stdout")
+    args = parser.parse_args()
+
+    application, db_factory = create_generated_app(args.users, max(3, args.users // 200), seed=args.seed)
+    db_factory.network.rtt = args.rtt
+    db_factory.network.per_entry = args.per_entry
+    login_user = permitted_user(application, db_factory)
+    headers = login_header(application.auth, login_user)
+    weights = {kind: float(weight) for kind, weight in (item.split('=') for item in args.mix.split(','))}
+    mix = RequestMix(weights, ['user{}'.format(index) for index in range(args.users)], login_user, args.seed)
+
+    server = None
+    bridge = None
+    if args.mode == 'wsgi':
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_socket.bind(('127.0.0.1', 0))
+        listen_socket.listen(1024)
+        server = PoolWSGIServer(listen_socket, args.threads, keep_alive=2.0)
+        server.set_app(application.app)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        sampler_source = (lambda: server.active, args.threads)
+    else:
+        bridge = AsyncDatabaseBridge({'threadPoolSize': args.threads})
+        asgi_app = application.create_asgi_app(bridge)
+        sampler_source = (lambda: bridge.in_flight, args.threads)
+
+    steps = []
+    for concurrency in (int(level) for level in args.concurrency.split(',')):
+        cache_before = _cache_counts(application.metrics)
+        with UtilizationSampler(*sampler_source) as sampler:
+            if server is not None:
+                duration, latencies, errors = run_wsgi_step(
+                    server, headers, mix, concurrency, args.step_duration, args.keep_alive
+                )
+            else:
+                duration, latencies, errors = run_asgi_step(asgi_app, headers, mix, concurrency, args.step_duration)
+        step = _step_result(
+            concurrency, duration, latencies, errors, sampler.result(), cache_before, _cache_counts(application.metrics)
+        )
+        steps.append(step)
+        utilization = step['poolUtilization']
+        line = "{:4d} users  {:8.1f} req/s  p50 {:7.2f}ms  p99 {:7.2f}ms  pool {:4.0%} (saturated {:4.0%})  {} errors"
+        print(line.format(
+            concurrency, step['throughput'], step['latency']['p50'] * 1000, step['latency']['p99'] * 1000,
+            utilization['mean'], utilization['saturated'], errors,
+        ), file=sys.stderr)
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    if bridge is not None:
+        bridge.shutdown()
+
+    report = {
+        'mode': args.mode,
+        'threads': args.threads,
+        'users': args.users,
+        'rtt': args.rtt,
+        'mix': weights,
+        'steps': steps,
+        'saturation': find_saturation(steps),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
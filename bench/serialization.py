@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark of serializing the `/users` list: the encoding time and size of every available media handler (stdlib JSON,
+fast JSON and the installed binary formats) on the list of a generated directory, and the full `GET /users` per
+`Accept` type.
+
+Usage: python -m bench.serialization [--users 50000] [--repeat 5] [--requests 5] [--output results.json]
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Any, List
+
+import falcon
+import falcon.testing
+
+from bench.common import create_generated_app, permitted_user, login_header, percentiles
+from model.media import json_handler, OPTIONAL_FORMATS
+
+
+def _handlers() -> Dict[str, falcon.media.BaseHandler]:
+    handlers = {'application/json (stdlib)': json_handler('stdlib')}
+    try:
+        handlers['application/json (orjson)'] = json_handler('orjson')
+    except ImportError:
+        print("orjson is not installed", file=sys.stderr)
+    for media_type, factory in OPTIONAL_FORMATS.items():
+        try:
+            handlers[media_type] = factory()
+        except ImportError as e:
+            print("{} is not available: {}".format(media_type, e), file=sys.stderr)
+    return handlers
+
+
+def bench_handlers(entries: List[Dict[str, Any]], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for name, handler in _handlers().items():
+        media_type = name.split(' ', 1)[0]
+        timings = []
+        data = b''
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = handler.serialize(entries, media_type)
+            timings.append(time.perf_counter() - start)
+        results.append({
+            'handler': name,
+            'bytes': len(data),
+            'serialize': percentiles(timings),
+        })
+        print("{:<28} {:10d} bytes  serialize p50 {:8.2f}ms".format(
+            name, len(data), results[-1]['serialize']['p50'] * 1000
+        ), file=sys.stderr)
+    return results
+
+
+def bench_endpoint(client: falcon.testing.TestClient, headers: Dict[str, str], media_types: List[str], requests: int):
+    results = []
+    for media_type in media_types:
+        latencies = []
+        size = 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            result = client.simulate_get('/users', headers={**headers, 'Accept': media_type})
+            latencies.append(time.perf_counter() - start)
+            assert result.status_code == 200, result.text
+            assert result.headers['Content-Type'] == media_type
+            size = len(result.content)
+        results.append({'accept': media_type, 'bytes': size, 'latency': percentiles(latencies)})
+        print("GET /users  {:<22} {:10d} bytes  p50 {:8.2f}ms".format(
+            media_type, size, results[-1]['latency']['p50'] * 1000
+        ), file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50000, help="Number of users")
+    parser.add_argument('--repeat', type=int, default=5, help="Serializations per handler")
+    parser.add_argument('--requests', type=int, default=5, help="Requests of GET /users per Accept type")
+    parser.add_argument('--snapshot-dir', help="Directory to cache the generated directories in")
+    parser.add_argument('--output', help="Write the results to this file instead of stdout")
+    args = parser.parse_args()
+
+    groups, teams = max(3, args.users // 200), max(1, args.users // 2000)
+    application, db_factory = create_generated_app(args.users, groups, teams, seed=0, snapshot_dir=args.snapshot_dir)
+    user = permitted_user(application, db_factory)
+    auth_user = application.auth.view.get_auth_entry(user)
+    entries = application.views.views['users'].get_list(auth_user)
+
+    client = falcon.testing.TestClient(application.app)
+    report = {
+        'users': args.users,
+        'entries': len(entries),
+        'falcon': falcon.__version__,
+        'timestamp': time.time(),
+        'handlers': bench_handlers(entries, args.repeat),
+        'endpoint': bench_endpoint(
+            client, login_header(application.auth, user), application.media.media_types, args.requests
+        ),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
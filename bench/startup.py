@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Measures the startup time of a worker: importing the app, bootstrapping the views and serving the first requests.
+
+Every measurement runs in a fresh interpreter, once per container check mode (see `ldap.containerCheck`), with a
+simulated directory round trip time.
+
+Usage: python -m bench.startup [--rtt 0.02] [--repeat 3]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+CONTAINER_CHECKS = ('sequential', 'concurrent', 'lazy')
+
+
+def measure(container_check: str, rtt: float) -> dict:
+    start = time.perf_counter()
+    from datetime import datetime
+
+    import falcon.testing
+    import passlib.hash
+
+    from application import Application
+    from bench.common import BENCH_PASSWORD
+    from config import config
+    from db_mock import MockDatabaseFactory
+    imported = time.perf_counter()
+
+    config['ldap']['containerCheck'] = container_check
+    db_factory = MockDatabaseFactory(config['ldap'], mod_timestamp=datetime(2019, 1, 1))
+    db_factory.connection.add(
+        'uid=bench,' + config['views']['users']['dn'] + ',' + config['ldap']['prefix'],
+        ['inetOrgPerson', 'simpleSecurityObject'],
+        {
+            'uid': 'bench', 'cn': 'bench', 'givenName': 'Bench', 'sn': 'User', 'displayName': 'Bench User',
+            'mail': 'bench@localhost.localdomain', 'userPassword': passlib.hash.ldap_salted_sha1.hash(BENCH_PASSWORD),
+        }
+    )
+    db_factory.network.rtt = rtt
+    booted_start = time.perf_counter()
+    application = Application(db_factory)
+    booted = time.perf_counter()
+
+    client = falcon.testing.TestClient(application.app)
+    login = client.simulate_post('/jwt-auth', json={'username': 'bench', 'password': BENCH_PASSWORD})
+    assert login.status_code == 200, login.text
+    logged_in = time.perf_counter()
+    result = client.simulate_get('/users/self', headers={
+        'Authorization': '{} {}'.format(application.auth.header_prefix, login.json['token'])
+    })
+    assert result.status_code == 200, result.text
+    first_request = time.perf_counter()
+
+    return {
+        'containerCheck': container_check,
+        'rtt': rtt,
+        'import': imported - start,
+        'boot': booted - booted_start,
+        'firstLogin': logged_in - booted,
+        'firstRequest': first_request - logged_in,
+        'total': first_request - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rtt', type=float, default=0.02, help="Simulated directory round trip time in seconds")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per container check mode")
+    parser.add_argument('--child', choices=CONTAINER_CHECKS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(measure(args.child, args.rtt)))
+        return
+
+    results = []
+    for container_check in CONTAINER_CHECKS:
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, '-W', 'ignore', '-m', 'bench.startup', '--child', container_check, '--rtt', str(args.rtt)],
+                check=True, stdout=subprocess.PIPE,
+            ).stdout
+            results.append(json.loads(output.decode().strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
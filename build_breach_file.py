@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""
+Builds the breached passwords file for `passwords.breachFile` (see `model.passwords.BreachFile`).
+
+Input is the SHA-1 dump of Pwned Passwords ordered by hash (`HASH:COUNT` lines, e.g. downloaded with the
+PwnedPasswordsDownloader), which is streamed, or a plain text password list with `--plain`, which is sorted in memory.
+
+Usage: python build_breach_file.py [--prefix-bytes 8] [--min-count 1] [--plain] pwned-passwords-sha1.txt out.bin
+"""
+import argparse
+import sys
+import time
+
+from model.passwords import write_breach_file, parse_hash_lines, hash_plain_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="Hash dump or password list, '-' for stdin")
+    parser.add_argument('output', help="File to write")
+    parser.add_argument('--prefix-bytes', type=int, default=8, help="Stored bytes per SHA-1 digest (1-20)")
+    parser.add_argument('--min-count', type=int, default=1, help="Skip hashes seen less often in breaches")
+    parser.add_argument('--plain', action='store_true', help="Input contains plain text passwords")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8', errors='surrogateescape')
+    try:
+        if args.plain:
+            digests = hash_plain_lines(source)
+        else:
+            digests = parse_hash_lines(source, args.min_count)
+        with open(args.output, 'wb') as output:
+            count = write_breach_file(digests, output, args.prefix_bytes, presorted=not args.plain)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print("Wrote {} hashes in {:.1f}s".format(count, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,231 @@
+import collections
+import gc
+import pickle
+import random
 import re
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Sequence, Union
+from typing import Dict, List, Sequence, Union, Optional, Set, Tuple, Iterable, Any, Callable, Deque
 
 import ldap3
 import passlib.hash
-from ldap3.core.exceptions import LDAPInvalidCredentialsResult, LDAPNoSuchObjectResult
+from ldap3.core.exceptions import LDAPInvalidCredentialsResult, LDAPNoSuchObjectResult, LDAPInvalidFilterError, \
+    LDAPResponseTimeoutError, LDAPSocketReceiveError, LDAPBusyResult
 
-from model.db import LdapModlist, LdapMods
+from model import deadline
+from model.db import LdapModlist, LdapMods, DatabaseObserver, ObservedConnection, observe_operation
+from model.single_flight import SingleFlight
 
 ValueType = Union[str, int, bytes, datetime]
+# Stored entries are immutable: modifications replace the value tuples (and the entry dict), thus results handed out
+# earlier keep seeing the state of their search
+EntryType = Dict[str, Tuple[ValueType, ...]]
+
+# Attributes with an equality index (lowercase)
+INDEXED_ATTRIBUTES = ('objectclass', 'mail', 'uid')
+
+PAGED_RESULTS_CONTROL = '1.2.840.113556.1.4.319'
+
+SNAPSHOT_VERSION = 1
+
+_DN_SEPARATOR_RE = re.compile(r'(?<!\\),')
+_FILTER_ESCAPE_RE = re.compile(r'\\([0-9a-fA-F]{2})')
+
+
+def parent_dn(dn: str) -> str:
+    parts = _DN_SEPARATOR_RE.split(dn, 1)
+    return parts[1] if len(parts) == 2 else ''
+
+
+def _normalize(value: ValueType) -> str:
+    if isinstance(value, bytes):
+        return value.decode(errors='replace').lower()
+    if isinstance(value, datetime):
+        return value.strftime('%Y%m%d%H%M%SZ').lower()
+    return str(value).lower()
+
+
+def _get_values(entry: EntryType, attribute: str) -> Tuple[ValueType, ...]:
+    values = entry.get(attribute)
+    if values is None:
+        attribute = attribute.lower()
+        for key, key_values in entry.items():
+            if key.lower() == attribute:
+                return key_values
+        return ()
+    return values
+
+
+class FilterNode:
+    """Parsed search filter (RFC 4515)."""
+
+    def match(self, entry: EntryType) -> bool:
+        raise NotImplementedError()
+
+    def candidates(self, directory: 'MockDirectory') -> Optional[Set[str]]:
+        """Gets a superset of the matching DNs from the indexes, or None if the filter is not indexed."""
+        return None
+
+
+class AndFilter(FilterNode):
+    def __init__(self, children: List[FilterNode]):
+        self.children = children
+
+    def match(self, entry: EntryType) -> bool:
+        return all(child.match(entry) for child in self.children)
+
+    def candidates(self, directory: 'MockDirectory') -> Optional[Set[str]]:
+        result = None
+        for child_candidates in sorted(
+                (c for c in (child.candidates(directory) for child in self.children) if c is not None), key=len
+        ):
+            result = child_candidates if result is None else result.intersection(child_candidates)
+            if not result:
+                break
+        return result
+
+
+class OrFilter(FilterNode):
+    def __init__(self, children: List[FilterNode]):
+        self.children = children
+
+    def match(self, entry: EntryType) -> bool:
+        return any(child.match(entry) for child in self.children)
+
+    def candidates(self, directory: 'MockDirectory') -> Optional[Set[str]]:
+        result: Set[str] = set()
+        for child in self.children:
+            child_candidates = child.candidates(directory)
+            if child_candidates is None:
+                return None
+            result = result.union(child_candidates)
+        return result
+
+
+class NotFilter(FilterNode):
+    def __init__(self, child: FilterNode):
+        self.child = child
+
+    def match(self, entry: EntryType) -> bool:
+        return not self.child.match(entry)
+
+
+class PresentFilter(FilterNode):
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+
+    def match(self, entry: EntryType) -> bool:
+        return len(_get_values(entry, self.attribute)) > 0
+
+
+class CompareFilter(FilterNode):
+    """Equality (`=`, `~=`) and ordering (`>=`, `<=`) filters."""
+
+    def __init__(self, attribute: str, operator: str, value: str):
+        self.attribute = attribute
+        self.operator = operator
+        self.value = value.lower()
+
+    def _compare(self, value: ValueType) -> bool:
+        normalized = _normalize(value)
+        if self.operator in ('=', '~='):
+            return normalized == self.value
+        if isinstance(value, int):
+            try:
+                other = int(self.value)
+            except ValueError:
+                return False
+            return value >= other if self.operator == '>=' else value <= other
+        return normalized >= self.value if self.operator == '>=' else normalized <= self.value
+
+    def match(self, entry: EntryType) -> bool:
+        return any(self._compare(value) for value in _get_values(entry, self.attribute))
+
+    def candidates(self, directory: 'MockDirectory') -> Optional[Set[str]]:
+        if self.operator != '=':
+            return None
+        index = directory.indexes.get(self.attribute.lower())
+        if index is None:
+            return None
+        return index.get(self.value, set())
+
+
+class SubstringFilter(FilterNode):
+    def __init__(self, attribute: str, parts: List[str]):
+        self.attribute = attribute
+        # `parts[0]` is the initial and `parts[-1]` the final part, both may be empty
+        self.parts = [part.lower() for part in parts]
+
+    def _match_value(self, value: str) -> bool:
+        initial, final = self.parts[0], self.parts[-1]
+        if not value.startswith(initial) or not value.endswith(final) or len(value) < len(initial) + len(final):
+            return False
+        position = len(initial)
+        end = len(value) - len(final)
+        for part in self.parts[1:-1]:
+            position = value.find(part, position, end)
+            if position < 0:
+                return False
+            position += len(part)
+        return True
+
+    def match(self, entry: EntryType) -> bool:
+        return any(self._match_value(_normalize(value)) for value in _get_values(entry, self.attribute))
+
+
+def _unescape_filter_value(value: str) -> str:
+    return _FILTER_ESCAPE_RE.sub(lambda match: chr(int(match.group(1), 16)), value)
+
+
+def parse_filter(search_filter: str) -> FilterNode:
+    """Parses an LDAP search filter (AND, OR, NOT, equality, ordering, presence and substring items)."""
+    node, position = _parse_filter(search_filter.strip(), 0)
+    if position != len(search_filter.strip()):
+        raise LDAPInvalidFilterError("Unexpected characters after filter: {}".format(search_filter))
+    return node
+
+
+def _parse_filter(text: str, position: int) -> Tuple[FilterNode, int]:
+    if position >= len(text) or text[position] != '(':
+        raise LDAPInvalidFilterError("Expected ( at {} in {}".format(position, text))
+    position += 1
+    if position >= len(text):
+        raise LDAPInvalidFilterError("Unexpected end of filter {}".format(text))
+    operator = text[position]
+    if operator in '&|':
+        children = []
+        position += 1
+        while position < len(text) and text[position] == '(':
+            child, position = _parse_filter(text, position)
+            children.append(child)
+        node: FilterNode = AndFilter(children) if operator == '&' else OrFilter(children)
+    elif operator == '!':
+        child, position = _parse_filter(text, position + 1)
+        node = NotFilter(child)
+    else:
+        end = text.find(')', position)
+        if end < 0:
+            raise LDAPInvalidFilterError("Missing ) in {}".format(text))
+        node = _parse_item(text[position:end])
+        position = end
+    if position >= len(text) or text[position] != ')':
+        raise LDAPInvalidFilterError("Expected ) at {} in {}".format(position, text))
+    return node, position + 1
+
+
+def _parse_item(item: str) -> FilterNode:
+    equals = item.find('=')
+    if equals <= 0:
+        raise LDAPInvalidFilterError("Invalid filter item {}".format(item))
+    if item[equals - 1] in '<>~':
+        return CompareFilter(item[:equals - 1], item[equals - 1] + '=', _unescape_filter_value(item[equals + 1:]))
+    attribute, value = item[:equals], item[equals + 1:]
+    if value == '*':
+        return PresentFilter(attribute)
+    if '*' in value:
+        return SubstringFilter(attribute, [_unescape_filter_value(part) for part in value.split('*')])
+    return CompareFilter(attribute, '=', _unescape_filter_value(value))
 
 
 class MockResult:
@@ -17,156 +234,422 @@ class MockResult:
         self.entry_attributes_as_dict = attributes
 
 
+class CopyOnWriteAttributes(dict):
+    """
+    Attributes of a search result, sharing the (immutable) values of the directory. A value list is only created
+    when the attribute is accessed, callers may modify it freely.
+    """
+
+    def __init__(self, entry: EntryType, keys: Optional[Sequence[str]]):
+        if keys is None:
+            super().__init__(entry)
+        else:
+            super().__init__((key, _get_values(entry, key)) for key in keys)
+
+    def __getitem__(self, key: str) -> List[ValueType]:
+        value = super().__getitem__(key)
+        if isinstance(value, tuple):
+            value = list(value)
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def copy(self) -> Dict[str, List[ValueType]]:
+        return dict(self.items())
+
+
+class MockDirectory:
+    """
+    In-memory directory shared by all mock connections, indexed by parent DN and by the equality of
+    `INDEXED_ATTRIBUTES`.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, EntryType] = {}
+        self.children: Dict[str, Dict[str, None]] = {}
+        self.indexes: Dict[str, Dict[str, Set[str]]] = {attribute: {} for attribute in INDEXED_ATTRIBUTES}
+        self.lock = threading.RLock()
+
+    def snapshot(self, path: str):
+        """Writes the entries and indexes to a file, such that `restore` loads them without rebuilding the indexes."""
+        with self.lock, open(path, 'wb') as f:
+            pickle.dump(
+                (SNAPSHOT_VERSION, self.entries, self.children, self.indexes), f, protocol=pickle.HIGHEST_PROTOCOL
+            )
+
+    def restore(self, path: str):
+        """Replaces the contents of this directory with a snapshot."""
+        # The collector would repeatedly traverse the millions of objects being loaded
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(path, 'rb') as f:
+                snapshot = pickle.load(f)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        if snapshot[0] != SNAPSHOT_VERSION:
+            raise ValueError("Unsupported snapshot version {} in {}".format(snapshot[0], path))
+        with self.lock:
+            _, self.entries, self.children, self.indexes = snapshot
+
+    def _index(self, dn: str, entry: EntryType, attributes: Iterable[str], update: Callable[[Set[str], str], None]):
+        for attribute in attributes:
+            index = self.indexes.get(attribute.lower())
+            if index is None:
+                continue
+            for value in entry.get(attribute, ()):
+                normalized = _normalize(value)
+                dns = index.get(normalized)
+                if dns is None:
+                    dns = index[normalized] = set()
+                update(dns, dn)
+                if not dns:
+                    del index[normalized]
+
+    def put(self, dn: str, entry: EntryType, changed: Iterable[str] = None):
+        """Stores a new or changed entry (with the changed attributes) and updates the indexes."""
+        old_entry = self.entries.get(dn)
+        if old_entry is None:
+            self.children.setdefault(parent_dn(dn), {})[dn] = None
+            self._index(dn, entry, entry.keys(), set.add)
+        else:
+            changed = list(changed) if changed is not None else list(set(old_entry) | set(entry))
+            self._index(dn, old_entry, changed, set.discard)
+            self._index(dn, entry, changed, set.add)
+        self.entries[dn] = entry
+
+    def remove(self, dn: str):
+        entry = self.entries.pop(dn)
+        siblings = self.children.get(parent_dn(dn))
+        if siblings is not None:
+            siblings.pop(dn, None)
+        self._index(dn, entry, entry.keys(), set.discard)
+
+    def scope(self, search_base: str, search_scope) -> List[str]:
+        if search_scope == ldap3.BASE:
+            return [search_base]
+        if search_scope == ldap3.LEVEL:
+            return list(self.children.get(search_base, ()))
+        result = [search_base] if search_base in self.entries else []
+        pending = [search_base]
+        while pending:
+            children = list(self.children.get(pending.pop(), ()))
+            result.extend(children)
+            pending.extend(children)
+        return result
+
+    def in_scope(self, dn: str, search_base: str, search_scope) -> bool:
+        if search_scope == ldap3.BASE:
+            return dn == search_base
+        if search_scope == ldap3.LEVEL:
+            return parent_dn(dn) == search_base
+        return dn == search_base or dn.endswith(',' + search_base)
+
+    def search(self, search_base: str, search_filter: FilterNode, search_scope) -> List[Tuple[str, EntryType]]:
+        """
+        Gets the matching entries ordered by DN, independent of whether an index was used (thus paging is stable).
+        The entries are taken under the lock, changes replace entries instead of modifying them, thus the result stays
+        consistent while other connections write.
+        """
+        with self.lock:
+            if search_scope == ldap3.BASE and search_base not in self.entries:
+                raise LDAPNoSuchObjectResult(f'Object {search_base} not in data')
+            candidates = search_filter.candidates(self)
+            if candidates is not None and (
+                    search_scope != ldap3.LEVEL or len(candidates) < len(self.children.get(search_base, ()))
+            ):
+                dns: Iterable[str] = (dn for dn in candidates if self.in_scope(dn, search_base, search_scope))
+            else:
+                dns = self.scope(search_base, search_scope)
+            entries = self.entries
+            return sorted(
+                ((dn, entries[dn]) for dn in dns if search_filter.match(entries[dn])), key=lambda found: found[0]
+            )
+
+
+class MockNetwork:
+    """
+    Simulated network between the app and the mock directory: latency of every operation and injected faults.
+    All attributes may be changed at runtime.
+
+    Args:
+        rtt: Round trip time of every operation in seconds.
+        per_entry: Additional time per returned search entry in seconds.
+        jitter: Maximum random additional time of an operation in seconds.
+        timeout_rate: Probability of an operation timing out (after `timeout` seconds).
+        communication_error_rate: Probability of an operation failing with a communication error.
+        busy_rate: Probability of the directory answering busy.
+        operations: Operations which faults are injected into, None for all ('search', 'add', 'modify', 'delete',
+            'bind').
+        timeout: Time until a timed out operation fails in seconds.
+        seed: Seed of the random generator for jitter and faults.
+    """
+
+    def __init__(
+            self, rtt: float = 0.0, per_entry: float = 0.0, jitter: float = 0.0, timeout_rate: float = 0.0,
+            communication_error_rate: float = 0.0, busy_rate: float = 0.0, operations: Sequence[str] = None,
+            timeout: float = 5.0, seed: int = None,
+    ):
+        self.rtt = rtt
+        self.per_entry = per_entry
+        self.jitter = jitter
+        self.timeout_rate = timeout_rate
+        self.communication_error_rate = communication_error_rate
+        self.busy_rate = busy_rate
+        self.operations: Optional[Set[str]] = set(operations) if operations is not None else None
+        self.timeout = timeout
+        self._random = random.Random(seed)
+        self._forced: Deque[Tuple[Optional[str], BaseException]] = collections.deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_config(config: dict, timeout: float) -> 'MockNetwork':
+        return MockNetwork(
+            rtt=config.get('rtt', 0.0),
+            per_entry=config.get('perEntry', 0.0),
+            jitter=config.get('jitter', 0.0),
+            timeout_rate=config.get('timeoutRate', 0.0),
+            communication_error_rate=config.get('communicationErrorRate', 0.0),
+            busy_rate=config.get('busyRate', 0.0),
+            operations=config.get('operations'),
+            timeout=config.get('timeout', timeout),
+            seed=config.get('seed'),
+        )
+
+    def inject(self, error: BaseException, count: int = 1, operation: str = None):
+        """Fails the next `count` operations (of the given type) with `error`, independent of the rates."""
+        with self._lock:
+            for _ in range(count):
+                self._forced.append((operation, error))
+
+    def _forced_fault(self, operation: str) -> Optional[BaseException]:
+        with self._lock:
+            for forced in self._forced:
+                if forced[0] is None or forced[0] == operation:
+                    self._forced.remove(forced)
+                    return forced[1]
+        return None
+
+    def request(self, operation: str):
+        """Called before an operation is executed, raises the injected faults."""
+        error = self._forced_fault(operation) if self._forced else None
+        if error is None and (self.operations is None or operation in self.operations):
+            if self.timeout_rate or self.communication_error_rate or self.busy_rate:
+                sample = self._random.random()
+                if sample < self.timeout_rate:
+                    # Like the receive timeout of a real connection, capped to the request deadline
+                    time.sleep(deadline.cap_timeout(self.timeout))
+                    raise LDAPResponseTimeoutError("Simulated timeout of {}".format(operation))
+                sample -= self.timeout_rate
+                if sample < self.communication_error_rate:
+                    error = LDAPSocketReceiveError("Simulated communication error of {}".format(operation))
+                elif sample - self.communication_error_rate < self.busy_rate:
+                    error = LDAPBusyResult("Simulated busy directory on {}".format(operation))
+        if error is not None:
+            self.respond(0)
+            raise error
+
+    def respond(self, entries: int):
+        """Called after an operation is executed, waits for the simulated latency."""
+        delay = self.rtt + self.per_entry * entries
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
 class MockConnection:
-    def __init__(self, user: str, data: Dict[str, Dict[str, List[ValueType]]], mod_timestamp: datetime = None):
+    def __init__(
+            self, user: str, directory: MockDirectory, mod_timestamp: datetime = None, network: MockNetwork = None
+    ):
         self.user = user
-        self.data = data
+        self.directory = directory
+        self.network = network if network is not None else MockNetwork()
 
         self.mod_timestamp = mod_timestamp
 
         self.entries: List[MockResult] = []
+        self.result: Dict[str, Any] = {}
 
-        self._filter_re = re.compile(r'\(&(\(objectClass=([^)]+)\))+\)')
-        self._email_filter_re = re.compile(r'\(&(\(objectClass=([^)]+)\))+(\(mail=(?P<mail>[^)]+)\))\)')
+    @property
+    def data(self) -> Dict[str, EntryType]:
+        return self.directory.entries
+
+    @property
+    def response(self) -> List[MockResult]:
+        # ldap3.Connection.response
+        return self.entries
+
+    def _timestamp(self) -> Tuple[datetime]:
+        return (datetime.now() if self.mod_timestamp is None else self.mod_timestamp),
 
     def _add_member(self, owner_dn: str, member_dn: str):
-        member = self.data.get(owner_dn)
-        if 'memberOf' in member:
-            member['memberOf'].append(member_dn)
-        else:
-            member['memberOf'] = [member_dn]
+        member = self.directory.entries.get(owner_dn)
+        self.directory.put(
+            owner_dn, {**member, 'memberOf': member.get('memberOf', ()) + (member_dn,)}, ('memberOf',)
+        )
 
     def _remove_member(self, owner_dn: str, member_dn: str):
-        member = self.data.get(owner_dn)
+        member = self.directory.entries.get(owner_dn)
         if 'memberOf' in member:
-            member['memberOf'].remove(member_dn)
-
-    def _copy_keys(self, obj: Dict[str, List[ValueType]], keys: Sequence[str] = None) -> Dict[str, List[ValueType]]:
-        if keys is None:
-            return {
-                key: list(value)
-                for key, value in obj.items()
-            }
-        else:
-            return {
-                key: list(obj[key]) if key in obj else []
-                for key in keys
-            }
+            member_of = list(member['memberOf'])
+            member_of.remove(member_dn)
+            self.directory.put(owner_dn, {**member, 'memberOf': tuple(member_of)}, ('memberOf',))
 
     def add(self, dn, object_class: Union[str, List[str]] = None, attributes: Dict[str, Union[List[ValueType], ValueType]] = None):
         # ldap3.Connection.add()
-        assert dn not in self.data
-        obj = {
-            key: list(attribute)
-            if isinstance(attribute, list) else
-            [attribute]
-            for key, attribute in {'objectClass': object_class, **attributes}.items()
-        }
-        if 'member' in obj:
-            for member_dn in obj['member']:
-                self._add_member(member_dn, dn)
-        if self.mod_timestamp is None:
-            obj['modifyTimestamp'] = [datetime.now()]
-        else:
-            obj['modifyTimestamp'] = [self.mod_timestamp]
-        self.data[dn] = obj
+        self.network.request('add')
+        with self.directory.lock:
+            assert dn not in self.directory.entries
+            obj = {
+                key: tuple(attribute)
+                if isinstance(attribute, (list, tuple)) else
+                (attribute,)
+                for key, attribute in {'objectClass': object_class, **attributes}.items()
+            }
+            if 'member' in obj:
+                for member_dn in obj['member']:
+                    self._add_member(member_dn, dn)
+            obj['modifyTimestamp'] = self._timestamp()
+            self.directory.put(dn, obj)
+        self.network.respond(0)
 
     def search(
-            self, search_base: str, search_filter: str, search_scope=ldap3.SUBTREE, attributes: Sequence[str] = None
-    ):
+            self, search_base: str, search_filter: str, search_scope=ldap3.SUBTREE, attributes: Sequence[str] = None,
+            paged_size: int = None, paged_criticality: bool = False, paged_cookie: bytes = None
+    ) -> bool:
         # ldap3.Connection.search()
-        self.entries = []
-        mail_filter = self._email_filter_re.fullmatch(search_filter)
-        if search_filter == '(objectClass=*)' or self._filter_re.fullmatch(search_filter) or mail_filter:
-            if search_scope == ldap3.BASE:
-                if search_base not in self.data:
-                    raise LDAPNoSuchObjectResult(f'Object {search_base} not in data')
-                self.entries.append(MockResult(search_base, self._copy_keys(self.data[search_base], attributes)))
-            elif search_scope == ldap3.LEVEL:
-                if mail_filter:
-                    mail = mail_filter.group('mail')
-                else:
-                    mail = None
-                for key, data in self.data.items():
-                    if key.endswith("," + search_base) and mail is None or mail in data.get('mail', ()):
-                        self.entries.append(MockResult(key, self._copy_keys(data, attributes)))
-            else:
-                raise NotImplemented()
-        else:
-            raise NotImplemented()
+        if attributes is not None and (attributes == ldap3.ALL_ATTRIBUTES or ldap3.ALL_ATTRIBUTES in attributes):
+            attributes = None
+        self.network.request('search')
+        try:
+            found = self.directory.search(search_base, parse_filter(search_filter), search_scope)
+        except LDAPNoSuchObjectResult:
+            self.network.respond(0)
+            raise
+        controls = {}
+        if paged_size:
+            offset = int(paged_cookie) if paged_cookie else 0
+            next_offset = offset + paged_size
+            controls[PAGED_RESULTS_CONTROL] = {
+                'description': 'Paged Results',
+                'criticality': paged_criticality,
+                'value': {
+                    'size': len(found),
+                    'cookie': str(next_offset).encode() if next_offset < len(found) else b'',
+                },
+            }
+            found = found[offset:next_offset]
+        self.entries = [MockResult(dn, CopyOnWriteAttributes(entry, attributes)) for dn, entry in found]
+        self.result = {'result': 0, 'description': 'success', 'controls': controls}
+        self.network.respond(len(self.entries))
+        return len(self.entries) > 0
 
     def modify(self, dn: str, changes: LdapModlist):
         # ldap3.Connection.modify()
-        entry = self.data[dn]
-        for key, item_changes in changes.items():
-            data = entry.get(key)
-            for (change, value) in item_changes:
-                if change == LdapMods.ADD:
-                    if data is None:
-                        data = list(value)
-                        entry[key] = data
-                    else:
-                        data.extend(value)
-                    if key == 'member':
-                        for member_dn in value:
-                            self._add_member(member_dn, dn)
-                elif change == LdapMods.DELETE:
-                    if data is not None:
-                        if not value:
-                            if key == 'member':
-                                for member_dn in entry[key]:
-                                    self._remove_member(member_dn, dn)
-                            del entry[key]
-                        else:
-                            if key == 'member':
-                                for member_dn in value:
-                                    self._remove_member(member_dn, dn)
-                            for val in value:
-                                entry[key].remove(val)
-                            if len(entry[key]) == 0:
+        self.network.request('modify')
+        with self.directory.lock:
+            entry = dict(self.directory.entries[dn])
+            for key, item_changes in changes.items():
+                for (change, value) in item_changes:
+                    data = entry.get(key)
+                    if change == LdapMods.ADD:
+                        entry[key] = tuple(value) if data is None else data + tuple(value)
+                        if key == 'member':
+                            for member_dn in value:
+                                self._add_member(member_dn, dn)
+                    elif change == LdapMods.DELETE:
+                        if data is not None:
+                            if not value:
+                                if key == 'member':
+                                    for member_dn in data:
+                                        self._remove_member(member_dn, dn)
                                 del entry[key]
-                elif change == LdapMods.REPLACE:
-                    if key == 'member':
-                        for member_dn in entry[key]:
-                            self._remove_member(member_dn, dn)
-                    data = list(value)
-                    entry[key] = data
-                    if key == 'member':
-                        for member_dn in value:
-                            self._add_member(member_dn, dn)
-                elif change == LdapMods.INCREMENT:
-                    if data is None:
-                        data = [0]
-                        entry[key] = data
-                    else:
-                        data[0] += 1
-        if self.mod_timestamp is None:
-            entry['modifyTimestamp'] = [datetime.now()]
-        else:
-            entry['modifyTimestamp'] = [self.mod_timestamp]
+                            else:
+                                if key == 'member':
+                                    for member_dn in value:
+                                        self._remove_member(member_dn, dn)
+                                remaining = list(data)
+                                for val in value:
+                                    remaining.remove(val)
+                                if remaining:
+                                    entry[key] = tuple(remaining)
+                                else:
+                                    del entry[key]
+                    elif change == LdapMods.REPLACE:
+                        if key == 'member':
+                            for member_dn in data or ():
+                                self._remove_member(member_dn, dn)
+                        entry[key] = tuple(value)
+                        if key == 'member':
+                            for member_dn in value:
+                                self._add_member(member_dn, dn)
+                    elif change == LdapMods.INCREMENT:
+                        if data is None:
+                            entry[key] = (0,)
+                        else:
+                            entry[key] = (data[0] + 1,) + data[1:]
+            entry['modifyTimestamp'] = self._timestamp()
+            self.directory.put(dn, entry, list(changes.keys()) + ['modifyTimestamp'])
+        self.network.respond(0)
 
     def delete(self, dn: str):
         # ldap3.Connection.delete()
-        if 'member' in self.data[dn]:
-            for member_dn in self.data[dn]['member']:
-                self._remove_member(member_dn, dn)
-        del self.data[dn]
+        self.network.request('delete')
+        with self.directory.lock:
+            if 'member' in self.directory.entries[dn]:
+                for member_dn in self.directory.entries[dn]['member']:
+                    self._remove_member(member_dn, dn)
+            self.directory.remove(dn)
+        self.network.respond(0)
 
 
 class MockDatabaseFactory:
-    def __init__(self, config: dict, mod_timestamp: datetime = None):
-        self.data: Dict[str, Dict[str, List[ValueType]]] = {}
+    """
+    Database factory on an in-memory directory. The simulated network (latency and faults) is configured by
+    `network` or the `mock` section of the ldap config.
+    """
+
+    def __init__(self, config: dict, mod_timestamp: datetime = None, network: MockNetwork = None):
+        self.directory = MockDirectory()
+        self.network = network if network is not None else MockNetwork.from_config(
+            config.get('mock', {}), float(config['timeout'])
+        )
 
         self.prefix: str = config['prefix']
         self._timeout: int = int(config['timeout'])
 
-        self._connection = MockConnection(
-            user=config['bindDn'],
-            data=self.data,
-            mod_timestamp=mod_timestamp,
-        )
+        self._bind_dn: str = config['bindDn']
+        self._mod_timestamp = mod_timestamp
+        self._local = threading.local()
+        self.observers: List[DatabaseObserver] = []
+        self.single_flight = SingleFlight(config.get('singleFlight', False))
+
+    @property
+    def data(self) -> Dict[str, EntryType]:
+        return self.directory.entries
 
     def connect(self, user: str, password: str) -> MockConnection:
+        return observe_operation(self.observers, 'bind', self._bind, (user, password), {})
+
+    def authenticate(self, user: str, password: str):
+        deadline.check()
+        observe_operation(self.observers, 'bind', self._bind, (user, password), {})
+
+    def _bind(self, user: str, password: str) -> MockConnection:
+        self.network.request('bind')
+        self.network.respond(0)
         user_data = self.data.get(user)
         if user_data is None:
             raise LDAPInvalidCredentialsResult()
@@ -177,9 +660,22 @@ class MockDatabaseFactory:
             raise LDAPInvalidCredentialsResult()
         return MockConnection(
             user=user,
-            data=self.data,
+            directory=self.directory,
+            network=self.network,
         )
 
     @property
     def connection(self) -> MockConnection:
-        return self._connection
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = ObservedConnection(MockConnection(
+                user=self._bind_dn,
+                directory=self.directory,
+                mod_timestamp=self._mod_timestamp,
+                network=self.network,
+            ), self.observers)
+            self._local.connection = connection
+        return connection
+
+    def release(self):
+        self._local.connection = None
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""
+Fills the mock directory with a synthetic, deterministic directory derived from the views in `config.yaml`.
+
+Group sizes follow a Zipf distribution (a few huge groups, many small ones). The result can be written to a snapshot
+file, which `MockDirectory.restore` (and `TEST_USER_DATABASE_SNAPSHOT` of the server) loads in milliseconds.
+
+Usage: python -m db_mock_generator --count users=100000 --count groups=500 --count teams=50 --seed 1 out.snapshot
+"""
+import argparse
+import random
+import string
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+import ldap3
+import passlib.hash
+
+from db_mock import MockDatabaseFactory, MockDirectory, EntryType, ValueType
+
+GIVEN_NAMES = (
+    'Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hannah', 'Jonas', 'Julia', 'Lena', 'Lukas', 'Marie',
+    'Max', 'Mia', 'Noah', 'Paul', 'Sophie', 'Tim', 'Zoe',
+)
+SURNAMES = (
+    'Bauer', 'Becker', 'Fischer', 'Hoffmann', 'Koch', 'Meyer', 'Müller', 'Richter', 'Schäfer', 'Schmidt',
+    'Schneider', 'Schulz', 'Wagner', 'Weber', 'Wolf',
+)
+
+
+class _GenerateFormatter(string.Formatter):
+    def get_value(self, key, args, kwargs):
+        return kwargs.get(key, '')
+
+
+def _fields(view_config: dict) -> Iterator[Tuple[str, dict]]:
+    """Gets all fields (key, config) of the `fields` details of a view."""
+    for detail in view_config.get('details', {}).values():
+        if detail['type'] == 'fields':
+            yield from detail['fields'].items()
+    yield from view_config.get('list', {}).items()
+
+
+def _text_value(rng: random.Random, attribute: str, field_config: dict) -> ValueType:
+    if 'enum' in field_config:
+        return rng.choice(field_config['enum'])['value']
+    lower = attribute.lower()
+    if lower == 'givenname':
+        return rng.choice(GIVEN_NAMES)
+    if lower == 'sn':
+        return rng.choice(SURNAMES)
+    if lower in ('mobile', 'telephonenumber'):
+        return '+49 151 {:07d}'.format(rng.randrange(10 ** 7))
+    if lower == 'employeenumber':
+        return '{:08x}'.format(rng.getrandbits(32))
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(8))
+
+
+class DirectoryGenerator:
+    """
+    Generates the entries of all views with a count. Text fields get plausible values, generated fields are
+    formatted from them and the `member` details referencing the user view get Zipf distributed members.
+
+    Args:
+        config: The full config (`ldap`, `views` and `auth` sections are used).
+        counts: Number of entries per view key (e.g. `{'users': 100000, 'groups': 500, 'teams': 50}`).
+        seed: Seed of the random generator, the same seed generates the same directory.
+        zipf_exponent: Exponent of the group size distribution, the group of rank k has `largest / k^exponent` members.
+        largest_group: Fraction of the users in the largest group.
+        permission_group_size: Number of members of the groups referenced by `isMemberOf` fields (e.g. admin).
+        password: Password set for all users (hashed once), None for no passwords.
+        mod_timestamp: The modification timestamp of all entries.
+    """
+
+    def __init__(
+            self, config: dict, counts: Dict[str, int], seed: int = 0, zipf_exponent: float = 1.1,
+            largest_group: float = 0.5, permission_group_size: int = 10, password: Optional[str] = None,
+            mod_timestamp: datetime = datetime(2019, 1, 1),
+    ):
+        self.prefix: str = config['ldap']['prefix']
+        self.views: Dict[str, dict] = config['views']
+        self.user_view: str = config['auth']['view']
+        self.counts = counts
+        self.rng = random.Random(seed)
+        self.zipf_exponent = zipf_exponent
+        self.largest_group = largest_group
+        self.permission_group_size = permission_group_size
+        self.password_hash = passlib.hash.ldap_salted_sha1.hash(password) if password is not None else None
+        self.mod_timestamp = mod_timestamp
+
+    def _view_dn(self, view_key: str) -> str:
+        return self.views[view_key]['dn'] + ',' + self.prefix
+
+    def _dn(self, view_key: str, primary_key: str) -> str:
+        view = self.views[view_key]
+        return view['primaryKey'] + '=' + ldap3.utils.dn.escape_rdn(primary_key) + ',' + self._view_dn(view_key)
+
+    def _permission_groups(self) -> Dict[str, List[str]]:
+        """Gets the names of the groups referenced by `isMemberOf` fields, per referenced view."""
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for field_key, field_config in _fields(self.views[self.user_view]):
+            if field_config.get('type') == 'isMemberOf' and field_config['memberOf'] not in groups[
+                field_config['foreignView']
+            ]:
+                groups[field_config['foreignView']].append(field_config['memberOf'])
+        return groups
+
+    def _entry(self, view_key: str, primary_key: str) -> EntryType:
+        view = self.views[view_key]
+        values: Dict[str, ValueType] = {view['primaryKey']: primary_key}
+        generated = []
+        for field_key, field_config in _fields(view):
+            attribute = field_config.get('field', field_key)
+            if attribute in values:
+                continue
+            field_type = field_config.get('type')
+            if field_type == 'text':
+                if attribute.lower() == 'mail':
+                    values[attribute] = '{}@example.com'.format(primary_key)
+                else:
+                    values[attribute] = _text_value(self.rng, attribute, field_config)
+            elif field_type == 'generate':
+                generated.append((attribute, field_config['format']))
+        format_values = dict(values)
+        for field_key, field_config in _fields(view):
+            attribute = field_config.get('field', field_key)
+            if attribute in values:
+                format_values[field_key] = values[attribute]
+        for attribute, field_format in generated:
+            values[attribute] = _GenerateFormatter().format(field_format, **format_values)
+
+        entry: EntryType = {key: (value,) for key, value in values.items()}
+        object_classes = tuple(view['objectClass'])
+        if view_key == self.user_view and self.password_hash is not None:
+            entry['userPassword'] = (self.password_hash,)
+            if 'simpleSecurityObject' not in object_classes:
+                object_classes += ('simpleSecurityObject',)
+        entry['objectClass'] = object_classes
+        entry['modifyTimestamp'] = (self.mod_timestamp,)
+        return entry
+
+    def _group_sizes(self, count: int, users: int) -> List[int]:
+        largest = max(1, int(users * self.largest_group))
+        sizes = [max(1, int(largest / (rank ** self.zipf_exponent))) for rank in range(1, count + 1)]
+        self.rng.shuffle(sizes)
+        return [min(size, users) for size in sizes]
+
+    def generate(self, directory: MockDirectory):
+        with directory.lock:
+            for view_key, view in self.views.items():
+                if 'autoCreate' in view and self._view_dn(view_key) not in directory.entries:
+                    directory.put(self._view_dn(view_key), {
+                        key: tuple(value) if isinstance(value, list) else (value,)
+                        for key, value in {**view['autoCreate'], 'modifyTimestamp': self.mod_timestamp}.items()
+                    })
+
+            user_dns = []
+            for index in range(self.counts.get(self.user_view, 0)):
+                primary_key = '{}{}'.format(self.user_view.rstrip('s'), index)
+                dn = self._dn(self.user_view, primary_key)
+                directory.put(dn, self._entry(self.user_view, primary_key))
+                user_dns.append(dn)
+
+            member_of: Dict[str, List[str]] = defaultdict(list)
+            permission_groups = self._permission_groups()
+            for view_key, view in self.views.items():
+                if view_key == self.user_view:
+                    continue
+                names = list(permission_groups.get(view_key, ()))
+                count = self.counts.get(view_key, 0)
+                names.extend('{}{}'.format(view_key.rstrip('s'), index) for index in range(count))
+                if not names:
+                    continue
+                member_field = None
+                for detail in view.get('details', {}).values():
+                    if detail['type'] == 'member' and detail['foreignView'] == self.user_view:
+                        member_field = detail.get('field', 'member')
+                sizes = [self.permission_group_size] * len(permission_groups.get(view_key, ())) + \
+                    self._group_sizes(count, len(user_dns))
+                for name, size in zip(names, sizes):
+                    dn = self._dn(view_key, name)
+                    entry = self._entry(view_key, name)
+                    if member_field is not None and user_dns:
+                        members = self.rng.sample(user_dns, min(size, len(user_dns)))
+                        entry[member_field] = tuple(members)
+                        for member_dn in members:
+                            member_of[member_dn].append(dn)
+                    directory.put(dn, entry)
+
+            for member_dn, group_dns in member_of.items():
+                directory.put(
+                    member_dn, {**directory.entries[member_dn], 'memberOf': tuple(group_dns)}, ('memberOf',)
+                )
+
+
+def generate_directory(db_factory: MockDatabaseFactory, config: dict, counts: Dict[str, int], **kwargs: Any):
+    """Fills the directory of the mock database factory, see `DirectoryGenerator` for the arguments."""
+    DirectoryGenerator(config, counts, **kwargs).generate(db_factory.directory)
+
+
+def main():
+    from config import config
+
+    def parse_count(value: str) -> Tuple[str, int]:
+        view_key, count = value.split('=', 1)
+        return view_key, int(count)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help="Snapshot file to write")
+    parser.add_argument(
+        '--count', type=parse_count, action='append', default=[], metavar='VIEW=N', help="Entries of a view"
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--zipf-exponent', type=float, default=1.1)
+    parser.add_argument('--largest-group', type=float, default=0.5, help="Fraction of the users in the largest group")
+    parser.add_argument('--password', help="Password of all users")
+    args = parser.parse_args()
+
+    db_factory = MockDatabaseFactory(config['ldap'])
+    start = time.perf_counter()
+    generate_directory(
+        db_factory, config, dict(args.count), seed=args.seed, zipf_exponent=args.zipf_exponent,
+        largest_group=args.largest_group, password=args.password,
+    )
+    generated = time.perf_counter()
+    db_factory.directory.snapshot(args.output)
+    print("Generated {} entries in {:.2f}s, wrote snapshot in {:.2f}s".format(
+        len(db_factory.data), generated - start, time.perf_counter() - generated
+    ))
+
+
+if __name__ == '__main__':
+    main()
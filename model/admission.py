@@ -0,0 +1,250 @@
+import asyncio
+import collections
+import threading
+import time
+from typing import Dict, Deque, Optional, Callable, List, Tuple, Any
+
+import falcon
+
+from model import deadline
+
+# Methods answered from the directory without writing, other methods are in the class 'write'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Overloaded(falcon.HTTPServiceUnavailable):
+    """503 Service Unavailable, raised when a request does not get a slot of its class in time."""
+
+    def __init__(self, route_class: str):
+        super().__init__(
+            description="Too many concurrent {} requests, try again later".format(route_class), retry_after=1
+        )
+
+
+class AdaptiveLimit:
+    """
+    Limit of concurrent requests, adjusted by the observed latency (additive increase, multiplicative decrease): it
+    grows by one per `limit` requests answered within `latencyTolerance` times the lowest recent latency while the
+    limit is in use, and shrinks by `backoff` (at most once per latency) otherwise.
+    """
+
+    def __init__(self, config: dict):
+        self.min_limit: int = config.get('minLimit', 1)
+        self.max_limit: int = config.get('maxLimit', 64)
+        self.limit: float = float(config.get('limit', self.min_limit))
+        self.tolerance: float = config.get('latencyTolerance', 2.0)
+        self.backoff: float = config.get('backoff', 0.9)
+        # The lowest latency is taken over windows of this many samples, such that it follows lasting changes
+        self.window: int = config.get('window', 100)
+        self._min_latency = float('inf')
+        self._window_min = float('inf')
+        self._samples = 0
+        self._last_decrease = 0.0
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def update(self, latency: float, in_flight: int):
+        """Called with the latency of every answered request and the requests in flight when it was answered."""
+        self._window_min = min(self._window_min, latency)
+        self._samples += 1
+        if self._samples >= self.window:
+            self._min_latency = self._window_min
+            self._window_min = float('inf')
+            self._samples = 0
+        self._min_latency = min(self._min_latency, latency)
+
+        now = time.monotonic()
+        if latency > self._min_latency * self.tolerance:
+            if now - self._last_decrease >= latency:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif in_flight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.admitted = False
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def grant(self):
+        # Granted by the thread releasing a slot
+        self._loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout: Optional[float]) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class ClassLimiter:
+    """
+    Admits up to the adaptive limit of concurrent requests of a route class. Further requests wait in a queue per
+    user, the queues are served in turn, thus a user with many queued requests does not delay the others.
+    """
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.limit = AdaptiveLimit(config)
+        self.max_queue: int = config.get('maxQueue', 100)
+        self.in_flight = 0
+        self.queued = 0
+        # User -> waiting requests, in turn order
+        self._queues: 'collections.OrderedDict[str, Deque[Any]]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, user: str, waiter_factory: Optional[Callable[[], Any]]) -> Optional[Any]:
+        """
+        Takes a slot if one is free (and nobody waits) and returns None, else returns a queued waiter.
+
+        Raises:
+            Overloaded: If the queue is full, or no slot is free and `waiter_factory` is None (must not wait).
+        """
+        with self._lock:
+            if not self.queued and self.in_flight < self.limit.current:
+                self.in_flight += 1
+                return None
+            if waiter_factory is None or self.queued >= self.max_queue:
+                raise Overloaded(self.name)
+            waiter = waiter_factory()
+            self._queues.setdefault(user, collections.deque()).append(waiter)
+            self.queued += 1
+            return waiter
+
+    def cancel(self, user: str, waiter: Any) -> bool:
+        """Removes a waiter, which timed out. Returns False if it was admitted meanwhile, then it holds a slot."""
+        with self._lock:
+            if waiter.admitted:
+                return False
+            queue = self._queues[user]
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self._queues[user]
+            return True
+
+    def release(self, latency: float):
+        with self._lock:
+            self.limit.update(latency, self.in_flight)
+            self.in_flight -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        # Called with the lock held
+        while self.queued and self.in_flight < self.limit.current:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self.in_flight += 1
+            waiter.admitted = True
+            waiter.grant()
+
+
+class AdmissionMiddleware:
+    """
+    Limits the concurrent requests per route class, see `ClassLimiter`. The class of a request is given by the
+    `admission` attribute of the resource (method -> class, e.g. `{'GET': 'list'}`), else it is 'read' or 'write' by
+    the method. Classes without config are not limited.
+
+    Requests of the ASGI app wait at most `queueTimeout` seconds (and within their deadline) for a slot. Requests of the
+    WSGI app are rejected at once instead, a waiting request would hold one of the few worker threads, such that a
+    saturated class would starve the other classes.
+
+    Must run after the auth middleware: requests are queued by the authenticated user, else by `client_key`.
+    """
+
+    def __init__(self, config: dict, client_key: Callable[[falcon.Request], str]):
+        self.queue_timeout: float = config.get('queueTimeout', 5)
+        self.limiters: Dict[str, ClassLimiter] = {
+            name: ClassLimiter(name, class_config)
+            for name, class_config in config.get('classes', {}).items()
+        }
+        self.client_key = client_key
+        # Called with the route class and the reason ('queue' or 'timeout') of every rejected request
+        self.reject_observers: List[Callable[[str, str], None]] = []
+
+    def route_class(self, req: falcon.Request, resource) -> str:
+        route_class = getattr(resource, 'admission', {}).get(req.method)
+        if route_class is not None:
+            return route_class
+        return 'read' if req.method in READ_METHODS else 'write'
+
+    def _user(self, req: falcon.Request) -> str:
+        user = req.context.get('user')
+        if user is not None and 'primaryKey' in user:
+            return 'user:' + user['primaryKey']
+        return 'client:' + self.client_key(req)
+
+    def _acquire(
+            self, req: falcon.Request, resource, waiter_factory: Optional[Callable[[], Any]]
+    ) -> Optional[Tuple[ClassLimiter, str, Any]]:
+        """Returns the limiter, the user and the waiter (None if admitted) of the request, None if not limited."""
+        limiter = self.limiters.get(self.route_class(req, resource))
+        if limiter is None:
+            return None
+        user = self._user(req)
+        try:
+            waiter = limiter.try_acquire(user, waiter_factory)
+        except Overloaded:
+            self._reject(limiter, 'queue')
+            raise
+        return limiter, user, waiter
+
+    def _wait_timeout(self) -> float:
+        remaining = deadline.remaining()
+        return self.queue_timeout if remaining is None else max(0.0, min(self.queue_timeout, remaining))
+
+    def _timed_out(self, req: falcon.Request, limiter: ClassLimiter, user: str, waiter: Any):
+        if not limiter.cancel(user, waiter):
+            # Admitted while timing out
+            self._admitted(req, limiter)
+            return
+        self._reject(limiter, 'timeout')
+        deadline.check()
+        raise Overloaded(limiter.name)
+
+    def _reject(self, limiter: ClassLimiter, reason: str):
+        for observer in self.reject_observers:
+            observer(limiter.name, reason)
+
+    @staticmethod
+    def _admitted(req: falcon.Request, limiter: ClassLimiter):
+        req.context['admission'] = (limiter, time.monotonic())
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params):
+        acquired = self._acquire(req, resource, None)
+        if acquired is not None:
+            self._admitted(req, acquired[0])
+
+    def process_response(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        admission = req.context.get('admission')
+        if admission is not None:
+            limiter, start = admission
+            del req.context['admission']
+            limiter.release(time.monotonic() - start)
+
+    async def process_resource_async(self, req: falcon.Request, resp: falcon.Response, resource, params):
+        acquired = self._acquire(req, resource, _AsyncWaiter)
+        if acquired is None:
+            return
+        limiter, user, waiter = acquired
+        if waiter is not None and not await waiter.wait(self._wait_timeout()):
+            self._timed_out(req, limiter, user, waiter)
+            return
+        self._admitted(req, limiter)
+
+    async def process_response_async(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
@@ -1,14 +1,18 @@
 import logging
 from datetime import timedelta, datetime
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Optional
 
 import falcon
 from falcon_auth import FalconAuthMiddleware, JWTAuthBackend
 from ldap3.core.exceptions import LDAPCommunicationError, LDAPInvalidCredentialsResult
 
 from model.anti_spam import AntiSpam
+from model.cache import Cache, user_tag
 from model.db import DatabaseFactory, FalconLdapError
+from model.http_helper import SerializedMedia
 from model.mailer import Mailer
+from model.revocation import RevocationList, RevocationPoller, SharedRevocationMarks, changed_references
+from model.throttle import Throttle
 from model.view import View
 
 
@@ -16,6 +20,9 @@ class JwtAuthApi:
     auth = {
         'auth_disabled': True
     }
+    admission = {
+        'POST': 'login'
+    }
 
     def __init__(self, auth: 'Auth'):
         self.authenticator = auth
@@ -23,6 +30,7 @@ class JwtAuthApi:
     def on_post(self, req: falcon.Request, resp: falcon.Response):
         content = req.media
 
+        self.authenticator.throttle.check_login(req, content['username'])
         resp.media = self.authenticator.login(content['username'], content['password'])
         resp.status = falcon.HTTP_200
 
@@ -31,6 +39,10 @@ class JwtAuthApi:
 
 
 class JwtRefreshApi:
+    admission = {
+        'POST': 'login'
+    }
+
     def __init__(self, auth: 'Auth'):
         self.authenticator = auth
 
@@ -39,14 +51,9 @@ class JwtRefreshApi:
         if user is None:
             raise falcon.HTTPForbidden()
 
-        userdata, token = self.authenticator.create_token(user)
-
         resp.status = falcon.HTTP_200
-        resp.media = {
-            'token': token,
-            'user': userdata.to_dict()
-        }
-        logging.info("Refreshed", userdata)
+        resp.media = self.authenticator.create_token(user)
+        logging.info("Refreshed %s", user.get('primaryKey'))
 
     def register(self, app: falcon.API):
         app.add_route('/jwt-refresh', self)
@@ -72,6 +79,9 @@ class RegisterUserApi:
     auth = {
         'auth_disabled': True
     }
+    admission = {
+        'POST': 'login'
+    }
 
     def __init__(self, anti_spam: AntiSpam, view: View):
         self.anti_spam = anti_spam
@@ -85,7 +95,7 @@ class RegisterUserApi:
 
         self.view.create_register(user)
 
-        logging.info("Registered with comment", user['signupComment'])
+        logging.info("Registered with comment %s", user['signupComment'])
 
         resp.status = falcon.HTTP_200
 
@@ -100,10 +110,11 @@ class RegisterConfigApi:
 
     def __init__(self, view: View):
         self.config = view.public_config
+        self.response = SerializedMedia(self.config)
 
     def on_get(self, req: falcon.Request, resp: falcon.Response):
-        resp.media = self.config
-        resp.status = falcon.HTTP_200
+        resp.cache_control = ['no-cache']
+        self.response.write(req, resp)
 
     def register(self, app: falcon.API):
         app.add_route('/register-config', self)
@@ -113,6 +124,9 @@ class MailLoginApi:
     auth = {
         'auth_disabled': True
     }
+    admission = {
+        'POST': 'login'
+    }
 
     def __init__(self, auth: 'Auth', mailer: Mailer):
         self.authenticator = auth
@@ -120,6 +134,19 @@ class MailLoginApi:
 
     def on_post(self, req: falcon.Request, resp: falcon.Response):
         search_email = req.media['email']
+        throttle = self.authenticator.throttle
+        throttle.check_mail_login(req, search_email)
+        resp.status = falcon.HTTP_200
+        if not throttle.claim_mail(search_email):
+            # The same mail was just sent
+            return
+        try:
+            self.send_login_mail(search_email)
+        except BaseException:
+            throttle.release_mail(search_email)
+            raise
+
+    def send_login_mail(self, search_email: str):
         user_id = self.authenticator.view.resolve_primary_key_by_mail(search_email)
         token_data, user_data = self.authenticator.auto_login(user_id)
 
@@ -134,22 +161,25 @@ class MailLoginApi:
             'valid_until': valid_until,
         })
 
-        resp.status = falcon.HTTP_200
-
     def register(self, app: falcon.API):
         app.add_route('/mail-login', self)
 
 
 class Auth:
-    def __init__(self, all_views: Dict[str, View], db_factory: DatabaseFactory, config: dict):
+    def __init__(
+            self, all_views: Dict[str, View], db_factory: DatabaseFactory, config: dict, cache: Optional[Cache] = None
+    ):
         self.secret_key = config['secretKey']
         self.header_prefix = config['headerPrefix']
         self.expiration = config['expiration']
         self.auto_login_expiration = config['autoLoginExpiration']
         self.view = all_views[config['view']]
         self.db_factory = db_factory
+        # Caches the auth entries of users (unless tokens are stateless)
+        self.cache = cache
 
         self.anti_spam = AntiSpam(config['antiSpam'])
+        self.throttle = Throttle(config['throttle'] if 'throttle' in config else {})
 
         self.auth_backend = JWTAuthBackend(
             self.user_loader,
@@ -165,16 +195,75 @@ class Auth:
             expiration_delta=self.auto_login_expiration
         )
 
+        # With stateless tokens, the claims of a token are trusted (without loading the user) unless the user changed
+        stateless_config = config['statelessTokens'] if 'statelessTokens' in config else {}
+        self.revocations: Optional[RevocationList] = None
+        self.revocation_poller: Optional[RevocationPoller] = None
+        if stateless_config.get('enabled', False):
+            shared_marks = None
+            if stateless_config.get('revocationPath'):
+                shared_marks = SharedRevocationMarks(
+                    stateless_config['revocationPath'], stateless_config.get('revocationSlots', 65536)
+                )
+            else:
+                logging.warning("auth.statelessTokens.revocationPath is not set, revocations reach this process only")
+            self.revocations = RevocationList(
+                max(self.expiration, self.auto_login_expiration), stateless_config.get('maxEntries', 10000),
+                shared_marks,
+            )
+            # Tokens issued before this process started are checked once per user
+            self.revocations.revoke_all()
+            if stateless_config.get('pollInterval', 5) > 0:
+                # Started by the first request, i.e. in the worker process
+                self.revocation_poller = RevocationPoller(
+                    self.view, self.revocations, stateless_config.get('pollInterval', 5),
+                    group_views=self.view.get_auth_group_views(),
+                    reverify_interval=stateless_config.get('reverifyInterval', 300),
+                )
+        if self.revocations is not None or self.cache is not None:
+            for view in all_views.values():
+                view.write_observers.append(self._entry_written)
+
         self.auth_middleware = FalconAuthMiddleware(
             self.auth_backend,
             exempt_routes=['/jwt-auth'],
             exempt_methods=['HEAD', 'OPTIONS']
         )
 
+    def _entry_written(self, dn: str, changes: Any):
+        """Marks (and invalidates the cached entries of) the users written or referenced (e.g. added to a group)."""
+        primary_keys = [self.view.try_get_primary_key(dn)]
+        if changes is not None:
+            primary_keys.extend(
+                self.view.try_get_primary_key(value) for value in changed_references(changes) if isinstance(value, str)
+            )
+        for primary_key in primary_keys:
+            if primary_key is None:
+                continue
+            if self.revocations is not None:
+                self.revocations.revoke(primary_key)
+            if self.cache is not None:
+                self.cache.invalidate(user_tag(primary_key))
+
+    def _load_auth_entry(self, primary_key: str) -> Dict[str, Any]:
+        if self.cache is None:
+            return self.view.get_auth_entry(primary_key)
+        return self.cache.get_or_load(
+            'auth:' + primary_key, user_tag(primary_key), lambda: self.view.get_auth_entry(primary_key), stale=False
+        )
+
     def user_loader(self, jwt_payload):
         primary_key = jwt_payload['user']['primaryKey']
         assert isinstance(primary_key, str)
-        auth_entry = self.view.get_auth_entry(primary_key)
+        if self.revocation_poller is not None:
+            self.revocation_poller.ensure_running()
+        if self.revocations is None:
+            auth_entry = self._load_auth_entry(primary_key)
+        else:
+            auth_entry, mark = self.revocations.lookup(primary_key, jwt_payload['iat'], jwt_payload['user'])
+            if auth_entry is None:
+                auth_entry = self.view.get_auth_entry(primary_key)
+                self.revocations.verified(primary_key, mark, auth_entry)
         if 'timestamp' in auth_entry:
             if auth_entry['timestamp'] != jwt_payload['user']['timestamp']:
                 raise falcon.HTTPUnauthorized()
@@ -199,7 +288,7 @@ class Auth:
                 raise ValueError("primary_key must not be None")
             if password is None:
                 raise ValueError("password must not be None")
-            self.db_factory.connect(user=self.view.get_dn(primary_key), password=password)
+            self.db_factory.authenticate(user=self.view.get_dn(primary_key), password=password)
         except LDAPInvalidCredentialsResult:
             raise falcon.HTTPUnauthorized()
         except LDAPCommunicationError as e:
@@ -0,0 +1,136 @@
+import logging
+import falcon
+import falcon.asgi
+
+from model.anti_spam import AntiSpam
+from model.auth import (
+    Auth, JwtAuthApi, JwtRefreshApi, AuthUserApi, RegisterUserApi, RegisterConfigApi, MailLoginApi
+)
+from model.db_async import AsyncDatabaseBridge
+from model.mailer import Mailer
+from model.view import View
+
+
+class AsyncJwtAuthApi(JwtAuthApi):
+    def __init__(self, auth: Auth, bridge: AsyncDatabaseBridge):
+        super().__init__(auth)
+        self.bridge = bridge
+
+    async def on_post(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        content = await req.get_media()
+
+        self.authenticator.throttle.check_login(req, content['username'])
+        resp.media = await self.bridge.run(self.authenticator.login, content['username'], content['password'])
+        resp.status = falcon.HTTP_200
+
+
+class AsyncJwtRefreshApi(JwtRefreshApi):
+    async def on_post(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        resp.status = falcon.HTTP_200
+        resp.media = self.authenticator.create_token(user)
+        logging.info("Refreshed %s", user.get('primaryKey'))
+
+
+class AsyncAuthUserApi(AuthUserApi):
+    """Gets the currently authenticated user"""
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        resp.status = falcon.HTTP_200
+        resp.media = user
+
+
+class AsyncRegisterUserApi(RegisterUserApi):
+    """Register a new user."""
+
+    def __init__(self, anti_spam: AntiSpam, view: View, bridge: AsyncDatabaseBridge):
+        super().__init__(anti_spam, view)
+        self.bridge = bridge
+
+    async def on_post(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        """Create a new user."""
+        user = await req.get_media()
+
+        self.anti_spam.verify_answer(user, 'antiSpamToken', 'antiSpamAnswer')
+
+        await self.bridge.run(self.view.create_register, user)
+
+        logging.info("Registered with comment %s", user['signupComment'])
+
+        resp.status = falcon.HTTP_200
+
+
+class AsyncRegisterConfigApi(RegisterConfigApi):
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        resp.cache_control = ['no-cache']
+        self.response.write(req, resp)
+
+
+class AsyncAntiSpamApi:
+    auth = {
+        'auth_disabled': True
+    }
+
+    def __init__(self, anti_spam: AntiSpam):
+        self.anti_spam = anti_spam
+
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        self.anti_spam.on_get(req, resp)
+
+    def register(self, app: falcon.asgi.App):
+        app.add_route('/anti-spam', self)
+
+
+class AsyncMailLoginApi(MailLoginApi):
+    def __init__(self, auth: Auth, mailer: Mailer, bridge: AsyncDatabaseBridge):
+        super().__init__(auth, mailer)
+        self.bridge = bridge
+
+    async def on_post(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        search_email = (await req.get_media())['email']
+        throttle = self.authenticator.throttle
+        throttle.check_mail_login(req, search_email)
+        resp.status = falcon.HTTP_200
+        if not throttle.claim_mail(search_email):
+            # The same mail was just sent
+            return
+        try:
+            await self.bridge.run(self.send_login_mail, search_email)
+        except BaseException:
+            throttle.release_mail(search_email)
+            raise
+
+
+class AsyncAuthMiddleware:
+    """Runs the (blocking) authentication middleware of `Auth` on the bridge, as loading the user hits the directory."""
+
+    def __init__(self, auth: Auth, bridge: AsyncDatabaseBridge):
+        self.middleware = auth.auth_middleware
+        self.bridge = bridge
+
+    async def process_resource(self, req: falcon.asgi.Request, resp: falcon.asgi.Response, resource, params):
+        await self.bridge.run(self.middleware.process_resource, req, resp, resource, params)
+
+
+class AsyncAuth:
+    """Async resources for an existing `Auth`, which keeps owning the token backends and configuration."""
+
+    def __init__(self, auth: Auth, bridge: AsyncDatabaseBridge):
+        self.auth = auth
+        self.bridge = bridge
+        self.auth_middleware = AsyncAuthMiddleware(auth, bridge)
+
+    def register(self, app: falcon.asgi.App, mailer: Mailer):
+        AsyncJwtAuthApi(self.auth, self.bridge).register(app)
+        AsyncJwtRefreshApi(self.auth).register(app)
+        AsyncAuthUserApi().register(app)
+        AsyncRegisterUserApi(self.auth.anti_spam, self.auth.view, self.bridge).register(app)
+        AsyncAntiSpamApi(self.auth.anti_spam).register(app)
+        AsyncRegisterConfigApi(self.auth.view).register(app)
+        AsyncMailLoginApi(self.auth, mailer, self.bridge).register(app)
@@ -0,0 +1,413 @@
+import collections
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Optional, Callable, Tuple, List, TypeVar
+
+T = TypeVar('T')
+
+# Tag of all cached lists, invalidated by every write
+LISTS_TAG = 'lists'
+
+
+def user_tag(primary_key: str) -> str:
+    """Tag of the values depending on the entry of the user (e.g. the auth entry)."""
+    return 'user:' + primary_key
+
+
+class CacheBackend(ABC):
+    """Stores values by key for up to `ttl` seconds. Values may be dropped at any time."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    def close(self):
+        pass
+
+
+class LruCacheBackend(CacheBackend):
+    """In-process cache of up to `max_entries` values, the least recently used value is dropped first."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        # Key -> (expiry time, value)
+        self._entries: 'collections.OrderedDict[str, Tuple[float, Any]]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedFile:
+    """
+    A file mapped into memory, shared by all processes using the same path, with a header of `magic` and `layout`. The
+    file is (re)created if the header does not match. Opened on first use in every process, as `flock` locks of a file
+    descriptor inherited by a forked process would be shared with the parent.
+    """
+
+    HEADER = 32
+
+    def __init__(self, path: str, magic: bytes, layout: Tuple[int, ...], size: int):
+        self.path = path
+        self._header = magic.ljust(8, b'\0') + struct.pack('<' + 'Q' * len(layout), *layout)
+        assert len(self._header) <= self.HEADER
+        self.size = self.HEADER + size
+        self._opened: Optional[Tuple[int, int, mmap.mmap]] = None
+        self._open_lock = threading.Lock()
+        # Serializes the threads of this process, `flock` serializes the processes
+        self.lock = threading.RLock()
+
+    def _open(self) -> Tuple[int, mmap.mmap]:
+        with self._open_lock:
+            if self._opened is None or self._opened[0] != os.getpid():
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(fd).st_size != self.size or os.pread(fd, len(self._header), 0) != self._header:
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, self.size)
+                        os.pwrite(fd, self._header, 0)
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                self._opened = (os.getpid(), fd, mmap.mmap(fd, self.size))
+            return self._opened[1], self._opened[2]
+
+    @property
+    def map(self) -> mmap.mmap:
+        return self._open()[1]
+
+    def locked(self, exclusive: bool) -> '_FileLock':
+        return _FileLock(self, exclusive)
+
+    def close(self):
+        with self._open_lock:
+            if self._opened is not None and self._opened[0] == os.getpid():
+                self._opened[2].close()
+                os.close(self._opened[1])
+            self._opened = None
+
+
+class _FileLock:
+    def __init__(self, file: SharedFile, exclusive: bool):
+        self.file = file
+        self.exclusive = exclusive
+
+    def __enter__(self) -> mmap.mmap:
+        self.file.lock.acquire()
+        fd, shared_map = self.file._open()
+        fcntl.flock(fd, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        self._fd = fd
+        return shared_map
+
+    def __exit__(self, *args):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self.file.lock.release()
+
+
+class MmapCacheBackend(CacheBackend):
+    """
+    Cache in a memory-mapped file shared by the workers of a host (e.g. in /dev/shm). The file has `slots` slots of
+    `slot_size` bytes, every key maps to one slot (a colliding key replaces the value). Values are pickled, larger
+    values than `slot_size` are not stored.
+    """
+
+    # Key digest, expiry time (wall clock, shared between processes), value length
+    SLOT_HEADER = struct.Struct('<16sdI4x')
+
+    def __init__(self, path: str, slots: int = 1024, slot_size: int = 64 * 1024):
+        self.slots = slots
+        self.slot_size = slot_size
+        self._stride = self.SLOT_HEADER.size + slot_size
+        self._file = SharedFile(path, b'LACACHE1', (slots, slot_size), slots * self._stride)
+
+    def _slot(self, key: str) -> Tuple[bytes, int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        index = int.from_bytes(digest[:8], 'little') % self.slots
+        return digest, SharedFile.HEADER + index * self._stride
+
+    def get(self, key: str) -> Optional[Any]:
+        digest, offset = self._slot(key)
+        with self._file.locked(exclusive=False) as shared_map:
+            stored_digest, expires, length = self.SLOT_HEADER.unpack_from(shared_map, offset)
+            if stored_digest != digest or expires < time.time():
+                return None
+            start = offset + self.SLOT_HEADER.size
+            data = shared_map[start:start + length]
+        return pickle.loads(data)
+
+    def set(self, key: str, value: Any, ttl: float):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.slot_size:
+            return
+        digest, offset = self._slot(key)
+        with self._file.locked(exclusive=True) as shared_map:
+            start = offset + self.SLOT_HEADER.size
+            shared_map[start:start + len(data)] = data
+            self.SLOT_HEADER.pack_into(shared_map, offset, digest, time.time() + ttl, len(data))
+
+    def delete(self, key: str):
+        digest, offset = self._slot(key)
+        with self._file.locked(exclusive=True) as shared_map:
+            if self.SLOT_HEADER.unpack_from(shared_map, offset)[0] == digest:
+                self.SLOT_HEADER.pack_into(shared_map, offset, bytes(16), 0, 0)
+
+    def clear(self):
+        with self._file.locked(exclusive=True) as shared_map:
+            for index in range(self.slots):
+                self.SLOT_HEADER.pack_into(shared_map, SharedFile.HEADER + index * self._stride, bytes(16), 0, 0)
+
+    def close(self):
+        self._file.close()
+
+
+class SqliteCacheBackend(CacheBackend):
+    """Cache in a local SQLite file shared by the workers of a host. Values are pickled, expired values are pruned."""
+
+    PRUNE_INTERVAL = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._connection.execute(
+            'SELECT value FROM cache WHERE key = ? AND expires >= ?', (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Any, ttl: float):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        connection = self._connection
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', (key, data, time.time() + ttl)
+        )
+        self._sets += 1
+        if self._sets % self.PRUNE_INTERVAL == 0:
+            connection.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+
+    def delete(self, key: str):
+        self._connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+        self._local.connection = None
+
+
+class Generations(ABC):
+    """
+    Invalidation channel: a generation counter per tag, cached values are valid while the generation of their tag is
+    unchanged. Tags are hashed to a fixed number of counters, colliding tags invalidate each other.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+
+    def _index(self, tag: str) -> int:
+        return zlib.crc32(tag.encode()) % self.slots
+
+    @abstractmethod
+    def get(self, tag: str) -> int:
+        ...
+
+    @abstractmethod
+    def bump(self, tag: str):
+        ...
+
+    def close(self):
+        pass
+
+
+class LocalGenerations(Generations):
+    """Generations of one process."""
+
+    def __init__(self, slots: int = 4096):
+        super().__init__(slots)
+        self._counters = [0] * slots
+        self._lock = threading.Lock()
+
+    def get(self, tag: str) -> int:
+        return self._counters[self._index(tag)]
+
+    def bump(self, tag: str):
+        index = self._index(tag)
+        with self._lock:
+            self._counters[index] += 1
+
+
+class SharedGenerations(Generations):
+    """Generations in a memory-mapped file, such that invalidations reach all workers of a host."""
+
+    COUNTER = struct.Struct('<Q')
+
+    def __init__(self, path: str, slots: int = 4096):
+        super().__init__(slots)
+        self._file = SharedFile(path, b'LAGENS1', (slots,), slots * self.COUNTER.size)
+
+    def get(self, tag: str) -> int:
+        # Aligned 8 byte reads do not tear, no lock needed
+        return self.COUNTER.unpack_from(self._file.map, SharedFile.HEADER + self._index(tag) * self.COUNTER.size)[0]
+
+    def bump(self, tag: str):
+        offset = SharedFile.HEADER + self._index(tag) * self.COUNTER.size
+        with self._file.locked(exclusive=True) as shared_map:
+            self.COUNTER.pack_into(shared_map, offset, self.COUNTER.unpack_from(shared_map, offset)[0] + 1)
+
+    def close(self):
+        self._file.close()
+
+
+class Cache:
+    """
+    Caches values in the configured `backend` ('lru', 'mmap' or 'sqlite') for `ttl` seconds, invalidated by tag through
+    the `invalidation` channel ('local' or 'mmap', the latter reaching all workers of the host).
+
+    A value is stored with the generation of its tag read before loading it, thus a value loaded concurrently to an
+    invalidation is not used afterwards.
+
+    Values are kept for further `staleTtl` seconds: if loading fails with one of `stale_errors` (e.g. the directory is
+    unavailable), the stale value is used instead, even if invalidated. Values deciding about access (e.g. auth entries)
+    are loaded with `stale=False` and fail closed instead.
+    """
+
+    def __init__(self, config: dict):
+        self.ttl: float = config.get('ttl', 30)
+        self.stale_ttl: float = config.get('staleTtl', 0)
+        self.stale_errors: Tuple[type, ...] = ()
+        backend = config.get('backend', 'lru')
+        if backend == 'lru':
+            self.backend: CacheBackend = LruCacheBackend(config.get('maxEntries', 10000))
+        elif backend == 'mmap':
+            self.backend = MmapCacheBackend(
+                config['path'], config.get('slots', 1024), config.get('slotSize', 64 * 1024)
+            )
+        elif backend == 'sqlite':
+            self.backend = SqliteCacheBackend(config['path'])
+        else:
+            raise ValueError("Invalid cache backend {}".format(backend))
+
+        invalidation = config.get('invalidation', 'mmap' if backend != 'lru' else 'local')
+        if invalidation == 'local':
+            self.generations: Generations = LocalGenerations()
+        elif invalidation == 'mmap':
+            self.generations = SharedGenerations(config.get('invalidationPath') or config['path'] + '.gen')
+        else:
+            raise ValueError("Invalid cache invalidation {}".format(invalidation))
+
+        # Called with the name of the cache (the key up to the first ':') and whether the lookup was a hit
+        self.lookup_observers: List[Callable[[str, bool], None]] = []
+        # Called with the key and the age (seconds past the ttl) of every used stale value
+        self.stale_observers: List[Callable[[str, float], None]] = []
+
+    def _observe(self, key: str, hit: bool):
+        name = key.split(':', 1)[0]
+        for observer in self.lookup_observers:
+            observer(name, hit)
+
+    def get_or_load(
+            self, key: str, tag: str, load: Callable[[], T], ttl: Optional[float] = None, stale: bool = True
+    ) -> T:
+        generation = self.generations.get(tag)
+        cached = self.backend.get(key)
+        now = time.time()
+        # (generation, fresh until (wall clock), value)
+        if cached is not None and cached[0] == generation and cached[1] >= now:
+            self._observe(key, True)
+            return cached[2]
+        self._observe(key, False)
+        try:
+            value = load()
+        except self.stale_errors:
+            if cached is None or not stale:
+                raise
+            for observer in self.stale_observers:
+                observer(key, max(0.0, now - cached[1]))
+            return cached[2]
+        ttl = self.ttl if ttl is None else ttl
+        self.backend.set(key, (generation, now + ttl, value), ttl + self.stale_ttl if stale else ttl)
+        return value
+
+    def write_back(self, key: str, value: Any, replaces: Callable[[Any], bool]):
+        """
+        Stores a cached value again after data was derived from it (e.g. compressed bodies), such that the other workers
+        get the derived data as well. Keeps the generation and the expiry of the entry, and stores nothing unless the
+        entry is still fresh and holds a value for which `replaces` is true (i.e. it was not reloaded meanwhile).
+        """
+        cached = self.backend.get(key)
+        now = time.time()
+        if cached is None or cached[1] < now or not replaces(cached[2]):
+            return
+        self.backend.set(key, (cached[0], cached[1], value), cached[1] - now + self.stale_ttl)
+
+    def invalidate(self, tag: str):
+        self.generations.bump(tag)
+
+    def close(self):
+        self.backend.close()
+        self.generations.close()
@@ -0,0 +1,130 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+from typing import Optional, List, Callable
+
+import falcon
+from ldap3.core.exceptions import (
+    LDAPCommunicationError, LDAPResponseTimeoutError, LDAPBusyResult, LDAPUnavailableResult,
+    LDAPServerPoolExhaustedError,
+)
+
+from model.db import DatabaseObserver
+from model.deadline import DeadlineExceeded
+
+# Errors indicating that the directory is down or overloaded (unlike e.g. invalid credentials or missing entries)
+OUTAGE_ERRORS = (
+    LDAPCommunicationError, LDAPResponseTimeoutError, LDAPBusyResult, LDAPUnavailableResult,
+    LDAPServerPoolExhaustedError,
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class DirectoryUnavailable(falcon.HTTPServiceUnavailable):
+    """503 Service Unavailable, raised instead of directory operations while the circuit is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            description="The directory is unavailable, try again later", retry_after=max(1, math.ceil(retry_after))
+        )
+
+
+class CircuitBreaker(DatabaseObserver):
+    """
+    Opens after `failureThreshold` consecutive failed (or slower than `slowCallDuration`) directory operations: then,
+    operations fail with `DirectoryUnavailable` without waiting for the directory. After `openSeconds`, one operation
+    is let through as probe: it closes the circuit on success and opens it again on failure.
+    """
+
+    def __init__(self, config: dict):
+        self.failure_threshold: int = config.get('failureThreshold', 5)
+        self.open_seconds: float = config.get('openSeconds', 10)
+        self.slow_call_duration: float = config.get('slowCallDuration', 0)
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # Start of the running probe (0: none), a probe not finishing within `open_seconds` is replaced
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        # Called with the new state on every transition
+        self.state_observers: List[Callable[[str], None]] = []
+
+    def _transition(self, state: str):
+        # Called with the lock held
+        if state == self.state:
+            return
+        self.state = state
+        logging.warning("Directory circuit breaker %s", state)
+        for observer in self.state_observers:
+            observer(state)
+
+    def before(self, operation: str):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - now
+                if remaining > 0:
+                    raise DirectoryUnavailable(remaining)
+                self._transition(HALF_OPEN)
+            if self._probe_started and now - self._probe_started < self.open_seconds:
+                raise DirectoryUnavailable(self._probe_started + self.open_seconds - now)
+            self._probe_started = now
+
+    def after(self, operation: str, duration: float, entries: int, error: Optional[BaseException]):
+        if isinstance(error, DeadlineExceeded):
+            # Cut short by the request, neither a failure nor a success of the directory
+            return
+        failed = isinstance(error, OUTAGE_ERRORS) or (
+            0 < self.slow_call_duration < duration
+        )
+        with self._lock:
+            if failed:
+                self._failures += 1
+                if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+                    self._probe_started = 0.0
+                    self._transition(OPEN)
+            else:
+                self._failures = 0
+                if self.state != CLOSED:
+                    self._probe_started = 0.0
+                    self._transition(CLOSED)
+
+
+# Ages of the stale values used by the current request
+_stale_ages: 'contextvars.ContextVar[Optional[List[float]]]' = contextvars.ContextVar('stale_ages', default=None)
+
+
+def mark_stale(key: str, age: float):
+    """Records that the current request uses a stale cached value (e.g. while the directory is unavailable)."""
+    ages = _stale_ages.get()
+    if ages is not None:
+        ages.append(age)
+
+
+class StaleResponseMiddleware:
+    """Marks responses built from stale cached values with `X-Stale` (age of the oldest value in seconds)."""
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response):
+        req.context['stale_ages_token'] = _stale_ages.set([])
+
+    def process_response(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        ages = _stale_ages.get()
+        token = req.context.get('stale_ages_token')
+        if token is not None:
+            _stale_ages.reset(token)
+        if ages:
+            resp.set_header('X-Stale', str(int(max(ages))))
+
+    async def process_request_async(self, req: falcon.Request, resp: falcon.Response):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
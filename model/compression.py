@@ -0,0 +1,217 @@
+import inspect
+import logging
+import zlib
+from typing import Dict, List, Optional, Any, Iterator, AsyncIterator, Tuple, Callable
+
+import falcon
+
+# Streamed bodies are read in chunks of this size
+STREAM_CHUNK = 64 * 1024
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        # wbits 16 + 15: gzip container with the maximum window
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level: int):
+        import brotli
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Content coding -> compressor class and default level
+ENCODINGS: Dict[str, Tuple[Callable[[int], Any], int]] = {
+    'zstd': (ZstdCompressor, 3),
+    'br': (BrotliCompressor, 4),
+    'gzip': (GzipCompressor, 6),
+}
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parses an `Accept-Encoding` header to the quality of every listed coding."""
+    qualities: Dict[str, float] = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least `minSize` bytes with the best of `encodings` (in order of preference)
+    accepted by the client. Encodings whose library is not installed (`zstandard` for zstd, `brotli` for br) are
+    skipped. Streamed bodies are compressed while streaming.
+
+    Responses can provide a dictionary in `resp.context['compression_cache']` (e.g. by `SerializedMedia`), where the
+    compressed bodies are kept by content type and encoding, such that cached responses are compressed only once. A
+    callable in `resp.context['compression_cache_written']` is called after a body was added to it.
+    """
+
+    def __init__(self, config: dict):
+        self.min_size: int = config.get('minSize', 1024)
+        self.types: List[str] = config.get('types', ['application/json', 'application/msgpack', 'application/cbor'])
+        levels = config.get('levels', {})
+        self.encodings: Dict[str, Callable[[], Any]] = {}
+        for encoding in config.get('encodings', ['zstd', 'br', 'gzip']):
+            if encoding not in ENCODINGS:
+                raise ValueError("Unsupported encoding {}".format(encoding))
+            compressor, default_level = ENCODINGS[encoding]
+            level = levels.get(encoding, default_level)
+            try:
+                compressor(level)
+            except ImportError as e:
+                logging.warning("Encoding %s is not available: %s", encoding, e)
+                continue
+            self.encodings[encoding] = lambda compressor=compressor, level=level: compressor(level)
+
+    def negotiate(self, req: falcon.Request) -> Optional[str]:
+        header = req.get_header('Accept-Encoding')
+        if not header:
+            return None
+        qualities = parse_accept_encoding(header)
+        wildcard = qualities.get('*', 0.0)
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = qualities.get(encoding, wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def _is_compressible(self, resp: falcon.Response) -> bool:
+        if resp.status_code in (204, 206, 304) or resp.get_header('Content-Encoding') is not None:
+            return False
+        content_type = resp.content_type or ''
+        return any(content_type.startswith(prefix) for prefix in self.types)
+
+    def compress(self, encoding: str, data: bytes) -> bytes:
+        compressor = self.encodings[encoding]()
+        return compressor.compress(data) + compressor.flush()
+
+    def _compress_body(self, resp: falcon.Response, encoding: str, data: bytes):
+        cache: Optional[Dict[Tuple[str, str], bytes]] = resp.context.get('compression_cache')
+        if cache is None:
+            resp.data = self.compress(encoding, data)
+        else:
+            key = (resp.content_type, encoding)
+            compressed = cache.get(key)
+            if compressed is None:
+                compressed = cache[key] = self.compress(encoding, data)
+                written = resp.context.get('compression_cache_written')
+                if written is not None:
+                    written()
+            resp.data = compressed
+        resp.text = None
+        resp.media = None
+        self._set_encoding(resp, encoding)
+
+    @staticmethod
+    def _set_encoding(resp: falcon.Response, encoding: str):
+        resp.set_header('Content-Encoding', encoding)
+        # The compressed body differs, but the representation is the same
+        etag = resp.get_header('ETag')
+        if etag is not None and not etag.startswith('W/'):
+            resp.set_header('ETag', 'W/' + etag)
+
+    def _stream(self, encoding: str, stream: Any) -> Iterator[bytes]:
+        compressor = self.encodings[encoding]()
+        try:
+            chunks = iter(lambda: stream.read(STREAM_CHUNK), b'') if hasattr(stream, 'read') else stream
+            for chunk in chunks:
+                compressed = compressor.compress(chunk)
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+
+    async def _stream_async(self, encoding: str, stream: Any) -> AsyncIterator[bytes]:
+        compressor = self.encodings[encoding]()
+        try:
+            if hasattr(stream, 'read'):
+                chunk = await stream.read(STREAM_CHUNK)
+                while chunk:
+                    compressed = compressor.compress(chunk)
+                    if compressed:
+                        yield compressed
+                    chunk = await stream.read(STREAM_CHUNK)
+            else:
+                async for chunk in stream:
+                    compressed = compressor.compress(chunk)
+                    if compressed:
+                        yield compressed
+            yield compressor.flush()
+        finally:
+            if hasattr(stream, 'close'):
+                closed = stream.close()
+                if inspect.isawaitable(closed):
+                    await closed
+
+    def _prepare(self, req: falcon.Request, resp: falcon.Response) -> Optional[str]:
+        if not self.encodings or not self._is_compressible(resp):
+            return None
+        resp.append_header('Vary', 'Accept-Encoding')
+        return self.negotiate(req)
+
+    def process_response(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        encoding = self._prepare(req, resp)
+        if encoding is None:
+            return
+        if resp.stream is not None:
+            resp.stream = self._stream(encoding, resp.stream)
+            resp.content_length = None
+            self._set_encoding(resp, encoding)
+            return
+        data = resp.render_body()
+        if data is not None and len(data) >= self.min_size:
+            self._compress_body(resp, encoding, data)
+
+    async def process_response_async(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        encoding = self._prepare(req, resp)
+        if encoding is None:
+            return
+        if resp.stream is not None:
+            resp.stream = self._stream_async(encoding, resp.stream)
+            resp.content_length = None
+            self._set_encoding(resp, encoding)
+            return
+        data = await resp.render_body()
+        if data is not None and len(data) >= self.min_size:
+            self._compress_body(resp, encoding, data)
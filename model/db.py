@@ -1,10 +1,18 @@
+import functools
 import logging
+import ssl
+import threading
+import time
 from types import GeneratorType
-from typing import List, Tuple, NewType, Dict, Union, Set
+from typing import List, Tuple, NewType, Dict, Union, Set, Optional, Any, Callable
 
 import falcon
 import ldap3
-from ldap3.core.exceptions import LDAPExceptionError
+from ldap3.core.exceptions import LDAPExceptionError, LDAPCommunicationError, LDAPResponseTimeoutError
+
+from model import deadline
+from model.db_bind import BindPool, ReusingTls
+from model.single_flight import SingleFlight
 
 LdapValue = Union[int, float, bytes, bytearray, str]
 
@@ -23,6 +31,9 @@ class LdapMods:
 LdapModlist = NewType('LdapModlist', Dict[str, List[Tuple[LdapMod, LdapValueList]]])
 LdapAddlist = NewType('LdapAddlist', Dict[str, LdapValueList])
 
+# Operations changing the directory
+WRITE_OPERATIONS = ('add', 'modify', 'delete')
+
 
 class LdapFetch:
     def __init__(self, dn: str, values: Dict[str, List[str]]):
@@ -47,27 +58,166 @@ class FalconLdapError(falcon.HTTPBadRequest):
         logging.exception(str(original_error))
 
 
+class DatabaseObserver:
+    """Gets notified about every directory operation."""
+
+    def before(self, operation: str):
+        """
+        Called before an operation is started.
+
+        Args:
+            operation: One of 'search', 'add', 'modify', 'delete', 'bind'.
+        """
+        pass
+
+    def after(self, operation: str, duration: float, entries: int, error: Optional[BaseException]):
+        """
+        Called after an operation finished.
+
+        Args:
+            operation: One of 'search', 'add', 'modify', 'delete', 'bind'.
+            duration: Duration of the operation in seconds.
+            entries: Number of returned entries (for searches).
+            error: The raised error, if the operation failed.
+        """
+        pass
+
+
+def observe_operation(
+        observers: List[DatabaseObserver], operation: str, fn: Callable[..., Any], args: tuple, kwargs: dict,
+        count_entries: Callable[[], int] = None,
+) -> Any:
+    """Runs `fn(*args, **kwargs)` as the given directory operation, notifying all observers."""
+    for observer in observers:
+        observer.before(operation)
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except BaseException as e:
+        duration = time.perf_counter() - start
+        for observer in observers:
+            observer.after(operation, duration, 0, e)
+        raise
+    duration = time.perf_counter() - start
+    entries = count_entries() if count_entries is not None else 0
+    for observer in observers:
+        observer.after(operation, duration, entries, None)
+    return result
+
+
+class ObservedConnection:
+    """
+    Proxy of a connection, which reports the operations to the observers of the factory. Within a request deadline (see
+    `model.deadline`), operations are only started in time and wait for the directory at most the remaining time. The
+    first write lifts the deadline, such that a write of several operations is not aborted halfway.
+    """
+
+    def __init__(self, connection: ldap3.Connection, observers: List[DatabaseObserver]):
+        self._connection = connection
+        self._observers = observers
+
+    def _count_entries(self) -> int:
+        return len(self._connection.response or ())
+
+    def _within_deadline(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        # The socket timeout applies to every receive, set it to the remaining time for this operation only
+        sock = getattr(self._connection, 'socket', None)
+        receive_timeout = getattr(self._connection, 'receive_timeout', None)
+        if sock is not None:
+            sock.settimeout(max(0.001, deadline.cap_timeout(receive_timeout)))
+        try:
+            return fn(*args, **kwargs)
+        except (LDAPCommunicationError, LDAPResponseTimeoutError) as e:
+            if deadline.expired():
+                raise deadline.DeadlineExceeded() from e
+            raise
+        finally:
+            if sock is not None and not self._connection.closed:
+                sock.settimeout(receive_timeout)
+
+    def _observe(self, operation: str, fn: Callable[..., Any], args: tuple, kwargs: dict, count_entries=None) -> Any:
+        if deadline.remaining() is not None:
+            deadline.check()
+            if operation in WRITE_OPERATIONS:
+                deadline.lift()
+            else:
+                fn = functools.partial(self._within_deadline, fn)
+        return observe_operation(self._observers, operation, fn, args, kwargs, count_entries)
+
+    def search(self, *args, **kwargs):
+        return self._observe('search', self._connection.search, args, kwargs, self._count_entries)
+
+    def add(self, *args, **kwargs):
+        return self._observe('add', self._connection.add, args, kwargs)
+
+    def modify(self, *args, **kwargs):
+        return self._observe('modify', self._connection.modify, args, kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._observe('delete', self._connection.delete, args, kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._connection, name)
+
+
 class DatabaseFactory:
     def __init__(self, config: dict, **overrides):
         config.update(overrides)
 
-        self._server = ldap3.Server(config['serverUri'])
-        self.prefix: str = config['prefix']
         self._timeout: int = int(config['timeout'])
+        self._start_tls: bool = config.get('startTls', False)
+        tls = ReusingTls(
+            validate=ssl.CERT_REQUIRED if config.get('tlsValidate', False) else ssl.CERT_NONE,
+            ca_certs_file=config.get('caCertsFile'),
+        )
+        self._server = ldap3.Server(config['serverUri'], connect_timeout=self._timeout, tls=tls)
+        self.prefix: str = config['prefix']
+        self._bind_dn: str = config['bindDn']
+        self._bind_password: str = config['bindPassword']
+        self.observers: List[DatabaseObserver] = []
+        self.single_flight = SingleFlight(config.get('singleFlight', False))
+        self._bind_pool = BindPool(
+            self._server, config.get('bindPool', {}), self._timeout, self._start_tls, self.observers
+        )
 
-        self._connection = self.connect(config['bindDn'], config['bindPassword'])
+        # A SYNC connection keeps the last result in its state, so every thread gets its own connection.
+        self._local = threading.local()
+        # Bind once on startup, such that configuration errors are reported early
+        self._local.connection = ObservedConnection(self.connect(self._bind_dn, self._bind_password), self.observers)
 
     def connect(self, user: str, password: str) -> ldap3.Connection:
-        return ldap3.Connection(
+        return observe_operation(self.observers, 'bind', ldap3.Connection, (), dict(
             server=self._server,
             user=user,
             password=password,
-            auto_bind=True,
+            auto_bind=ldap3.AUTO_BIND_TLS_BEFORE_BIND if self._start_tls else ldap3.AUTO_BIND_NO_TLS,
             receive_timeout=self._timeout,
             raise_exceptions=True,
             client_strategy=ldap3.SYNC,
-        )
+        ))
+
+    def authenticate(self, user: str, password: str):
+        """Checks the password of the user on a pooled connection, raises `LDAPInvalidCredentialsResult` if wrong."""
+        deadline.check()
+        self._bind_pool.authenticate(user, password)
 
     @property
     def connection(self) -> ldap3.Connection:
-        return self._connection
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or connection.closed:
+            # Reconnect after the connection was lost (e.g. the directory restarted)
+            connection = ObservedConnection(self.connect(self._bind_dn, self._bind_password), self.observers)
+            self._local.connection = connection
+        return connection
+
+    def release(self):
+        """Unbinds the connection of the current thread, if any. The next access binds a new connection."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.connection = None
+            connection.unbind()
+
+    def close(self):
+        """Unbinds the connection of the current thread and the idle login connections."""
+        self.release()
+        self._bind_pool.close()
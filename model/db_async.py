@@ -0,0 +1,35 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar, Any
+
+T = TypeVar('T')
+
+
+class AsyncDatabaseBridge:
+    """
+    Runs blocking directory (and mail) calls on a thread pool, such that the event loop stays free.
+
+    Each pool thread gets its own bound connection from the database factory, thus the number of threads is also the
+    number of directory connections held open by the process.
+    """
+
+    def __init__(self, config: dict):
+        self.max_workers: int = int(config.get('threadPoolSize', 32))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ldap')
+        # Calls submitted and not yet finished, more than `max_workers` are queued
+        self.in_flight = 0
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_event_loop()
+        # Keep the request context (e.g. the tracked directory operations) within the pool thread
+        context = contextvars.copy_context()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(context.run, fn, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
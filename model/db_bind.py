@@ -0,0 +1,174 @@
+import collections
+import ssl
+import threading
+import time
+from typing import Deque, Tuple, List, Optional
+
+import falcon
+import ldap3
+from ldap3.core.exceptions import LDAPInvalidCredentialsResult, LDAPCommunicationError, LDAPBindError
+from ldap3.core.tls import check_hostname
+
+import model.db
+
+
+class ReusingTls(ldap3.Tls):
+    """
+    TLS settings which keep one SSL context and resume the last TLS session on new connections, such that only the
+    first connection does a full handshake.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._context: Optional[ssl.SSLContext] = None
+        self._context_lock = threading.Lock()
+        self.session: Optional[ssl.SSLSession] = None
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        with self._context_lock:
+            if self._context is None:
+                context = ssl.create_default_context(
+                    purpose=ssl.Purpose.SERVER_AUTH, cafile=self.ca_certs_file, capath=self.ca_certs_path,
+                    cadata=self.ca_certs_data,
+                )
+                if self.certificate_file:
+                    context.load_cert_chain(
+                        self.certificate_file, keyfile=self.private_key_file, password=self.private_key_password
+                    )
+                context.check_hostname = False
+                context.verify_mode = self.validate
+                for option in self.ssl_options:
+                    context.options |= option
+                if self.ciphers:
+                    context.set_ciphers(self.ciphers)
+                self._context = context
+            return self._context
+
+    def wrap_socket(self, connection: ldap3.Connection, do_handshake: bool = False):
+        wrapped_socket = self._ssl_context().wrap_socket(
+            connection.socket, server_side=False, do_handshake_on_connect=do_handshake, server_hostname=self.sni,
+            session=self.session,
+        )
+        if do_handshake and self.validate in (ssl.CERT_REQUIRED, ssl.CERT_OPTIONAL):
+            check_hostname(wrapped_socket, connection.server.host, self.valid_names)
+        connection.socket = wrapped_socket
+
+    def remember_session(self, connection: ldap3.Connection):
+        """Keeps the TLS session of the connection for resumption (TLS 1.3 only issues it after the handshake)."""
+        session = getattr(connection.socket, 'session', None)
+        if session is not None:
+            self.session = session
+
+
+class BindPool:
+    """
+    Pool of connections only used for checking passwords: each login rebinds an idle connection as the user, such that
+    logins do not pay a TCP (and TLS) handshake. Connections failing with a communication error, idle for longer than
+    `idleTimeout` or exceeding the pool size are unbound. The number of concurrent binds is capped, logins wait up to
+    `acquireTimeout` seconds for a slot and are rejected with 503 afterwards.
+    """
+
+    def __init__(self, server: ldap3.Server, config: dict, timeout: float, start_tls: bool, observers: list):
+        self._server = server
+        self.size: int = config.get('size', 4)
+        self.max_concurrent: int = config.get('maxConcurrent', 8)
+        self.acquire_timeout: float = config.get('acquireTimeout', 5)
+        self.idle_timeout: float = config.get('idleTimeout', 60)
+        self._timeout = timeout
+        self._start_tls = start_tls
+        self._observers = observers
+
+        self._idle: Deque[Tuple[ldap3.Connection, float]] = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+
+    def _open(self) -> ldap3.Connection:
+        connection = ldap3.Connection(
+            self._server,
+            auto_bind=ldap3.AUTO_BIND_NONE,
+            receive_timeout=self._timeout,
+            raise_exceptions=True,
+            client_strategy=ldap3.SYNC,
+        )
+        connection.open(read_server_info=False)
+        if self._start_tls:
+            connection.start_tls(read_server_info=False)
+        return connection
+
+    def _acquire(self) -> Tuple[ldap3.Connection, bool]:
+        """Gets an idle connection (and True) or opens a new one (and False)."""
+        now = time.monotonic()
+        stale: List[ldap3.Connection] = []
+        connection = None
+        with self._lock:
+            while self._idle:
+                candidate, idle_since = self._idle.pop()
+                if now - idle_since <= self.idle_timeout:
+                    connection = candidate
+                    break
+                stale.append(candidate)
+        for stale_connection in stale:
+            self._close(stale_connection)
+        if connection is not None:
+            return connection, True
+        return self._open(), False
+
+    def _release(self, connection: ldap3.Connection):
+        if isinstance(self._server.tls, ReusingTls) and (self._server.ssl or self._start_tls):
+            self._server.tls.remember_session(connection)
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        self._close(connection)
+
+    @staticmethod
+    def _close(connection: ldap3.Connection):
+        try:
+            connection.unbind()
+        except (LDAPCommunicationError, LDAPBindError, OSError):
+            pass
+
+    def _bind(self, connection: ldap3.Connection, user: str, password: str):
+        connection.rebind(user=user, password=password, read_server_info=False)
+
+    def authenticate(self, user: str, password: str):
+        """
+        Checks the password of the user.
+
+        Raises:
+            LDAPInvalidCredentialsResult: If the password is wrong.
+            falcon.HTTPServiceUnavailable: If all bind slots stay busy for `acquireTimeout`.
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise falcon.HTTPServiceUnavailable(description="Too many concurrent logins", retry_after=1)
+        try:
+            connection, reused = self._acquire()
+            while True:
+                try:
+                    model.db.observe_operation(self._observers, 'bind', self._bind, (connection, user, password), {})
+                except LDAPInvalidCredentialsResult:
+                    self._release(connection)
+                    raise
+                except (LDAPCommunicationError, LDAPBindError):
+                    self._close(connection)
+                    if not reused:
+                        raise
+                    # The server may have closed the idle connection, retry once on a new one
+                    connection, reused = self._open(), False
+                    continue
+                except BaseException:
+                    self._close(connection)
+                    raise
+                self._release(connection)
+                return
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Unbinds all idle connections."""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _ in idle:
+            self._close(connection)
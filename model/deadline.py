@@ -0,0 +1,96 @@
+import contextvars
+import time
+from typing import Optional
+
+import falcon
+
+# Monotonic time the current request has to be answered by
+_deadline: 'contextvars.ContextVar[Optional[float]]' = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(falcon.HTTPGatewayTimeout):
+    """504 Gateway Timeout, raised when the time budget of the request runs out before or during a backend call."""
+
+    def __init__(self):
+        super().__init__(description="The request ran out of time")
+
+
+def remaining() -> Optional[float]:
+    """Gets the remaining time of the current request in seconds, None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check():
+    """Raises `DeadlineExceeded` if the time of the current request ran out."""
+    if expired():
+        raise DeadlineExceeded()
+
+
+def cap_timeout(timeout: Optional[float]) -> Optional[float]:
+    """
+    Caps the timeout of a backend call to the remaining time of the current request.
+
+    Raises:
+        DeadlineExceeded: If the time already ran out.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left if timeout is None else min(timeout, left)
+
+
+def lift():
+    """
+    Removes the deadline of the current request, e.g. once it started writing: the remaining operations of a write
+    are completed instead of leaving the entries partly written.
+    """
+    _deadline.set(None)
+
+
+class DeadlineMiddleware:
+    """
+    Gives every request a time budget of `timeout` seconds, which clients may change by the `header` (in seconds, at
+    most `maxTimeout`). Directory operations and mails are started only within the budget and their timeouts are
+    capped to the remaining time, otherwise the request fails with `DeadlineExceeded`.
+    """
+
+    def __init__(self, config: dict):
+        self.timeout: float = config.get('timeout', 10)
+        self.max_timeout: float = config.get('maxTimeout', 30)
+        self.header: Optional[str] = config.get('header', 'X-Request-Timeout')
+
+    def budget(self, req: falcon.Request) -> float:
+        value = req.get_header(self.header) if self.header else None
+        if value is None:
+            return self.timeout
+        try:
+            budget = float(value)
+        except ValueError:
+            raise falcon.HTTPInvalidHeader("Expected the timeout in seconds", self.header)
+        if not budget > 0:
+            raise falcon.HTTPInvalidHeader("Expected a positive timeout", self.header)
+        return min(budget, self.max_timeout)
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response):
+        req.context['deadline_token'] = _deadline.set(time.monotonic() + self.budget(req))
+
+    def process_response(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        token = req.context.get('deadline_token')
+        if token is not None:
+            _deadline.reset(token)
+
+    async def process_request_async(self, req: falcon.Request, resp: falcon.Response):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
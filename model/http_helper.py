@@ -1,3 +1,7 @@
+import hashlib
+from typing import Any, Dict, Tuple
+
+import falcon
 from falcon import HTTPBadRequest
 
 
@@ -5,7 +9,7 @@ class HTTPBadRequestField(HTTPBadRequest):
     """400 Bad Request. With extensions to reference the field which generated the error."""
 
     def __init__(self, title=None, description=None, field: str = None, **kwargs):
-        super(HTTPBadRequestField, self).__init__(title, description, **kwargs)
+        super(HTTPBadRequestField, self).__init__(title=title, description=description, **kwargs)
         self.field = {field: description}
 
     def to_dict(self, obj_type=dict):
@@ -13,3 +17,45 @@ class HTTPBadRequestField(HTTPBadRequest):
         if self.field is not None:
             result['field'] = self.field
         return result
+
+
+class SerializedMedia:
+    """
+    A response body serialized once per negotiated media type, with an ETag of its content for conditional requests.
+    """
+
+    def __init__(self, media: Any):
+        self.media = media
+        # Media type -> (data, etag)
+        self._serialized: Dict[str, Tuple[bytes, str]] = {}
+        # (Media type, content coding) -> compressed data, see `CompressionMiddleware`
+        self._compressed: Dict[Tuple[str, str], bytes] = {}
+
+    def serialized(self, resp: falcon.Response) -> Tuple[bytes, str]:
+        content_type = resp.content_type or falcon.MEDIA_JSON
+        serialized = self._serialized.get(content_type)
+        if serialized is None:
+            handler = resp.options.media_handlers.get(content_type)
+            if handler is None:
+                content_type = resp.content_type = falcon.MEDIA_JSON
+                handler = resp.options.media_handlers[content_type]
+            data = handler.serialize(self.media, content_type)
+            serialized = (data, hashlib.sha1(content_type.encode() + data).hexdigest()[:20])
+            self._serialized[content_type] = serialized
+        return serialized
+
+    @property
+    def etags(self) -> Dict[str, str]:
+        """ETags by media type, identify the content of the response."""
+        return {content_type: etag for content_type, (_, etag) in self._serialized.items()}
+
+    def write(self, req: falcon.Request, resp: falcon.Response):
+        data, etag = self.serialized(resp)
+        resp.etag = etag
+        if req.if_none_match and any(tag == '*' or tag == etag for tag in req.if_none_match):
+            resp.status = falcon.HTTP_304
+            resp.content_type = None
+            return
+        resp.data = data
+        resp.context['compression_cache'] = self._compressed
+        resp.status = falcon.HTTP_200
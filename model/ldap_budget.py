@@ -0,0 +1,160 @@
+import contextlib
+import contextvars
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Optional, Dict, Iterator, Any
+
+import falcon
+
+from model.db import DatabaseObserver
+
+_current: 'contextvars.ContextVar[Optional[RequestOperations]]' = contextvars.ContextVar(
+    'ldap_request_operations', default=None
+)
+
+_MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT_DIR = os.path.dirname(_MODEL_DIR)
+# Frames within these files are the directory access layer, the call site is the first frame outside of them
+_ACCESS_LAYER_FILES = {
+    os.path.join(_MODEL_DIR, 'db.py'),
+    os.path.join(_MODEL_DIR, 'view.py'),
+    os.path.join(_MODEL_DIR, 'ldap_budget.py'),
+    os.path.join(_MODEL_DIR, 'single_flight.py'),
+    os.path.join(_ROOT_DIR, 'db_mock.py'),
+}
+_VIEW_FILE = os.path.join(_MODEL_DIR, 'view.py')
+
+
+def _call_site() -> str:
+    """Gets the caller of the `View` layer (and the called `View` method) of the current operation."""
+    frame = sys._getframe(2)
+    view_method = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename == _VIEW_FILE:
+            view_method = frame.f_code.co_name
+        elif filename not in _ACCESS_LAYER_FILES:
+            site = "{}:{} {}".format(os.path.relpath(filename, _ROOT_DIR), frame.f_lineno, frame.f_code.co_name)
+            if view_method is not None:
+                site += " -> View.{}".format(view_method)
+            return site
+        frame = frame.f_back
+    return 'unknown'
+
+
+class RequestOperations:
+    """Directory operations of one request."""
+
+    def __init__(self, call_sites: bool):
+        self.count = 0
+        self.duration = 0.0
+        self.by_operation: Dict[str, int] = Counter()
+        self.call_sites: Optional[Dict[str, int]] = Counter() if call_sites else None
+        # Operations of one request may run on multiple threads (see AsyncDatabaseBridge)
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, duration: float):
+        call_site = _call_site() if self.call_sites is not None else None
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+            self.by_operation[operation] += 1
+            if call_site is not None:
+                self.call_sites[call_site] += 1
+
+    def describe(self, max_call_sites: int = 10) -> str:
+        text = "{} operations in {:.1f}ms ({})".format(
+            self.count, self.duration * 1000,
+            ", ".join("{} {}".format(count, op) for op, count in sorted(self.by_operation.items()))
+        )
+        if self.call_sites:
+            text += "\n" + "\n".join(
+                "  {:5d}x {}".format(count, site)
+                for site, count in Counter(self.call_sites).most_common(max_call_sites)
+            )
+        return text
+
+
+@contextlib.contextmanager
+def track_operations(call_sites: bool = True) -> Iterator[RequestOperations]:
+    """Records all directory operations within this context (and within requests simulated inside of it)."""
+    operations = RequestOperations(call_sites)
+    token = _current.set(operations)
+    try:
+        yield operations
+    finally:
+        _current.reset(token)
+
+
+class OperationBudgetObserver(DatabaseObserver):
+    def after(self, operation: str, duration: float, entries: int, error: Optional[BaseException]):
+        operations = _current.get()
+        if operations is not None:
+            operations.record(operation, duration)
+
+
+class OperationBudgetMiddleware:
+    """
+    Counts the directory operations of every request, reports them in the `X-LDAP-Ops` and `Server-Timing` headers
+    and logs the call sites of requests exceeding the budget.
+    """
+
+    def __init__(self, config: dict):
+        self.max_operations: int = config.get('maxOperations', 20)
+        self.call_sites: bool = config.get('callSites', False)
+        self.observer = OperationBudgetObserver()
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response):
+        if _current.get() is None:
+            req.context['ldap_operations_token'] = _current.set(RequestOperations(self.call_sites))
+
+    def process_response(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        operations = _current.get()
+        if operations is None:
+            return
+        token = req.context.get('ldap_operations_token')
+        if token is not None:
+            _current.reset(token)
+        resp.set_header('X-LDAP-Ops', str(operations.count))
+        resp.append_header(
+            'Server-Timing', 'ldap;dur={:.3f};desc="{} operations"'.format(operations.duration * 1000, operations.count)
+        )
+        if operations.count > self.max_operations:
+            logging.warning(
+                "%s %s exceeded the directory operation budget of %d: %s",
+                req.method, req.relative_uri, self.max_operations, operations.describe()
+            )
+
+    async def process_request_async(self, req: falcon.Request, resp: falcon.Response):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
+
+
+def assert_ldap_operations(
+        client: 'falcon.testing.TestClient', method: str, path: str, expected: int, **kwargs: Any
+) -> 'falcon.testing.Result':
+    """
+    Simulates a request and asserts the number of directory operations it caused. Requires the database factory of
+    the app to have an `OperationBudgetObserver` (i.e. `ldapBudget.enabled`).
+
+    Args:
+        client: Test client of the app (e.g. on top of the mock database).
+        method: HTTP method.
+        path: Request path.
+        expected: Expected number of directory operations.
+        **kwargs: Passed to `client.simulate_request`.
+
+    Returns:
+        The result of the request.
+    """
+    with track_operations() as operations:
+        result = client.simulate_request(method, path, **kwargs)
+    assert operations.count == expected, "{} {}: expected {} directory operations, got {}".format(
+        method, path, expected, operations.describe()
+    )
+    return result
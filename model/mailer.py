@@ -1,11 +1,13 @@
 import os
 import smtplib
+import socket
 import ssl
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Tuple
+from typing import Tuple, List, Callable, Optional
 
-import jinja2
+from model import deadline
 
 
 class Mailer:
@@ -24,20 +26,26 @@ class Mailer:
             self.port = config.get('port', 25)
         self.user = config.get('user')
         self.password = config.get('password')
+        # Timeout of every SMTP command in seconds (None: the default socket timeout), capped to the request deadline
+        self.timeout: Optional[float] = config.get('timeout')
         self.sender = config['sender']
         self.site_base_url = config['siteBaseUrl']
         self.site_name = config['siteName']
+        # Called with the duration and the error (if any) of every sent mail
+        self.send_observers: List[Callable[[float, Optional[BaseException]], None]] = []
 
     def connect(self) -> smtplib.SMTP:
+        timeout = deadline.cap_timeout(self.timeout)
+        kwargs = {} if timeout is None else {'timeout': timeout}
         if self.ssl:
             keyfile = self.keyfile
             certfile = self.certfile
             context = ssl.create_default_context() if not keyfile and not certfile else None
             mailer = smtplib.SMTP_SSL(
-                self.host, self.port, keyfile=keyfile, certfile=certfile, context=context
+                self.host, self.port, keyfile=keyfile, certfile=certfile, context=context, **kwargs
             )
         else:
-            mailer = smtplib.SMTP(self.host, self.port)
+            mailer = smtplib.SMTP(self.host, self.port, **kwargs)
         try:
             if self.starttls:
                 keyfile = self.keyfile
@@ -56,6 +64,9 @@ class Mailer:
         if not os.path.isfile(os.path.join('mail', language, name)):
             language = 'en'
 
+        # Slow to import, only needed for sending
+        import jinja2
+
         with open(os.path.join('mail', language, name), 'r') as rf:
             template = jinja2.Template(rf.read())
         data = template.render(site_base_url=self.site_base_url, site_name=self.site_name, **kwargs)
@@ -71,5 +82,22 @@ class Mailer:
         message.attach(MIMEText(html_data, 'html'))
         message.attach(MIMEText(txt_data, 'plain'))
 
-        with self.connect() as mailer:
-            mailer.sendmail(self.sender, [to], message.as_bytes())
+        start = time.perf_counter()
+        try:
+            try:
+                with self.connect() as mailer:
+                    # Connecting took part of the remaining time
+                    timeout = deadline.cap_timeout(self.timeout)
+                    if timeout is not None:
+                        mailer.sock.settimeout(timeout)
+                    mailer.sendmail(self.sender, [to], message.as_bytes())
+            except (socket.timeout, smtplib.SMTPServerDisconnected) as e:
+                if deadline.expired():
+                    raise deadline.DeadlineExceeded() from e
+                raise
+        except BaseException as e:
+            for observer in self.send_observers:
+                observer(time.perf_counter() - start, e)
+            raise
+        for observer in self.send_observers:
+            observer(time.perf_counter() - start, None)
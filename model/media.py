@@ -0,0 +1,127 @@
+import logging
+from functools import partial
+from typing import Dict, List, Optional, Any, Union
+
+import falcon
+import falcon.media
+
+MEDIA_CBOR = 'application/cbor'
+
+
+def json_handler(encoder: str = 'auto') -> falcon.media.JSONHandler:
+    """
+    Gets the JSON handler using the given encoder: 'orjson', 'stdlib' or 'auto' (orjson if installed, otherwise the
+    stdlib `json` module).
+    """
+    if encoder in ('auto', 'orjson'):
+        try:
+            import orjson
+        except ImportError:
+            if encoder == 'orjson':
+                raise
+        else:
+            return falcon.media.JSONHandler(dumps=orjson.dumps, loads=orjson.loads)
+    elif encoder != 'stdlib':
+        raise ValueError("Invalid JSON encoder {}".format(encoder))
+    return falcon.media.JSONHandler()
+
+
+class CBORHandler(falcon.media.BaseHandler):
+    """Handler for `application/cbor` (RFC 8949) using `cbor2`."""
+
+    def __init__(self):
+        import cbor2
+        self._dumps = partial(cbor2.dumps, datetime_as_timestamp=False, timezone=None)
+        self._loads = cbor2.loads
+
+    def serialize(self, media: Any, content_type: Optional[str] = None) -> bytes:
+        return self._dumps(media)
+
+    def deserialize(self, stream, content_type: Optional[str], content_length: Optional[int]) -> Any:
+        data = stream.read()
+        if not data:
+            raise falcon.MediaNotFoundError('CBOR')
+        try:
+            return self._loads(data)
+        except ValueError as e:
+            raise falcon.MediaMalformedError('CBOR') from e
+
+    async def deserialize_async(self, stream, content_type: Optional[str], content_length: Optional[int]) -> Any:
+        data = await stream.read()
+        if not data:
+            raise falcon.MediaNotFoundError('CBOR')
+        try:
+            return self._loads(data)
+        except ValueError as e:
+            raise falcon.MediaMalformedError('CBOR') from e
+
+
+def _msgpack_handler() -> falcon.media.BaseHandler:
+    # Falcon's handler only fails on first use if msgpack is missing
+    import msgpack  # noqa: F401
+    return falcon.media.MessagePackHandler()
+
+
+# Optional formats: media type -> handler factory (raises ImportError if the library is missing)
+OPTIONAL_FORMATS = {
+    falcon.MEDIA_MSGPACK: _msgpack_handler,
+    MEDIA_CBOR: CBORHandler,
+}
+
+
+class MediaFormats:
+    """
+    The media types of requests and responses: JSON (with a fast encoder, if installed) and the optional binary
+    formats listed in `formats` whose library is installed.
+    """
+
+    def __init__(self, config: dict):
+        self.handlers: Dict[str, falcon.media.BaseHandler] = {
+            falcon.MEDIA_JSON: json_handler(config.get('jsonEncoder', 'auto')),
+        }
+        for media_type in config.get('formats', []):
+            if media_type == falcon.MEDIA_JSON:
+                continue
+            factory = OPTIONAL_FORMATS.get(media_type)
+            if factory is None:
+                raise ValueError("Unsupported media type {}".format(media_type))
+            try:
+                self.handlers[media_type] = factory()
+            except ImportError as e:
+                logging.warning("Media type %s is not available: %s", media_type, e)
+        # JSON first, such that it is preferred if the client accepts any type
+        self.media_types: List[str] = list(self.handlers)
+
+    def install(self, app: Union[falcon.API, 'falcon.asgi.App']):
+        app.req_options.media_handlers.update(self.handlers)
+        app.resp_options.media_handlers.update(self.handlers)
+        # Errors are serialized as JSON for clients not accepting JSON
+        app.resp_options.default_media_type = falcon.MEDIA_JSON
+
+
+class RequireMedia:
+    """
+    Negotiates the response type from `Accept` among the supported media types (406 if none is accepted) and requires
+    request bodies in one of them (415 otherwise).
+    """
+
+    def __init__(self, formats: MediaFormats):
+        self.media_types = formats.media_types
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response):
+        preferred = req.client_prefers(self.media_types)
+        if preferred is None:
+            raise falcon.HTTPNotAcceptable(
+                description='This API only supports responses encoded as {}.'.format(', '.join(self.media_types))
+            )
+        resp.content_type = preferred
+
+        if req.method in ('POST', 'PUT', 'PATCH'):
+            content_type = (req.content_type or '').split(';', 1)[0].strip().lower()
+            if content_type not in self.media_types:
+                raise falcon.HTTPUnsupportedMediaType(
+                    description='This API only supports requests encoded as {}.'.format(', '.join(self.media_types))
+                )
+
+    async def process_request_async(self, req: falcon.Request, resp: falcon.Response):
+        self.process_request(req, resp)
@@ -0,0 +1,234 @@
+import bisect
+import hmac
+import os
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple, Optional
+
+import falcon
+
+from model.db import DatabaseObserver
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ENTRY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], *extra: str) -> str:
+    parts = [
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    ]
+    parts.extend(label for label in extra if label)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def expose(self, const_labels: str = '') -> List[str]:
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} counter'.format(self.name),
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            lines.append('{}{} {}'.format(
+                self.name, _format_labels(self.labels, label_values, const_labels), _format_value(value)
+            ))
+        return lines
+
+
+class Histogram:
+    def __init__(
+            self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Per label values: [count per bucket (non-cumulative, last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = ([0] * (len(self.buckets) + 1), [0.0])
+                self._values[label_values] = entry
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def count(self, *label_values: str) -> int:
+        entry = self._values.get(label_values)
+        return sum(entry[0]) if entry is not None else 0
+
+    def expose(self, const_labels: str = '') -> List[str]:
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+        with self._lock:
+            values = [(label_values, list(counts), total[0]) for label_values, (counts, total) in self._values.items()]
+        for label_values, counts, total in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name,
+                    _format_labels(self.labels, label_values, const_labels, 'le="{}"'.format(_format_value(bound))),
+                    cumulative
+                ))
+            labels = _format_labels(self.labels, label_values, const_labels)
+            lines.append('{}_sum{} {}'.format(self.name, labels, _format_value(total)))
+            lines.append('{}_count{} {}'.format(self.name, labels, cumulative))
+        return lines
+
+
+class LdapMetricsObserver(DatabaseObserver):
+    def __init__(self, metrics: 'Metrics'):
+        self.metrics = metrics
+
+    def after(self, operation: str, duration: float, entries: int, error: Optional[BaseException]):
+        self.metrics.ldap_duration.observe(duration, operation, 'ok' if error is None else type(error).__name__)
+        if operation == 'search' and error is None:
+            self.metrics.ldap_search_entries.observe(entries)
+
+
+class MetricsMiddleware:
+    """Records the duration of every request by route and status."""
+
+    def __init__(self, metrics: 'Metrics'):
+        self.metrics = metrics
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response):
+        req.context['request_start'] = time.perf_counter()
+
+    def process_response(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        start = req.context.get('request_start')
+        if start is None:
+            return
+        route = getattr(req, 'uri_template', None) or 'unmatched'
+        self.metrics.request_duration.observe(
+            time.perf_counter() - start, req.method, route, resp.status.split(' ', 1)[0]
+        )
+
+    async def process_request_async(self, req: falcon.Request, resp: falcon.Response):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
+
+
+class MetricsApi:
+    """Exposes all metrics in the Prometheus text format to scrapers sending `Authorization: Bearer <token>`."""
+
+    auth = {
+        'auth_disabled': True
+    }
+
+    def __init__(self, metrics: 'Metrics'):
+        self.metrics = metrics
+        self._authorization = ('Bearer ' + metrics.token).encode()
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response):
+        authorization = req.get_header('Authorization') or ''
+        if not hmac.compare_digest(authorization.encode(), self._authorization):
+            raise falcon.HTTPUnauthorized()
+        resp.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        resp.data = self.metrics.expose().encode()
+        resp.status = falcon.HTTP_200
+
+    def register(self, app: falcon.API):
+        app.add_route('/metrics', self)
+
+
+class AsyncMetricsApi(MetricsApi):
+    async def on_get(self, req: falcon.Request, resp: falcon.Response):
+        MetricsApi.on_get(self, req, resp)
+
+
+class Metrics:
+    """
+    In-process metrics registry. Recording is a dictionary lookup and a few additions under a lock, thus it is
+    cheap enough to stay enabled in production. Every worker process keeps its own metrics, they are exposed with the
+    `worker` label (the process id), such that the series of different workers are not mixed up.
+
+    Args:
+        token: Bearer token required to read the metrics at /metrics.
+    """
+
+    def __init__(self, token: str):
+        if not token:
+            raise ValueError("metrics.token is required to expose the metrics")
+        self.token = token
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', "Duration of HTTP requests", ['method', 'route', 'status']
+        )
+        self.ldap_duration = Histogram(
+            'ldap_operation_duration_seconds', "Duration of directory operations", ['operation', 'result']
+        )
+        self.ldap_search_entries = Histogram(
+            'ldap_search_entries', "Entries returned per directory search", buckets=ENTRY_BUCKETS
+        )
+        self.smtp_duration = Histogram('smtp_send_duration_seconds', "Duration of sending mails", ['result'])
+        self.cache_requests = Counter('cache_requests_total', "Cache lookups", ['cache', 'result'])
+        self.throttled_requests = Counter('throttled_requests_total', "Requests rejected by a rate limit", ['limit'])
+        self.admission_rejections = Counter(
+            'admission_rejected_requests_total', "Requests rejected by the concurrency limits", ['class', 'reason']
+        )
+        self.circuit_transitions = Counter(
+            'ldap_circuit_transitions_total', "Transitions of the directory circuit breaker", ['state']
+        )
+
+        self.metrics = [
+            self.request_duration, self.ldap_duration, self.ldap_search_entries, self.smtp_duration,
+            self.cache_requests, self.throttled_requests, self.circuit_transitions,
+            self.admission_rejections,
+        ]
+
+        self.middleware = MetricsMiddleware(self)
+        self.database_observer = LdapMetricsObserver(self)
+
+    def observe_cache(self, cache: str, hit: bool):
+        self.cache_requests.inc(cache, 'hit' if hit else 'miss')
+
+    def observe_admission(self, route_class: str, reason: str):
+        self.admission_rejections.inc(route_class, reason)
+
+    def observe_circuit(self, state: str):
+        self.circuit_transitions.inc(state)
+
+    def observe_smtp(self, duration: float, error: Optional[BaseException]):
+        self.smtp_duration.observe(duration, 'ok' if error is None else type(error).__name__)
+
+    def observe_throttle(self, limit: str):
+        self.throttled_requests.inc(limit)
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        # Read on every scrape, the registry is created before the server forks the workers
+        worker = 'worker="{}"'.format(os.getpid())
+        for metric in self.metrics:
+            lines.extend(metric.expose(worker))
+        return '\n'.join(lines) + '\n'
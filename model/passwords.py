@@ -0,0 +1,167 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Iterable, BinaryIO, Tuple
+
+import passlib.hash
+
+BREACH_FILE_MAGIC = b'SHA1PFX\x01'
+BREACH_FILE_HEADER = 16
+
+
+def _hash(scheme: str, password: str) -> str:
+    return getattr(passlib.hash, 'ldap_' + scheme).hash(password)
+
+
+class BreachFile:
+    """
+    Memory-mapped file of sorted, truncated SHA-1 digests of breached passwords, looked up by binary search.
+
+    The file starts with `BREACH_FILE_MAGIC`, the number of bytes per digest prefix and padding up to
+    `BREACH_FILE_HEADER` bytes, followed by the prefixes. With 8 byte prefixes, the chance of a false positive is
+    below 1e-10 for the full public dump, at 40% of the size of full digests.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            header = f.read(BREACH_FILE_HEADER)
+            if len(header) < BREACH_FILE_HEADER or not header.startswith(BREACH_FILE_MAGIC):
+                raise ValueError("{} is not a breached passwords file".format(path))
+            self.prefix_bytes: int = header[len(BREACH_FILE_MAGIC)]
+            if not 1 <= self.prefix_bytes <= 20:
+                raise ValueError("{} has an invalid prefix length {}".format(path, self.prefix_bytes))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if (len(self._map) - BREACH_FILE_HEADER) % self.prefix_bytes:
+            self._map.close()
+            raise ValueError("{} is truncated".format(path))
+        self.count = (len(self._map) - BREACH_FILE_HEADER) // self.prefix_bytes
+
+    def _record(self, index: int) -> bytes:
+        offset = BREACH_FILE_HEADER + index * self.prefix_bytes
+        return self._map[offset:offset + self.prefix_bytes]
+
+    def contains_digest(self, digest: bytes) -> bool:
+        key = digest[:self.prefix_bytes]
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low < self.count and self._record(low) == key
+
+    def __contains__(self, password: str) -> bool:
+        return self.contains_digest(hashlib.sha1(password.encode()).digest())
+
+    def close(self):
+        self._map.close()
+
+
+def parse_hash_lines(lines: Iterable[str], min_count: int = 1) -> Iterable[bytes]:
+    """Parses `SHA1:COUNT` lines (format of the public Pwned Passwords dump), skipping hashes seen less often."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        digest, _, count = line.partition(':')
+        if count and int(count) < min_count:
+            continue
+        yield bytes.fromhex(digest)
+
+
+def hash_plain_lines(lines: Iterable[str]) -> Iterable[bytes]:
+    """Hashes lines of plain text passwords (e.g. a custom block list)."""
+    for line in lines:
+        password = line.rstrip('\r\n')
+        if password:
+            yield hashlib.sha1(password.encode()).digest()
+
+
+def write_breach_file(digests: Iterable[bytes], output: BinaryIO, prefix_bytes: int = 8, presorted: bool = True) -> int:
+    """
+    Writes a file for `BreachFile`. Sorted input (e.g. the "ordered by hash" dump) is streamed, other input is sorted in
+    memory. Returns the number of written prefixes.
+    """
+    if not 1 <= prefix_bytes <= 20:
+        raise ValueError("prefix_bytes must be between 1 and 20")
+    prefixes = (digest[:prefix_bytes] for digest in digests)
+    if not presorted:
+        prefixes = iter(sorted(set(prefixes)))
+    output.write(BREACH_FILE_MAGIC + bytes([prefix_bytes]) + bytes(BREACH_FILE_HEADER - len(BREACH_FILE_MAGIC) - 1))
+    count = 0
+    last = b''
+    for prefix in prefixes:
+        if prefix < last:
+            raise ValueError("Input is not sorted by hash, use the dump ordered by hash or sort the input")
+        if prefix == last:
+            continue
+        output.write(prefix)
+        last = prefix
+        count += 1
+    return count
+
+
+def _start_method() -> str:
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class Passwords:
+    """
+    Hashes passwords and checks them against breached passwords.
+
+    Hashing runs on a process pool with `hashProcesses` processes (0, the default, hashes on the calling thread), such
+    that slow schemes do not hold the GIL of the request threads. The pool is created on first use in every process,
+    thus workers forked by the server get their own pool, and its processes are started by a fork server (spawned
+    where unavailable), never forked from a multi-threaded worker. Breached passwords are checked in the local
+    `breachFile` (see `build_breach_file.py`) if configured, otherwise with the online Pwned Passwords API.
+    """
+
+    def __init__(self, config: dict):
+        self.hash_processes = 0
+        self.breach_file: Optional[BreachFile] = None
+        # Pool and the process it was created in
+        self._pool: Optional[Tuple[int, ProcessPoolExecutor]] = None
+        self._pool_lock = threading.Lock()
+        self.configure(config)
+
+    def configure(self, config: dict):
+        self.close()
+        self.hash_processes = config.get('hashProcesses', 0)
+        self.breach_file = BreachFile(config['breachFile']) if config.get('breachFile') else None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None or self._pool[0] != os.getpid():
+                self._pool = (os.getpid(), ProcessPoolExecutor(
+                    max_workers=self.hash_processes, mp_context=multiprocessing.get_context(_start_method())
+                ))
+            return self._pool[1]
+
+    def hash(self, scheme: str, password: str) -> str:
+        if self.hash_processes <= 0 or scheme == 'plaintext':
+            return _hash(scheme, password)
+        return self._executor().submit(_hash, scheme, password).result()
+
+    def is_breached(self, password: str) -> bool:
+        if self.breach_file is not None:
+            return password in self.breach_file
+        # Slow to import, only needed when writing
+        import pwnedpasswords
+        return pwnedpasswords.check(password, plain_text=True)
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool[0] == os.getpid():
+                self._pool[1].shutdown()
+            self._pool = None
+        if self.breach_file is not None:
+            self.breach_file.close()
+            self.breach_file = None
+
+
+# Used by the password fields of all views, configured by the application
+passwords = Passwords({})
@@ -0,0 +1,351 @@
+import cProfile
+import collections
+import itertools
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple, Deque
+
+import falcon
+
+_MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+# The sampling profiler records stacks running through these files: View, ViewDetails and the fields
+_VIEW_FILES_PREFIX = os.path.join(_MODEL_DIR, 'view')
+
+# cProfile function key: (filename, line number, function name)
+FunctionKey = Tuple[str, int, str]
+
+
+def _function_label(func: FunctionKey) -> str:
+    filename, line, name = func
+    if filename == '~':
+        # Builtin
+        return name
+    return "{}:{}:{}".format(os.path.basename(filename), line, name)
+
+
+def collapse_profile_stats(stats: Dict[FunctionKey, tuple], max_depth: int = 64) -> Dict[str, float]:
+    """
+    Converts cProfile stats to collapsed stacks (for flamegraph tools), in microseconds.
+
+    cProfile only records caller/callee pairs, thus the time of a function called from several stacks is split
+    proportionally to the time of each call edge. The result is an approximation of the real stacks.
+    """
+    callees: Dict[FunctionKey, List[Tuple[FunctionKey, float]]] = collections.defaultdict(list)
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, (_, _, _, edge_ct) in callers.items():
+            callees[caller].append((func, edge_ct))
+
+    stacks: Dict[str, float] = collections.defaultdict(float)
+
+    def walk(func: FunctionKey, path: Tuple[FunctionKey, ...], time_share: float):
+        total = stats[func][3]
+        if total <= 0 or time_share <= 0:
+            return
+        fraction = min(1.0, time_share / total)
+        path = path + (func,)
+        stacks[";".join(_function_label(f) for f in path)] += stats[func][2] * fraction * 1e6
+        if len(path) >= max_depth:
+            return
+        for callee, edge_ct in callees.get(func, ()):
+            if callee not in path:
+                walk(callee, path, edge_ct * fraction)
+
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        if not callers:
+            walk(func, (), ct)
+    return stacks
+
+
+def format_collapsed(stacks: Dict[str, float]) -> str:
+    return "".join(
+        "{} {}\n".format(stack, int(round(value)))
+        for stack, value in sorted(stacks.items())
+        if value >= 1
+    )
+
+
+class RequestProfile:
+    def __init__(self, profile_id: int, method: str, path: str, duration: float, profile: cProfile.Profile):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.timestamp = time.time()
+        self.duration = duration
+        profile.create_stats()
+        self.stats: Dict[FunctionKey, tuple] = profile.stats
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'timestamp': self.timestamp,
+            'duration': self.duration,
+        }
+
+    def pstats(self) -> bytes:
+        """The stats in the file format of `pstats.Stats`."""
+        return marshal.dumps(self.stats)
+
+    def collapsed(self) -> str:
+        return format_collapsed(collapse_profile_stats(self.stats))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler, sampling the stacks of all threads in a fixed interval. Only stacks going through the
+    views, details and fields are recorded.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Dict[str, int] = collections.defaultdict(int)
+        self.samples = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = None):
+        with self._lock:
+            if interval is not None:
+                self.interval = interval
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            self._stop.set()
+        if thread is not None:
+            thread.join()
+
+    def clear(self):
+        with self._lock:
+            self.stacks = collections.defaultdict(int)
+            self.samples = 0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                labels = []
+                in_views = False
+                while frame is not None:
+                    code = frame.f_code
+                    if code.co_filename.startswith(_VIEW_FILES_PREFIX):
+                        in_views = True
+                    labels.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                if in_views:
+                    self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join("{} {}\n".format(stack, count) for stack, count in sorted(list(self.stacks.items())))
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a random sample of requests, and requests carrying the profile header if the user has one of the
+    permissions. The profiles are kept in a bounded ring.
+
+    Must run after the auth middleware: the permission is checked before profiling a requested resource, thus
+    unauthenticated clients cannot make the server profile their requests.
+
+    cProfile only follows the thread the request runs on, thus with the ASGI app only the event loop part of the
+    request is profiled, use the sampling profiler for the pool threads.
+    """
+
+    def __init__(self, config: dict):
+        self.sample_rate: float = config.get('sampleRate', 0.0)
+        self.header: str = config.get('header', 'X-Profile')
+        self.permissions: List[str] = config.get('permissions', ['isAdmin'])
+        self.profiles: Deque[RequestProfile] = collections.deque(maxlen=config.get('keep', 50))
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _start(req: falcon.Request, requested: bool):
+        profile = cProfile.Profile()
+        req.context['profile'] = (profile, requested, time.perf_counter())
+        profile.enable()
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response):
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            self._start(req, False)
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params):
+        if 'profile' in req.context or req.get_header(self.header) is None:
+            return
+        if self.is_permitted(req.context.get('user')):
+            self._start(req, True)
+
+    def process_response(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        profiling = req.context.get('profile')
+        if profiling is None:
+            return
+        profile, requested, start = profiling
+        profile.disable()
+        duration = time.perf_counter() - start
+        profile_id = next(self._ids)
+        self.profiles.append(RequestProfile(profile_id, req.method, req.relative_uri, duration, profile))
+        resp.set_header('X-Profile-Id', str(profile_id))
+
+    async def process_request_async(self, req: falcon.Request, resp: falcon.Response):
+        self.process_request(req, resp)
+
+    async def process_resource_async(self, req: falcon.Request, resp: falcon.Response, resource, params):
+        self.process_resource(req, resp, resource, params)
+
+    async def process_response_async(self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool):
+        self.process_response(req, resp, resource, req_succeeded)
+
+    def is_permitted(self, user: Optional[Dict[str, Any]]) -> bool:
+        return user is not None and any(user.get(permission) for permission in self.permissions)
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        for profile in list(self.profiles):
+            if profile.id == profile_id:
+                return profile
+        return None
+
+
+class ProfilesApi:
+    """Lists the kept request profiles."""
+
+    def __init__(self, profiler: 'Profiler'):
+        self.profiler = profiler
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response):
+        self.profiler.check_permission(req)
+        resp.media = [profile.summary() for profile in list(self.profiler.middleware.profiles)]
+        resp.status = falcon.HTTP_200
+
+    def register(self, app: falcon.API):
+        app.add_route('/profiles', self)
+
+
+class ProfileApi:
+    """Downloads a request profile, `?format=pstats` (default) or `?format=collapsed`."""
+
+    def __init__(self, profiler: 'Profiler'):
+        self.profiler = profiler
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response, profile_id: str):
+        self.profiler.check_permission(req)
+        profile = self.profiler.middleware.get(int(profile_id)) if profile_id.isdigit() else None
+        if profile is None:
+            raise falcon.HTTPNotFound()
+        output_format = req.get_param('format') or 'pstats'
+        if output_format == 'pstats':
+            resp.content_type = 'application/octet-stream'
+            resp.set_header('Content-Disposition', 'attachment; filename="profile-{}.prof"'.format(profile.id))
+            resp.data = profile.pstats()
+        elif output_format == 'collapsed':
+            resp.content_type = 'text/plain; charset=utf-8'
+            resp.data = profile.collapsed().encode()
+        else:
+            raise falcon.HTTPBadRequest(description="Invalid format {}".format(output_format))
+        resp.status = falcon.HTTP_200
+
+    def register(self, app: falcon.API):
+        app.add_route('/profiles/{profile_id}', self)
+
+
+class SamplerApi:
+    """
+    Controls the sampling profiler. GET downloads the collapsed stacks, POST `{"enabled": bool, "interval": seconds,
+    "clear": bool}` starts or stops it.
+    """
+
+    def __init__(self, profiler: 'Profiler'):
+        self.profiler = profiler
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response):
+        self.profiler.check_permission(req)
+        resp.content_type = 'text/plain; charset=utf-8'
+        resp.data = self.profiler.sampler.collapsed().encode()
+        resp.status = falcon.HTTP_200
+
+    def on_post(self, req: falcon.Request, resp: falcon.Response):
+        self.profiler.check_permission(req)
+        self.profiler.control_sampler(req.media)
+        resp.media = self.profiler.sampler_state()
+        resp.status = falcon.HTTP_200
+
+    def register(self, app: falcon.API):
+        app.add_route('/profiles/sampler', self)
+
+
+class AsyncProfilesApi(ProfilesApi):
+    async def on_get(self, req: falcon.Request, resp: falcon.Response):
+        ProfilesApi.on_get(self, req, resp)
+
+
+class AsyncProfileApi(ProfileApi):
+    async def on_get(self, req: falcon.Request, resp: falcon.Response, profile_id: str):
+        ProfileApi.on_get(self, req, resp, profile_id)
+
+
+class AsyncSamplerApi(SamplerApi):
+    async def on_get(self, req: falcon.Request, resp: falcon.Response):
+        SamplerApi.on_get(self, req, resp)
+
+    async def on_post(self, req: falcon.Request, resp: falcon.Response):
+        self.profiler.check_permission(req)
+        self.profiler.control_sampler(await req.get_media())
+        resp.media = self.profiler.sampler_state()
+        resp.status = falcon.HTTP_200
+
+
+class Profiler:
+    def __init__(self, config: dict):
+        self.middleware = ProfilerMiddleware(config)
+        self.sampler = SamplingProfiler(config.get('samplerInterval', 0.005))
+
+    def check_permission(self, req: falcon.Request):
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+        if not self.middleware.is_permitted(user):
+            raise falcon.HTTPForbidden(description="Insufficient permissions")
+
+    def control_sampler(self, command: Dict[str, Any]):
+        if command.get('clear'):
+            self.sampler.clear()
+        if 'enabled' in command:
+            if command['enabled']:
+                interval = command.get('interval')
+                self.sampler.start(float(interval) if interval is not None else None)
+            else:
+                self.sampler.stop()
+
+    def sampler_state(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.sampler.running,
+            'interval': self.sampler.interval,
+            'samples': self.sampler.samples,
+        }
+
+    def register(self, app: falcon.API):
+        ProfilesApi(self).register(app)
+        ProfileApi(self).register(app)
+        SamplerApi(self).register(app)
+
+    def register_async(self, app: falcon.API):
+        AsyncProfilesApi(self).register(app)
+        AsyncProfileApi(self).register(app)
+        AsyncSamplerApi(self).register(app)
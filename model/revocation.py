@@ -0,0 +1,222 @@
+import collections
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple, Set, Iterator, List
+
+import model.view
+from model.cache import SharedFile
+
+# Time of a mark and the auth entry loaded from the directory after the mark (None if not loaded yet)
+Mark = Tuple[float, Optional[Dict[str, Any]]]
+
+
+class SharedRevocationMarks:
+    """
+    Latest mark time per user in a memory-mapped file shared by the workers of a host, such that a mark set by one
+    worker reaches all workers. Users are hashed to `slots` slots, users sharing a slot are marked together, which only
+    costs additional directory reads.
+    """
+
+    TIME = struct.Struct('<d')
+
+    def __init__(self, path: str, slots: int = 65536):
+        self.slots = slots
+        self._file = SharedFile(path, b'LAREVOK1', (slots,), slots * self.TIME.size)
+
+    def _offset(self, primary_key: str) -> int:
+        return SharedFile.HEADER + (zlib.crc32(primary_key.encode()) % self.slots) * self.TIME.size
+
+    def get(self, primary_key: str) -> float:
+        # Aligned 8 byte reads do not tear, no lock needed
+        return self.TIME.unpack_from(self._file.map, self._offset(primary_key))[0]
+
+    def publish(self, primary_key: str, mark_time: float):
+        offset = self._offset(primary_key)
+        with self._file.locked(exclusive=True) as shared_map:
+            if self.TIME.unpack_from(shared_map, offset)[0] < mark_time:
+                self.TIME.pack_into(shared_map, offset, mark_time)
+
+    def close(self):
+        self._file.close()
+
+
+class RevocationList:
+    """
+    Marks of users whose tokens must not be trusted, if issued before the mark. Instead, the auth entry is loaded from
+    the directory once after the mark and checked like without stateless tokens (the `timestamp` must match), further
+    tokens of the user are checked against that entry.
+
+    Marks older than the token lifetime are dropped, as all tokens issued before them expired. If more than
+    `max_entries` users are marked, the oldest mark is dropped and becomes the global mark, which applies to all users.
+
+    With `shared` marks, marks of users are published to and adopted from the other workers.
+    """
+
+    def __init__(self, lifetime: float, max_entries: int = 10000, shared: Optional[SharedRevocationMarks] = None):
+        self.lifetime = lifetime
+        self.max_entries = max_entries
+        self.shared = shared
+        self._marks: 'collections.OrderedDict[str, Mark]' = collections.OrderedDict()
+        self._global_mark = 0.0
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._marks and next(iter(self._marks.values()))[0] < now - self.lifetime:
+            self._marks.popitem(last=False)
+        while len(self._marks) > self.max_entries:
+            _, (mark_time, _) = self._marks.popitem(last=False)
+            self._global_mark = max(self._global_mark, mark_time)
+        if self._global_mark < now - self.lifetime:
+            self._global_mark = 0.0
+
+    def revoke(self, primary_key: str, publish: bool = True):
+        """
+        Tokens of the user issued until now are checked against the directory.
+
+        Args:
+            primary_key: The user.
+            publish: Whether to publish the mark to the other workers (if shared), not needed if they mark the user by
+                themselves (e.g. by polling).
+        """
+        now = time.time()
+        with self._lock:
+            self._marks.pop(primary_key, None)
+            self._marks[primary_key] = (now, None)
+            self._prune(now)
+        if publish and self.shared is not None:
+            self.shared.publish(primary_key, now)
+
+    def revoke_all(self):
+        """Tokens of all users issued until now are checked against the directory."""
+        with self._lock:
+            self._global_mark = time.time()
+            self._marks.clear()
+
+    def lookup(
+            self, primary_key: str, issued_at: float, claims: Dict[str, Any]
+    ) -> Tuple[Optional[Dict[str, Any]], Mark]:
+        """
+        Gets the trusted auth entry of a token: the claims if issued after the mark of the user, the entry loaded after
+        the mark, or None if the entry must be loaded (and passed to `verified` with the returned mark).
+        """
+        shared_time = self.shared.get(primary_key) if self.shared is not None else 0.0
+        with self._lock:
+            mark = self._marks.get(primary_key)
+            if mark is None:
+                mark = (self._global_mark, None)
+            if shared_time > mark[0]:
+                # Marked by another worker
+                mark = (shared_time, None)
+                self._marks.pop(primary_key, None)
+                self._marks[primary_key] = mark
+                self._prune(time.time())
+        if issued_at > mark[0]:
+            return claims, mark
+        return mark[1], mark
+
+    def verified(self, primary_key: str, mark: Mark, auth_entry: Dict[str, Any]):
+        """Keeps the auth entry loaded for the mark, unless the user was marked again in between."""
+        now = time.time()
+        with self._lock:
+            current = self._marks.get(primary_key)
+            if (current[0] if current is not None else self._global_mark) != mark[0]:
+                return
+            self._marks.pop(primary_key, None)
+            self._marks[primary_key] = (mark[0], auth_entry)
+            self._prune(now)
+
+    def __len__(self):
+        return len(self._marks)
+
+
+def changed_references(changes: Any) -> Iterator[str]:
+    """Gets the values of an add- or modlist (e.g. the DNs added to or deleted from a `member` attribute)."""
+    for values in changes.values():
+        if not isinstance(values, list):
+            values = [values]
+        for value in values:
+            if isinstance(value, tuple):
+                yield from value[1]
+            else:
+                yield value
+
+
+class RevocationPoller:
+    """
+    Polls the directory for entries of the auth view modified since the last poll (e.g. by other tools) and marks them
+    in the revocation list. Changes of the groups the auth entries are derived from (e.g. a member removed from the
+    admin group) do not modify the users, thus a changed group marks all users. Deleted users cannot be found by
+    polling, thus all users are marked every `reverify_interval` seconds (0: never).
+
+    The thread runs in the process using it: `ensure_running` starts it (again) after the process forked.
+    """
+
+    def __init__(
+            self, view: 'model.view.View', revocations: RevocationList, interval: float,
+            group_views: List['model.view.View'] = None, reverify_interval: float = 0,
+    ):
+        self.view = view
+        self.group_views: List['model.view.View'] = group_views or []
+        self.revocations = revocations
+        self.interval = interval
+        self.reverify_interval = reverify_interval
+        # Allows for clock skew between the directory and this host
+        since = datetime.now(timezone.utc) - timedelta(seconds=60)
+        self._since: Dict[str, datetime] = {view.key: since for view in [view] + self.group_views}
+        self._seen: Dict[str, Set[Tuple[str, datetime]]] = {view.key: set() for view in [view] + self.group_views}
+        self._reverified = time.monotonic()
+        self._stop = threading.Event()
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    def ensure_running(self):
+        """Starts the thread, unless it runs in this process (threads do not survive `fork`)."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() or self._stop.is_set():
+                return
+            threading.Thread(target=self._run, name='token-revocation-poller', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _changed(self, view: 'model.view.View') -> List[str]:
+        """Gets the primary keys of the entries of the view modified since the last poll."""
+        since = self._since[view.key]
+        changed = view.get_modified_since(since)
+        seen = self._seen[view.key]
+        latest = since
+        for primary_key, timestamp in changed:
+            latest = max(latest, timestamp)
+        # The filter includes the last timestamp, remember the entries having it to not mark them again
+        self._seen[view.key] = {(primary_key, timestamp) for primary_key, timestamp in changed if timestamp == latest}
+        self._since[view.key] = latest
+        return [primary_key for primary_key, timestamp in changed if (primary_key, timestamp) not in seen]
+
+    def poll(self):
+        for primary_key in self._changed(self.view):
+            # Every worker polls by itself
+            self.revocations.revoke(primary_key, publish=False)
+        changed_groups = [primary_key for view in self.group_views for primary_key in self._changed(view)]
+        if changed_groups:
+            logging.info("Groups %s changed, checking all tokens against the directory", ", ".join(changed_groups))
+            self.revocations.revoke_all()
+        elif self.reverify_interval > 0 and time.monotonic() - self._reverified >= self.reverify_interval:
+            self.revocations.revoke_all()
+        else:
+            return
+        self._reverified = time.monotonic()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logging.exception("Polling for modified users failed")
+
+    def close(self):
+        self._stop.set()
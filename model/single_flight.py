@@ -0,0 +1,64 @@
+import threading
+from typing import Dict, Hashable, Callable, TypeVar, Optional
+
+from model import deadline
+
+T = TypeVar('T')
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is running, further calls for the key wait for it and
+    get its result (or its exception) instead of running again. The result is shared, thus callers must not modify it.
+    Waiting callers give up with `DeadlineExceeded` when the time of their request runs out.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if not call.done.wait(deadline.cap_timeout(None)):
+                raise deadline.DeadlineExceeded()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def forget(self):
+        """
+        Lets later calls start anew instead of joining the running calls, e.g. after a write, such that a read following
+        the write does not get the result of a read started before it.
+        """
+        with self._lock:
+            self._calls.clear()
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,125 @@
+import collections
+import math
+import threading
+import time
+from typing import Dict, Optional, List, Callable, Tuple
+
+import falcon
+
+
+class TokenBuckets:
+    """
+    One token bucket per key: a bucket holds up to `burst` tokens, refills with `rate` tokens per second and every
+    request takes one token. At most `max_keys` buckets are tracked, the least recently used bucket is dropped first.
+    """
+
+    def __init__(self, config: dict):
+        self.rate: float = config['rate']
+        self.burst: float = config.get('burst', 1)
+        self.max_keys: int = config.get('maxKeys', 10000)
+        # Key -> (tokens, time of the last update)
+        self._buckets: 'collections.OrderedDict[str, Tuple[float, float]]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """Takes a token of the bucket of the key, returns 0 on success or the seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._buckets.pop(key, None)
+            if state is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0 if allowed else (1 - tokens) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class MailCollapser:
+    """Remembers recently mailed keys, such that identical requests within `window` seconds send only one mail."""
+
+    def __init__(self, window: float, max_keys: int = 10000):
+        self.window = window
+        self.max_keys = max_keys
+        self._sent: 'collections.OrderedDict[str, float]' = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> bool:
+        """Returns True if a mail for the key should be sent (and blocks the key for the window)."""
+        now = time.monotonic()
+        with self._lock:
+            while self._sent and next(iter(self._sent.values())) <= now - self.window:
+                self._sent.popitem(last=False)
+            if key in self._sent:
+                return False
+            self._sent[key] = now
+            while len(self._sent) > self.max_keys:
+                self._sent.popitem(last=False)
+            return True
+
+    def release(self, key: str):
+        """Unblocks the key, if sending the mail failed."""
+        with self._lock:
+            self._sent.pop(key, None)
+
+
+class Throttle:
+    """
+    Rate limits of the login endpoints, per client IP and per username (or mail address). Limits are checked if
+    `enabled`, limits which are not configured are not checked. The buckets are kept per process.
+    """
+
+    def __init__(self, config: dict):
+        self.trust_forwarded_for: bool = config.get('trustForwardedFor', False)
+        self.limits: Dict[str, TokenBuckets] = {
+            name: TokenBuckets(config[name])
+            for name in ('loginPerIp', 'loginPerUser', 'mailLoginPerIp', 'mailLoginPerMail')
+            if name in config and config.get('enabled', False)
+        }
+        self.mail_collapser: Optional[MailCollapser] = None
+        if config.get('mailCollapseWindow', 0) > 0:
+            self.mail_collapser = MailCollapser(config['mailCollapseWindow'])
+        # Called with the name of the limit for every rejected request
+        self.throttle_observers: List[Callable[[str], None]] = []
+
+    def client_ip(self, req: falcon.Request) -> str:
+        if self.trust_forwarded_for and req.access_route:
+            return req.access_route[0]
+        return req.remote_addr or ''
+
+    def _check(self, name: str, key: str):
+        limit = self.limits.get(name)
+        if limit is None:
+            return
+        retry_after = limit.take(key)
+        if retry_after > 0:
+            for observer in self.throttle_observers:
+                observer(name)
+            raise falcon.HTTPTooManyRequests(
+                description="Too many attempts, try again later", retry_after=max(1, math.ceil(retry_after))
+            )
+
+    def check_login(self, req: falcon.Request, username: str):
+        """Raises 429 if the client or the username exceeds the login limits."""
+        self._check('loginPerIp', self.client_ip(req))
+        self._check('loginPerUser', str(username).lower())
+
+    def check_mail_login(self, req: falcon.Request, mail: str):
+        """Raises 429 if the client or the mail address exceeds the mail login limits."""
+        self._check('mailLoginPerIp', self.client_ip(req))
+        self._check('mailLoginPerMail', str(mail).strip().lower())
+
+    def claim_mail(self, mail: str) -> bool:
+        """Returns False if the same mail login was already sent within the collapse window."""
+        return self.mail_collapser is None or self.mail_collapser.claim(str(mail).strip().lower())
+
+    def release_mail(self, mail: str):
+        if self.mail_collapser is not None:
+            self.mail_collapser.release(str(mail).strip().lower())
@@ -1,6 +1,8 @@
 import logging
+import threading
 from collections import OrderedDict
-from typing import Dict, List, Set, Any, Optional, Union
+from datetime import datetime, timezone
+from typing import Dict, List, Set, Any, Optional, Union, Callable, Tuple
 
 import falcon
 import ldap3
@@ -11,6 +13,7 @@ from ldap3.core.exceptions import LDAPNoSuchObjectResult, LDAPExceptionError
 from model.db import DatabaseFactory, FalconLdapError, LdapAddlist, LdapModlist, LdapFetch
 from model.http_helper import HTTPBadRequestField
 from model.view_details import ViewDetails
+from model.view_field import ViewFieldIsMemberOf
 from model.view_list import ViewList
 
 
@@ -18,7 +21,7 @@ class View:
     def __init__(self, db: DatabaseFactory, key: str, config: dict, **overrides):
         config.update(overrides)
         self._key = key
-        self._db = db.connection
+        self._db_factory = db
         self._dn: str = config['dn'] + ',' + db.prefix
         self._title: str = config['title']
         self._primary_key: str = config['primaryKey']
@@ -61,17 +64,48 @@ class View:
                     "(&" + "".join("(objectClass={})".format(cls) for cls in config['objectClass']) + f"({mail_field}={{}}))"
                 )
 
-        try:
-            self._db.search(self._dn, search_filter="(objectClass=*)", search_scope=ldap3.BASE)
-        except LDAPNoSuchObjectResult:
-            if self._auto_create is not None:
-                # Create the object
-                logging.info("Adding '{}'".format(self._dn))
-                self._db.add(self._dn, attributes=self._auto_create)
-                # Ensure the object exists now
-                self._db.search(self._dn, search_filter="(objectClass=*)", search_scope=ldap3.BASE)
-            else:
-                raise
+        self._container_checked = False
+        self._container_lock = threading.Lock()
+
+        # Called with the dn and the add- or modlist (None for deletion) of every entry written through this view
+        self.write_observers: List[Callable[[str, Any], None]] = []
+
+    def _written(self, dn: str, changes: Any):
+        self._db_factory.single_flight.forget()
+        for observer in self.write_observers:
+            observer(dn, changes)
+
+    @property
+    def _db(self) -> ldap3.Connection:
+        if not self._container_checked:
+            self.ensure_container()
+        return self._db_factory.connection
+
+    def ensure_container(self):
+        """Checks that the container of this view exists, adds it if `autoCreate` is configured."""
+        if self._container_checked:
+            return
+        with self._container_lock:
+            if self._container_checked:
+                return
+            db = self._db_factory.connection
+            try:
+                db.search(self._dn, search_filter="(objectClass=*)", search_scope=ldap3.BASE)
+            except LDAPNoSuchObjectResult:
+                if self._auto_create is not None:
+                    # Create the object
+                    logging.info("Adding '{}'".format(self._dn))
+                    db.add(self._dn, attributes=self._auto_create)
+                    # Ensure the object exists now
+                    db.search(self._dn, search_filter="(objectClass=*)", search_scope=ldap3.BASE)
+                else:
+                    raise
+            self._container_checked = True
+
+    @property
+    def permission_keys(self) -> Set[str]:
+        """Gets the permission flags of the user which `user_config` depends on."""
+        return set(self._permissions) | set(self._read_permissions)
 
     @property
     def has_self(self) -> bool:
@@ -130,6 +164,10 @@ class View:
                 return
         raise falcon.HTTPForbidden(description="Insufficient permissions")
 
+    def check_read_permission(self, user: Dict[str, Any]):
+        """Raises 403 if the user may not read the list and the entries."""
+        self._check_permissions(user, writing=False)
+
     def init(self, all_views: Dict[str, 'View']):
         self._list_view.init(all_views)
         self._detail_view.init(all_views)
@@ -141,6 +179,7 @@ class View:
             self._register_view.init(all_views)
 
     def _create(self, view: ViewDetails, assignments: Dict[str, Dict[str, Any]]):
+        view.validate(assignments, True)
         primary_key: Optional[str] = None
         for value in assignments.values():
             if self._primary_key in value:
@@ -154,24 +193,35 @@ class View:
             self._db.add(dn, attributes=addlist)
         except LDAPExceptionError as e:
             raise FalconLdapError(e)
+        self._written(dn, addlist)
         view.set_post(LdapFetch(dn, {}), assignments, True)
 
-    def _list(self, view: ViewList):
+    def _search(self, base: str, search_filter: str, scope: str, attributes: List[str]) -> List[LdapFetch]:
+        """Searches the directory, sharing the search with concurrent identical reads. Must not be modified."""
+        def search():
+            db = self._db
+            db.search(base, search_filter, search_scope=scope, attributes=attributes)
+            return LdapFetch.from_entries(db.entries)
+
+        key = (base, search_filter, scope, frozenset(attributes))
+        return self._db_factory.single_flight.do(key, search)
+
+    def _list(self, view: ViewList, columns: bool = False):
         fetches: Set[str] = set()
         view.get_fetch(fetches)
         try:
-            self._db.search(self._dn, self._class_filter, search_scope=ldap3.LEVEL, attributes=list(fetches))
-            fetched = LdapFetch.from_entries(self._db.entries)
+            fetched = self._search(self._dn, self._class_filter, ldap3.LEVEL, list(fetches))
         except LDAPExceptionError as e:
             raise FalconLdapError(e)
+        if columns:
+            return view.get_columns(fetched)
         return view.get(fetched)
 
     def _get_entry(self, view: Union[ViewList, ViewDetails], primary_key: str) -> Dict[str, Any]:
         fetches: Set[str] = set()
         view.get_fetch(fetches)
         try:
-            self._db.search(self.get_dn(primary_key), "(objectClass=*)", search_scope=ldap3.BASE, attributes=list(fetches))
-            fetched = LdapFetch.from_entry(self._db.entries[0])
+            fetched = self._search(self.get_dn(primary_key), "(objectClass=*)", ldap3.BASE, list(fetches))[0]
         except LDAPNoSuchObjectResult:
             raise falcon.HTTPNotFound()
         except LDAPExceptionError as e:
@@ -183,6 +233,7 @@ class View:
         raise ValueError("Invalid value for view: {}".format(view))
 
     def _update(self, view: ViewDetails, primary_key: str, assignments: Dict[str, Dict[str, Any]]):
+        view.validate(assignments, False)
         dn = self.get_dn(primary_key)
         fetches: Set[str] = set()
         view.set_fetch(fetches, assignments)
@@ -202,6 +253,7 @@ class View:
                 raise falcon.HTTPNotFound()
             except LDAPExceptionError as e:
                 raise FalconLdapError(e)
+            self._written(dn, modlist)
         view.set_post(fetched, assignments, False)
 
     def resolve_primary_key_by_mail(self, mail: str) -> str:
@@ -209,16 +261,35 @@ class View:
             raise ValueError("'user.auth' view does not have 'mail'")
         try:
             mail_filter = self._mail_filter.format(ldap3.utils.conv.escape_filter_chars(mail))
-            self._db.search(self._dn, mail_filter, search_scope=ldap3.LEVEL, attributes=[self._primary_key])
+            fetched = self._search(self._dn, mail_filter, ldap3.LEVEL, [self._primary_key])
             try:
-                return self._db.entries[0].entry_attributes_as_dict.get(self._primary_key)[0]
-            except (KeyError, IndexError):
+                return fetched[0].values.get(self._primary_key)[0]
+            except (KeyError, IndexError, TypeError):
                 raise falcon.HTTPNotFound()
         except LDAPNoSuchObjectResult:
             raise falcon.HTTPNotFound()
         except LDAPExceptionError as e:
             raise FalconLdapError(e)
 
+    def get_modified_since(self, since: datetime) -> List[Tuple[str, datetime]]:
+        """Gets the primary keys and modification timestamps (UTC) of the entries modified at or after `since`."""
+        since = since.astimezone(timezone.utc) if since.tzinfo is not None else since
+        modified_filter = self._class_filter[:-1] + "(modifyTimestamp>={}))".format(since.strftime('%Y%m%d%H%M%SZ'))
+        try:
+            self._db.search(
+                self._dn, modified_filter, search_scope=ldap3.LEVEL, attributes=[self._primary_key, 'modifyTimestamp']
+            )
+        except LDAPExceptionError as e:
+            raise FalconLdapError(e)
+        modified = []
+        for entry in self._db.entries:
+            values = entry.entry_attributes_as_dict
+            timestamp: datetime = values['modifyTimestamp'][0]
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            modified.append((values[self._primary_key][0], timestamp.astimezone(timezone.utc)))
+        return modified
+
     def create_register(self, assignments: Dict[str, Dict[str, Any]]):
         self._create(self._register_view, assignments)
 
@@ -230,6 +301,11 @@ class View:
         self._check_permissions(user, writing=False)
         return self._list(self._list_view)
 
+    def get_list_columns(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        """Gets the list in the columnar format (see `ViewList.get_columns`)."""
+        self._check_permissions(user, writing=False)
+        return self._list(self._list_view, columns=True)
+
     def get_list_entry_permitted(self, primary_key: str) -> Dict[str, Any]:
         return self._get_entry(self._list_view, primary_key)
 
@@ -247,6 +323,15 @@ class View:
     def get_auth_entry(self, primary_key: str) -> Dict[str, Any]:
         return self._get_entry(self._auth_view, primary_key)
 
+    def get_auth_group_views(self) -> List['View']:
+        """Gets the views of the groups the auth entry is derived from (e.g. the permissions)."""
+        views: List[View] = []
+        if self._auth_view is not None:
+            for field in self._auth_view.fields:
+                if isinstance(field, ViewFieldIsMemberOf) and field.foreign_view not in views:
+                    views.append(field.foreign_view)
+        return views
+
     def update_self(self, user: Dict[str, Any], assignments: Dict[str, Dict[str, Any]]):
         self._update(self._self_view, user['primaryKey'], assignments)
 
@@ -256,21 +341,25 @@ class View:
 
     def delete(self, user: Dict[str, Any], primary_key: str):
         self._check_permissions(user, writing=True)
+        dn = self.get_dn(primary_key)
         try:
-            self._db.delete(self.get_dn(primary_key))
+            self._db.delete(dn)
         except LDAPNoSuchObjectResult:
             raise falcon.HTTPNotFound()
         except LDAPExceptionError as e:
             raise FalconLdapError(e)
+        self._written(dn, None)
 
     def save_foreign_field(self, primary_key: str, modlist: Any):
         if modlist:
+            dn = self.get_dn(primary_key)
             try:
-                self._db.modify(self.get_dn(primary_key), modlist)
+                self._db.modify(dn, modlist)
             except LDAPNoSuchObjectResult:
                 raise falcon.HTTPNotFound()
             except LDAPExceptionError as e:
                 raise FalconLdapError(e)
+            self._written(dn, modlist)
 
     def get_dn(self, primary_key: str) -> str:
         return self._primary_key + "=" + ldap3.utils.dn.escape_rdn(primary_key) + "," + self._dn
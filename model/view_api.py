@@ -1,17 +1,25 @@
 from collections import OrderedDict
-from typing import Dict, Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Callable, Any, Tuple, Optional
 
 import falcon
 
+from model.cache import Cache, LISTS_TAG
 from model.db import DatabaseFactory
+from model.http_helper import SerializedMedia
 from model.view import View
 
 TokenGeneratorFn = Callable[[str], Dict[str, Any]]
 
 
 class ViewListApi:
-    def __init__(self, view: View):
+    admission = {
+        'GET': 'list'
+    }
+
+    def __init__(self, view: View, cache: Optional[Cache] = None):
         self.view = view
+        self.cache = cache
 
     def on_get(self, req: falcon.Request, resp: falcon.Response):
         """List view"""
@@ -19,8 +27,41 @@ class ViewListApi:
         if user is None:
             raise falcon.HTTPForbidden()
 
-        resp.media = self.view.get_list(user)
-        resp.status = falcon.HTTP_200
+        if self.cache is None:
+            resp.media = self.list_getter(req)(user)
+            resp.status = falcon.HTTP_200
+            return
+        resp.cache_control = ['private', 'no-cache']
+        self.cached_list(req, resp, user).write(req, resp)
+
+    def list_getter(self, req: falcon.Request) -> Callable[[Dict[str, Any]], Any]:
+        """Gets the list by the `format` parameter: `objects` (default) or `columns`."""
+        list_format = req.get_param('format', default='objects')
+        if list_format == 'objects':
+            return self.view.get_list
+        if list_format == 'columns':
+            return self.view.get_list_columns
+        raise falcon.HTTPInvalidParam("Must be 'objects' or 'columns'", 'format')
+
+    def cached_list(self, req: falcon.Request, resp: falcon.Response, user: Dict[str, Any]) -> SerializedMedia:
+        """Gets the list serialized for the response type, from the cache unless a write invalidated it."""
+        getter = self.list_getter(req)
+        self.view.check_read_permission(user)
+
+        def load() -> SerializedMedia:
+            response = SerializedMedia(getter(user))
+            response.serialized(resp)
+            # Only the serialized list is cached
+            response.media = None
+            return response
+
+        key = 'list:{}:{}:{}'.format(self.view.key, req.get_param('format', default='objects'), resp.content_type)
+        response = self.cache.get_or_load(key, LISTS_TAG, load)
+        # Shared backends store a copy, store the compressed bodies as well for the other workers
+        resp.context['compression_cache_written'] = lambda: self.cache.write_back(
+            key, response, lambda cached: cached.etags == response.etags
+        )
+        return response
 
     def on_post(self, req: falcon.Request, resp: falcon.Response):
         """Create a new user. Requires admin permissions."""
@@ -103,30 +144,83 @@ class ViewDetailSelfApi:
 
 
 class UserConfigApi:
+    """
+    Gets the config of all views for the user. It only depends on the permission flags of the user, thus the response
+    is serialized once per combination of flags, on the first request with it.
+    """
+
     def __init__(self, views: Dict[str, View]):
         self.views = views
+        self.permissions = sorted(set().union(*(view.permission_keys for view in views.values())))
+        # Flags -> response, filled on demand (2^permissions combinations are possible, few occur)
+        self.responses: Dict[Tuple[bool, ...], SerializedMedia] = {}
+
+    def _serialize(self, flags: Tuple[bool, ...]) -> SerializedMedia:
+        user = dict(zip(self.permissions, flags))
+        return SerializedMedia([view.user_config(user) for view in self.views.values()])
+
+    def response(self, user: Dict[str, Any]) -> SerializedMedia:
+        flags = tuple(bool(user.get(permission)) for permission in self.permissions)
+        response = self.responses.get(flags)
+        if response is None:
+            # Concurrent first requests may both serialize, the first stored response is kept
+            response = self.responses.setdefault(flags, self._serialize(flags))
+        return response
 
     def on_get(self, req: falcon.Request, resp: falcon.Response):
         user = req.context.get('user')
         if user is None:
             raise falcon.HTTPForbidden()
 
-        resp.media = [view.user_config(user) for view in self.views.values()]
-        resp.status = falcon.HTTP_200
+        resp.cache_control = ['private', 'no-cache']
+        self.response(user).write(req, resp)
 
     def register(self, app: falcon.API):
         app.add_route('/config', self)
 
 
 class ViewsApi:
-    def __init__(self, db: DatabaseFactory, config: dict):
+    def __init__(
+            self, db: DatabaseFactory, config: dict, container_check: str = 'concurrent', cache: Optional[Cache] = None
+    ):
+        """
+        Creates all views.
+
+        Args:
+            db: The database factory.
+            config: The views configuration.
+            container_check: When to check (and create) the containers of the views. One of 'concurrent' (on
+                startup, all views at once), 'sequential' (on startup, one view after another) or 'lazy' (on first
+                directory access of each view).
+            cache: Caches the serialized lists, if given. Any write invalidates all lists (e.g. group memberships are
+                shown in the user list).
+        """
         self.views = OrderedDict((key, View(db, key, view_cfg)) for key, view_cfg in config.items())
         for view in self.views.values():
             view.init(self.views)
+        self.cache = cache
+        if cache is not None:
+            for view in self.views.values():
+                view.write_observers.append(lambda dn, changes: cache.invalidate(LISTS_TAG))
+
+        if container_check == 'concurrent':
+            def check(view: View):
+                try:
+                    view.ensure_container()
+                finally:
+                    db.release()
+
+            with ThreadPoolExecutor(max_workers=max(len(self.views), 1)) as executor:
+                list(executor.map(check, self.views.values()))
+        elif container_check == 'sequential':
+            for view in self.views.values():
+                view.ensure_container()
+        elif container_check != 'lazy':
+            raise ValueError("Invalid containerCheck {}".format(container_check))
 
     def register(self, app: falcon.API, token_generator: TokenGeneratorFn):
         for key, view in self.views.items():
-            ViewListApi(view).register(app)
+            ViewListApi(view, self.cache).register(app)
             ViewDetailApi(view, token_generator).register(app)
             if view.has_self:
                 ViewDetailSelfApi(view, token_generator).register(app)
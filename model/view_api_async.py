@@ -0,0 +1,129 @@
+from typing import Dict, Optional
+
+import falcon
+import falcon.asgi
+
+from model.cache import Cache
+from model.db_async import AsyncDatabaseBridge
+from model.view import View
+from model.view_api import (
+    ViewListApi, ViewDetailApi, ViewDetailSelfApi, UserConfigApi, ViewsApi, TokenGeneratorFn
+)
+
+
+class AsyncViewListApi(ViewListApi):
+    def __init__(self, view: View, bridge: AsyncDatabaseBridge, cache: Optional[Cache] = None):
+        super().__init__(view, cache)
+        self.bridge = bridge
+
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        """List view"""
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        if self.cache is None:
+            resp.media = await self.bridge.run(self.list_getter(req), user)
+            resp.status = falcon.HTTP_200
+            return
+        resp.cache_control = ['private', 'no-cache']
+        response = await self.bridge.run(self.cached_list, req, resp, user)
+        response.write(req, resp)
+
+    async def on_post(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        """Create a new user. Requires admin permissions."""
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        await self.bridge.run(self.view.create_detail, user, await req.get_media())
+        resp.status = falcon.HTTP_200
+
+
+class AsyncViewDetailApi(ViewDetailApi):
+    def __init__(self, view: View, token_generator: TokenGeneratorFn, bridge: AsyncDatabaseBridge):
+        super().__init__(view, token_generator)
+        self.bridge = bridge
+
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response, primary_key: str):
+        """Get detail view."""
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        resp.media = await self.bridge.run(self.view.get_detail_entry, user, primary_key)
+        resp.status = falcon.HTTP_200
+
+    async def on_patch(self, req: falcon.asgi.Request, resp: falcon.asgi.Response, primary_key: str):
+        """Write attributes."""
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        await self.bridge.run(self.view.update_details, user, primary_key, await req.get_media())
+        if primary_key == user['primaryKey']:
+            resp.media = await self.bridge.run(self.token_generator, user['primaryKey'])
+        resp.status = falcon.HTTP_200
+
+    async def on_delete(self, req: falcon.asgi.Request, resp: falcon.asgi.Response, primary_key: str):
+        """Delete entity."""
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        await self.bridge.run(self.view.delete, user, primary_key)
+        resp.status = falcon.HTTP_200
+
+
+class AsyncViewDetailSelfApi(ViewDetailSelfApi):
+    """Modify self view."""
+
+    def __init__(self, view: View, token_generator: TokenGeneratorFn, bridge: AsyncDatabaseBridge):
+        super().__init__(view, token_generator)
+        self.bridge = bridge
+
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        resp.media = await self.bridge.run(self.view.get_self_entry, user)
+        resp.status = falcon.HTTP_200
+
+    async def on_patch(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        """Modify self user."""
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        await self.bridge.run(self.view.update_self, user, await req.get_media())
+        resp.media = await self.bridge.run(self.token_generator, user['primaryKey'])
+        resp.status = falcon.HTTP_200
+
+
+class AsyncUserConfigApi(UserConfigApi):
+    async def on_get(self, req: falcon.asgi.Request, resp: falcon.asgi.Response):
+        # Only a lookup of pre-serialized configuration, no need to leave the event loop
+        user = req.context.get('user')
+        if user is None:
+            raise falcon.HTTPForbidden()
+
+        resp.cache_control = ['private', 'no-cache']
+        self.response(user).write(req, resp)
+
+
+class AsyncViewsApi:
+    """Registers the async resources of all views of the given (already initialized) `ViewsApi`."""
+
+    def __init__(self, views: ViewsApi, bridge: AsyncDatabaseBridge):
+        self.views: Dict[str, View] = views.views
+        self.cache = views.cache
+        self.bridge = bridge
+
+    def register(self, app: falcon.asgi.App, token_generator: TokenGeneratorFn):
+        for key, view in self.views.items():
+            AsyncViewListApi(view, self.bridge, self.cache).register(app)
+            AsyncViewDetailApi(view, token_generator, self.bridge).register(app)
+            if view.has_self:
+                AsyncViewDetailSelfApi(view, token_generator, self.bridge).register(app)
+        AsyncUserConfigApi(self.views).register(app)
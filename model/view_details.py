@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from collections import OrderedDict
-from typing import List, Set, Dict, Any, Union, cast
+from typing import List, Set, Dict, Any, Union, Optional, cast
 
 import falcon
 
@@ -89,6 +89,19 @@ class ViewGroup(ABC):
         """
         pass
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Union[None, str, Dict[str, str]]:
+        """
+        Checks the assignments without any I/O, before the entry is fetched or written.
+
+        Args:
+            assignments: The requested assignments.
+            is_new: If true, a new object is about to be created
+
+        Returns:
+            None if valid, the error message of the view or the error messages by field key.
+        """
+        return None
+
     def set_post(self, fetches: LdapFetch, assignments: Dict[str, Any], is_new: bool):
         """
         Sets external values if needed.
@@ -113,6 +126,12 @@ class ViewGroupFields(ViewGroup):
             ('fields', [field.config for field in self.fields]),
         ]))
 
+        # Only fields overriding `validate` are checked
+        self._validated_fields: List[ViewField] = [
+            field for field in self.fields if type(field).validate is not ViewField.validate
+        ]
+        self._has_enabled = any(field.key == '_enabled' for field in self.fields)
+
     def init(self, all_views: Dict[str, 'model.view.View']):
         all_fields = {
             field.key: field
@@ -151,6 +170,17 @@ class ViewGroupFields(ViewGroup):
             except falcon.HTTPBadRequest as e:
                 raise HTTPBadRequestField(e.title, e.description, field.key)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[Dict[str, str]]:
+        if is_new and self._has_enabled and '_enabled' not in assignments:
+            # Created disabled, see `ViewFieldObjectClass.create`
+            assignments = dict(assignments, _enabled=False)
+        errors = OrderedDict()
+        for field in self._validated_fields:
+            error = field.validate(assignments, is_new)
+            if error is not None:
+                errors[field.key] = error
+        return errors or None
+
     def set_post(self, fetches: LdapFetch, assignments: Dict[str, Any], is_new: bool):
         for field in self.fields:
             try:
@@ -198,6 +228,11 @@ class ViewGroupMemberOf(ViewGroup):
         if len(assignments.get('add', [])) > 0 or len(assignments.get('delete', [])) > 0:
             fetches.add(self.field)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        if not self.writable and (assignments.get('add') or assignments.get('delete')):
+            return "Cannot write {}".format(self.key)
+        return None
+
     def set_post(self, fetches: LdapFetch, assignments: Dict[str, Any], is_new: bool):
         for add_ref in assignments.get('add', []):
             if not self.writable:
@@ -254,6 +289,13 @@ class ViewGroupMember(ViewGroup):
         if len(assignments.get('add', [])) > 0 or len(assignments.get('delete', [])) > 0:
             fetches.add(self.field)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        if is_new and assignments.get('delete'):
+            return "Cannot remove on creation"
+        if not self.writable and (assignments.get('add') or assignments.get('delete')):
+            return "Cannot {} {}".format('create' if is_new else 'write', self.key)
+        return None
+
     def set(self, fetches: LdapFetch, modlist: LdapModlist, assignments: Dict[str, Any]):
         add_dns = [add_dn for add_dn in self.foreign_view.get_dns(assignments.get('add', []))]
         if add_dns:
@@ -313,6 +355,36 @@ class ViewDetails:
 
         self.config = [view.config for view in self.views]
 
+    def validate(self, assignments: Dict[str, Dict[str, Any]], is_new: bool):
+        """
+        Checks all assignments before any I/O (fetching the entry, breach checks, hashing).
+
+        Raises:
+            HTTPBadRequestField: With the errors of all invalid fields (by view and field key).
+        """
+        if not isinstance(assignments, dict):
+            raise falcon.HTTPBadRequest(description="Expected an object of assignments")
+        errors: Dict[str, Union[str, Dict[str, str]]] = OrderedDict()
+        for view in self.views:
+            view_assignments = assignments.get(view.key)
+            if view_assignments is None:
+                continue
+            if not isinstance(view_assignments, dict):
+                errors[view.key] = "Expected an object"
+                continue
+            error = view.validate(view_assignments, is_new)
+            if error is not None:
+                errors[view.key] = error
+        if errors:
+            messages = [
+                message
+                for error in errors.values()
+                for message in (error.values() if isinstance(error, dict) else [error])
+            ]
+            e = HTTPBadRequestField(description="; ".join(messages))
+            e.field = errors
+            raise e
+
     def init(self, all_views: Dict[str, 'model.view.View']):
         for view in self.views:
             view.init(all_views)
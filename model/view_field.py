@@ -2,17 +2,26 @@ import string
 from abc import ABC, abstractmethod
 from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Set, List, Any, Optional, Pattern, Callable, Iterable, cast
+from typing import Dict, Set, List, Any, Optional, Pattern, Iterable, cast
 
-import dateutil.parser
 import falcon
 import passlib.hash
-import passlib.pwd
-import pwnedpasswords
 import regex
 
 import model
 from model.db import LdapModlist, LdapMods, LdapAddlist, LdapFetch
+from model.passwords import passwords
+
+
+# These modules are slow to import and only needed when writing, so they are imported on first use.
+def _isoparse(value: str) -> datetime:
+    import dateutil.parser
+    return dateutil.parser.isoparse(value)
+
+
+def _generate_password() -> str:
+    import passlib.pwd
+    return passlib.pwd.genword('secure')
 
 
 class ViewField(ABC):
@@ -70,7 +79,6 @@ class ViewField(ABC):
         """
         ...
 
-    @abstractmethod
     def get(self, fetches: LdapFetch, results: Dict[str, Any]):
         """
         Called to get the json value of the field.
@@ -79,6 +87,23 @@ class ViewField(ABC):
             fetches: The fetched attributes.
             results: The results to write to.
         """
+        if not self.readable or not self._is_enabled(results):
+            return
+        value = self.get_value(fetches)
+        if value is not None:
+            results[self.key] = value
+
+    @abstractmethod
+    def get_value(self, fetches: LdapFetch) -> Any:
+        """
+        Gets the json value of the field, regardless of whether it is readable or enabled.
+
+        Args:
+            fetches: The fetched attributes.
+
+        Returns:
+            The value, None if the entry does not have a value.
+        """
         ...
 
     @abstractmethod
@@ -116,6 +141,36 @@ class ViewField(ABC):
         """
         pass
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        """
+        Checks the assignment of this field without any I/O, before the entry is fetched or written.
+
+        Args:
+            assignments: The requested assignments.
+            is_new: If true, a new object is about to be created
+
+        Returns:
+            The error message or None if valid.
+        """
+        return None
+
+    def _validate_presence(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        """Checks required, writable and creatable, returns the error message or None."""
+        if self.key not in assignments:
+            if is_new and self.required and self._is_enabled(assignments):
+                return "{} is required".format(self.key)
+            return None
+        if is_new:
+            if not self.creatable:
+                return "Cannot create {}".format(self.key)
+        elif not self._is_enabled(assignments):
+            return None
+        elif not self.writable:
+            return "Cannot write {}".format(self.key)
+        if self.required and not assignments[self.key]:
+            return "{} is required".format(self.key)
+        return None
+
     def set_post(self, fetches: LdapFetch, assignments: Dict[str, Any], is_new: bool):
         """
         Set external values.
@@ -156,11 +211,9 @@ class ViewFieldText(ViewField):
             return
         fetches.add(self.field)
 
-    def get(self, fetches: LdapFetch, results: Dict[str, Any]):
-        if not self.readable or not self._is_enabled(results):
-            return
-        if self.field in fetches.values and len(fetches.values[self.field]) > 0:
-            results[self.key] = fetches.values[self.field][0]
+    def get_value(self, fetches: LdapFetch) -> Any:
+        values = fetches.values.get(self.field)
+        return values[0] if values else None
 
     def set_fetch(self, fetches: Set[str], assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
@@ -171,6 +224,17 @@ class ViewFieldText(ViewField):
             raise falcon.HTTPBadRequest(description="Cannot write {}".format(self.key))
         fetches.add(self.field)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        error = self._validate_presence(assignments, is_new)
+        if error is not None or not assignments.get(self.key) or not self._is_enabled(assignments):
+            return error
+        value = assignments[self.key]
+        if not isinstance(value, str) or not self.format.fullmatch(value):
+            return "Invalid value {} for {}, expecting {}".format(value, self.key, self.format_message)
+        if self.enum_values is not None and value not in self.enum_values:
+            return "Value for {} must be one of: {}".format(self.key, ", ".join(self.enum_values))
+        return None
+
     def set(self, fetches: LdapFetch, modlist: LdapModlist, assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
             return
@@ -258,11 +322,9 @@ class ViewFieldDateTime(ViewField):
             return
         fetches.add(self.field)
 
-    def get(self, fetches: LdapFetch, results: Dict[str, Any]):
-        if not self.readable or not self._is_enabled(results):
-            return
-        if self.field in fetches.values and len(fetches.values[self.field]) > 0:
-            results[self.key] = cast(datetime, fetches.values[self.field][0]).isoformat()
+    def get_value(self, fetches: LdapFetch) -> Any:
+        values = fetches.values.get(self.field)
+        return cast(datetime, values[0]).isoformat() if values else None
 
     def set_fetch(self, fetches: Set[str], assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
@@ -273,6 +335,15 @@ class ViewFieldDateTime(ViewField):
             raise falcon.HTTPBadRequest(description="Cannot write {}".format(self.key))
         fetches.add(self.field)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        error = self._validate_presence(assignments, is_new)
+        if error is not None or not assignments.get(self.key) or not self._is_enabled(assignments):
+            return error
+        value = assignments[self.key]
+        if not isinstance(value, str) or not self.format.fullmatch(value):
+            return "Invalid value {} for {}, expecting {}".format(value, self.key, self.formatMessage)
+        return None
+
     def set(self, fetches: LdapFetch, modlist: LdapModlist, assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
             return
@@ -292,9 +363,9 @@ class ViewFieldDateTime(ViewField):
         elif self.field in fetches.values:
             fetch_val = fetches.values[self.field]
             if len(fetch_val) != 1 or fetch_val[0] != value:
-                modlist[self.field] = [(LdapMods.REPLACE, [dateutil.parser.isoparse(value)])]
+                modlist[self.field] = [(LdapMods.REPLACE, [_isoparse(value)])]
         else:
-            modlist[self.field] = [(LdapMods.ADD, [dateutil.parser.isoparse(value)])]
+            modlist[self.field] = [(LdapMods.ADD, [_isoparse(value)])]
         fetches.values[self.field] = [value]
 
     def create(self, fetches: LdapFetch, addlist: LdapAddlist, assignments: Dict[str, Any]):
@@ -314,8 +385,8 @@ class ViewFieldDateTime(ViewField):
             raise falcon.HTTPBadRequest(description="Cannot modify value")
         if not value and self.required:
             raise falcon.HTTPBadRequest(description="{} is required".format(self.key))
-        addlist[self.field] = [dateutil.parser.isoparse(value)]
-        fetches.values[self.field] = [dateutil.parser.isoparse(value)]
+        addlist[self.field] = [_isoparse(value)]
+        fetches.values[self.field] = [_isoparse(value)]
 
 
 class ViewFieldPassword(ViewField):
@@ -326,7 +397,9 @@ class ViewFieldPassword(ViewField):
 
         self.field: str = config.get('field', self.key)
         self.auto_generate: bool = config.get('autoGenerate', False)
-        self.hashing: Optional[Callable[[str], str]] = getattr(passlib.hash, 'ldap_' + config['hashing']).hash
+        if not hasattr(passlib.hash, 'ldap_' + config['hashing']):
+            raise ValueError("Invalid hashing {}".format(config['hashing']))
+        self.hashing: str = config['hashing']
         self.pwned_password_check: bool = config.get('pwnedPasswordCheck', False)
 
         self.config.update(OrderedDict([
@@ -340,14 +413,14 @@ class ViewFieldPassword(ViewField):
             return
         fetches.add(self.field)
 
-    def get(self, fetches: LdapFetch, results: Dict[str, Any]):
-        if not self.readable or not self._is_enabled(results):
-            return
-        if self.field in fetches.values and len(fetches.values[self.field]) > 0:
-            passwd = fetches.values[self.field][0]
-            if isinstance(passwd, bytes):
-                passwd = passwd.decode()
-            results[self.key] = passwd
+    def get_value(self, fetches: LdapFetch) -> Any:
+        values = fetches.values.get(self.field)
+        if not values:
+            return None
+        passwd = values[0]
+        if isinstance(passwd, bytes):
+            passwd = passwd.decode()
+        return passwd
 
     def set_fetch(self, fetches: Set[str], assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
@@ -358,21 +431,31 @@ class ViewFieldPassword(ViewField):
             raise falcon.HTTPBadRequest(description="Cannot write {}".format(self.key))
         fetches.add(self.field)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        error = self._validate_presence(assignments, is_new)
+        if error is not None and self.auto_generate and is_new and self.key in assignments:
+            # An empty password is generated
+            return None if self.creatable else error
+        if error is not None or self.key not in assignments or not self._is_enabled(assignments):
+            return error
+        value = assignments[self.key]
+        if value is not None and not isinstance(value, str):
+            return "Invalid value for {}".format(self.key)
+        if self.pwned_password_check and value and passwords.is_breached(value):
+            return "Password is in list of leaked passwords, not accepted"
+        return None
+
     def set(self, fetches: LdapFetch, modlist: LdapModlist, assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
             return
         if not self.writable:
             raise falcon.HTTPBadRequest(description="Cannot write {}".format(self.key))
         if self.auto_generate and not assignments[self.key]:
-            str_value = passlib.pwd.genword('secure')
+            str_value = _generate_password()
         else:
             str_value = assignments[self.key]
 
-        if self.pwned_password_check:
-            if pwnedpasswords.check(str_value, plain_text=True):
-                raise falcon.HTTPBadRequest(description="Password is in list of leaked passwords, not accepted")
-
-        value = self.hashing(str_value)
+        value = passwords.hash(self.hashing, str_value)
         if not value:
             if self.required and self._is_enabled(assignments):
                 raise falcon.HTTPBadRequest(description="{} is required".format(self.key))
@@ -394,15 +477,11 @@ class ViewFieldPassword(ViewField):
         if not self.creatable:
             raise falcon.HTTPBadRequest(description="Cannot create {}".format(self.key))
         if self.auto_generate and not assignments[self.key]:
-            str_value = passlib.pwd.genword('secure')
+            str_value = _generate_password()
         else:
             str_value = assignments[self.key]
 
-        if self.pwned_password_check:
-            if pwnedpasswords.check(str_value, plain_text=True):
-                raise falcon.HTTPBadRequest(description="Password is in list of leaked passwords, not accepted")
-
-        value = self.hashing(str_value)
+        value = passwords.hash(self.hashing, str_value)
         if self.field in fetches.values:
             raise falcon.HTTPBadRequest("Cannot modify value")
         if not value and self.required:
@@ -455,11 +534,9 @@ class ViewFieldGenerate(ViewField):
             return
         fetches.add(self.field)
 
-    def get(self, fetches: LdapFetch, results: Dict[str, Any]):
-        if not self.readable or not self._is_enabled(results):
-            return
-        if self.field in fetches.values and len(fetches.values[self.field]) > 0:
-            results[self.key] = fetches.values[self.field][0]
+    def get_value(self, fetches: LdapFetch) -> Any:
+        values = fetches.values.get(self.field)
+        return values[0] if values else None
 
     def set_fetch(self, fetches: Set[str], assignments: Dict[str, Any]):
         if self.key in assignments:
@@ -471,6 +548,11 @@ class ViewFieldGenerate(ViewField):
                 input_field.get_fetch(fetches)
             fetches.add(self.field)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        if self.key in assignments:
+            return "Cannot assign value to generated field {}".format(self.key)
+        return None
+
     def set(self, fetches: LdapFetch, modlist: LdapModlist, assignments: Dict[str, Any]):
         if self.key in assignments:
             raise falcon.HTTPBadRequest(description="Cannot assign value to generated field {}".format(self.key))
@@ -544,11 +626,8 @@ class ViewFieldIsMemberOf(ViewField):
             return
         fetches.add(self.field)
 
-    def get(self, fetches: LdapFetch, results: Dict[str, Any]):
-        if not self.readable or not self._is_enabled(results):
-            return
-        
-        results[self.key] = self.member_of_dn in fetches.values.get(self.field, ())
+    def get_value(self, fetches: LdapFetch) -> Any:
+        return self.member_of_dn in fetches.values.get(self.field, ())
 
     def set_fetch(self, fetches: Set[str], assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
@@ -561,6 +640,15 @@ class ViewFieldIsMemberOf(ViewField):
             raise falcon.HTTPBadRequest(description="Cannot write {}".format(self.key))
         fetches.add(self.field)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        if is_new and self.key in assignments:
+            if not self.creatable and not self.writable:
+                return "Cannot write {}".format(self.key)
+            if self.required and not assignments[self.key] and self._is_enabled(assignments):
+                return "{} is required".format(self.key)
+            return None
+        return self._validate_presence(assignments, is_new)
+
     def set_post(self, fetches: LdapFetch, assignments: Dict[str, Any], is_new: bool):
         if self.key not in assignments:
             if is_new and self.required and self._is_enabled(assignments):
@@ -612,12 +700,20 @@ class ViewFieldInitial(ViewField):
     def get(self, fetches: LdapFetch, results: Dict[str, Any]):
         pass
 
+    def get_value(self, fetches: LdapFetch) -> Any:
+        return None
+
     def set_fetch(self, fetches: Set[str], assignments: Dict[str, Any]):
         pass
 
     def set(self, fetches: LdapFetch, modlist: LdapModlist, assignments: Dict[str, Any]):
         pass
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        if assignments.get(self.key):
+            return "Cannot assign {}".format(self.key)
+        return None
+
     def create(self, fetches: LdapFetch, addlist: LdapAddlist, assignments: Dict[str, Any]):
         if assignments[self.key]:
             raise falcon.HTTPBadRequest("Cannot assign {}".format(self.key))
@@ -653,11 +749,8 @@ class ViewFieldObjectClass(ViewField):
             return
         fetches.add(self.field)
 
-    def get(self, fetches: LdapFetch, results: Dict[str, Any]):
-        if not self.readable or not self._is_enabled(results):
-            return
-
-        results[self.key] = self.object_class in fetches.values.get(self.field, ())
+    def get_value(self, fetches: LdapFetch) -> Any:
+        return self.object_class in fetches.values.get(self.field, ())
 
     def set_fetch(self, fetches: Set[str], assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
@@ -670,6 +763,9 @@ class ViewFieldObjectClass(ViewField):
             raise falcon.HTTPBadRequest(description="Cannot write {}".format(self.key))
         fetches.add(self.field)
 
+    def validate(self, assignments: Dict[str, Any], is_new: bool) -> Optional[str]:
+        return self._validate_presence(assignments, is_new)
+
     def set(self, fetches: LdapFetch, modlist: LdapModlist, assignments: Dict[str, Any]):
         if self.key not in assignments or not self._is_enabled(assignments):
             if self.key == '_enabled':
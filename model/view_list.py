@@ -1,7 +1,7 @@
 from collections import OrderedDict
-from typing import List, Set, Dict, Any
+from typing import List, Set, Dict, Any, Iterator, Optional
 
-from model.view_field import ViewField, view_field_types
+from model.view_field import ViewField, ViewFieldInitial, view_field_types
 from model.db import LdapFetch
 import model
 
@@ -16,6 +16,16 @@ class ViewList:
 
         self.config = [field.config for field in self.fields]
 
+        # Plan of the columnar format: the fields having a value, like the objects the fields after `_enabled` are
+        # empty for disabled entries
+        self.columns: List[ViewField] = [
+            field for field in self.fields if field.readable and not isinstance(field, ViewFieldInitial)
+        ]
+        self.column_keys: List[str] = [field.key for field in self.columns]
+        self._enabled_column: Optional[int] = (
+            self.column_keys.index('_enabled') if '_enabled' in self.column_keys else None
+        )
+
     def init(self, all_views: Dict[str, 'model.view.View']):
         all_fields = {
             field.key: field
@@ -36,3 +46,29 @@ class ViewList:
                 field.get(entity, res)
             results.append(res)
         return results
+
+    def get_rows(self, fetches: List[LdapFetch]) -> Iterator[List[Any]]:
+        """
+        Gets the values of the entries in the order of `column_keys`, values after `_enabled` of disabled entries are
+        None.
+        """
+        columns = self.columns
+        enabled_column = self._enabled_column
+        if enabled_column is None:
+            for entity in fetches:
+                yield [field.get_value(entity) for field in columns]
+            return
+        enabled_field = columns[enabled_column]
+        disabled_columns = len(columns) - enabled_column - 1
+        for entity in fetches:
+            if enabled_field.get_value(entity):
+                yield [field.get_value(entity) for field in columns]
+            else:
+                row: List[Any] = [field.get_value(entity) for field in columns[:enabled_column]]
+                row.append(False)
+                row.extend([None] * disabled_columns)
+                yield row
+
+    def get_columns(self, fetches: List[LdapFetch]) -> Dict[str, Any]:
+        """Gets the entries in the columnar format: the keys once and the values of every entry as array."""
+        return {'columns': self.column_keys, 'rows': list(self.get_rows(fetches))}
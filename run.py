@@ -1,24 +1,24 @@
-import logging
 import os
-from wsgiref.simple_server import make_server
+import signal
+import threading
 
+import serve
 
-def main():
-    import server
 
-    with make_server('localhost', 8000, server.app) as httpd:
-        logging.info("Server up at localhost:8000")
-        httpd.serve_forever()
-
-
-if __name__ == '__main__':
+def watch_reload():
+    """Gracefully reloads the server (see `serve`) whenever a source file changes."""
     import watchgod
 
-
     class PythonConfigWatcher(watchgod.DefaultDirWatcher):
         ignored_dirs = watchgod.DefaultDirWatcher.ignored_dirs | {'venv'}
 
         def should_watch_file(self, entry):
             return entry.name.endswith(('.py', '.pyx', '.pyd', '.yaml'))
 
-    watchgod.run_process(os.getcwd(), main, watcher_cls=PythonConfigWatcher)
+    for _ in watchgod.watch(os.getcwd(), watcher_cls=PythonConfigWatcher):
+        os.kill(os.getpid(), signal.SIGHUP)
+
+
+if __name__ == '__main__':
+    threading.Thread(target=watch_reload, daemon=True).start()
+    serve.main(['--bind', 'localhost:8000', '--workers', '1', '--threads', '4'])
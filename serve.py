@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+"""
+Prefork WSGI server.
+
+The master imports the app once, freezes the garbage collector (such that the memory of the loaded app stays shared
+copy-on-write between the workers) and forks the workers. Each worker accepts connections on the shared listening
+socket and serves them on a pool of threads, with HTTP/1.1 keep-alive.
+
+Signals of the master:
+ * SIGHUP: Graceful reload. The master re-executes itself (keeping the listening socket), loads the app again, starts
+   new workers and then stops the old workers after they finished their in-flight requests.
+ * SIGTERM, SIGINT: Graceful shutdown.
+
+Usage: python serve.py [--bind 0.0.0.0:8000] [--workers 2] [--threads 8] [--backlog 2048] [--keep-alive 5]
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, ServerHandler
+
+_ENV_LISTEN_FD = 'SERVE_LISTEN_FD'
+_ENV_OLD_WORKERS = 'SERVE_OLD_WORKERS'
+
+
+class _RequestBody:
+    """Limits reading the request body to its content length, such that the rest can be skipped afterwards."""
+
+    def __init__(self, rfile, length: int):
+        self._rfile = rfile
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._rfile.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._rfile.readline(size)
+        self._remaining -= len(data)
+        return data
+
+    def readlines(self, hint: int = -1) -> List[bytes]:
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        while self._remaining > 0 and self.read(min(self._remaining, 65536)):
+            pass
+
+
+class _KeepAliveServerHandler(ServerHandler):
+    http_version = '1.1'
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+        if 'Content-Length' not in self.headers:
+            # Cannot delimit the response otherwise
+            self.request_handler.close_connection = True
+        if self.request_handler.close_connection:
+            self.headers['Connection'] = 'close'
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """Handles multiple requests per connection. The `timeout` is the idle time before a connection is closed."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and not self.server.stopping:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = True
+            return
+
+        if not self.parse_request():  # An error code has been sent, just exit
+            self.close_connection = True
+            return
+
+        if self.headers.get('Transfer-Encoding', 'identity').lower() != 'identity':
+            self.send_error(411)
+            self.close_connection = True
+            return
+
+        body = _RequestBody(self.rfile, int(self.headers.get('Content-Length') or 0))
+        handler = _KeepAliveServerHandler(
+            body, self.wfile, self.get_stderr(), self.get_environ(),
+            multithread=True,
+        )
+        handler.request_handler = self      # backpointer for logging
+        handler.run(self.server.get_app())
+        body.drain()
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+class PoolWSGIServer(WSGIServer):
+    """WSGI server on an existing listening socket, serving each connection on a bounded pool of threads."""
+
+    def __init__(self, listen_socket: socket.socket, threads: int, keep_alive: float):
+        handler_class = type('RequestHandler', (KeepAliveRequestHandler,), {'timeout': keep_alive})
+        super().__init__(listen_socket.getsockname()[:2], handler_class, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listen_socket
+        self.server_name = socket.getfqdn(self.server_address[0])
+        self.server_port = self.server_address[1]
+        self.setup_environ()
+        self.stopping = False
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+        # Stop accepting while all threads are busy, such that another worker can accept the connection
+        self._slots = threading.BoundedSemaphore(threads)
+        self.threads = threads
+        # Connections being served, equal to `threads` while the pool is saturated
+        self.active = 0
+        self._active_lock = threading.Lock()
+
+    def server_bind(self):
+        pass
+
+    def server_activate(self):
+        pass
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        with self._active_lock:
+            self.active += 1
+        self._executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._active_lock:
+                self.active -= 1
+            self._slots.release()
+
+    def server_close(self):
+        # The listening socket belongs to the master
+        self._executor.shutdown(wait=True)
+
+
+class PreforkServer:
+    def __init__(
+            self, app_loader: Callable[[], Callable], bind: Tuple[str, int], workers: int, threads: int,
+            backlog: int, keep_alive: float, graceful_timeout: float = 30,
+    ):
+        self.app_loader = app_loader
+        self.bind = bind
+        self.worker_count = workers
+        self.threads = threads
+        self.backlog = backlog
+        self.keep_alive = keep_alive
+        self.graceful_timeout = graceful_timeout
+
+        self.app: Optional[Callable] = None
+        self.socket: Optional[socket.socket] = None
+        self.workers: Dict[int, float] = {}
+        self._reload = False
+        self._stop = False
+
+    def _listen(self) -> socket.socket:
+        inherited_fd = os.environ.pop(_ENV_LISTEN_FD, None)
+        if inherited_fd is not None:
+            return socket.socket(fileno=int(inherited_fd))
+        sock = socket.socket(socket.AF_INET6 if ':' in self.bind[0] else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.bind)
+        sock.listen(self.backlog)
+        return sock
+
+    def _load(self):
+        self.app = self.app_loader()
+        # Everything allocated so far is shared with the workers, don't let the gc touch (and thus copy) it.
+        gc.collect()
+        gc.freeze()
+
+    def _spawn_worker(self):
+        pid = os.fork()
+        if pid != 0:
+            self.workers[pid] = time.monotonic()
+            return
+        # Worker process
+        exit_code = 0
+        try:
+            self._run_worker()
+        except BaseException:
+            logging.exception("Worker failed")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _run_worker(self):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        self.socket.setblocking(False)
+        server = PoolWSGIServer(self.socket, self.threads, self.keep_alive)
+        server.set_app(self.app)
+
+        def stop(signum, frame):
+            server.stopping = True
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        logging.info("Worker %d serving", os.getpid())
+        server.serve_forever(poll_interval=0.5)
+        server.server_close()
+
+    def _stop_workers(self, pids: List[int]):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    remaining.discard(pid)
+                    self.workers.pop(pid, None)
+            time.sleep(0.05)
+        for pid in remaining:
+            logging.warning("Killing worker %d", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.workers.pop(pid, None)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.workers:
+                logging.warning("Worker %d exited with status %d", pid, status)
+                del self.workers[pid]
+
+    def _exec_reload(self):
+        logging.info("Reloading")
+        self.socket.set_inheritable(True)
+        os.environ[_ENV_LISTEN_FD] = str(self.socket.fileno())
+        os.environ[_ENV_OLD_WORKERS] = ",".join(str(pid) for pid in self.workers)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def run(self):
+        self.socket = self._listen()
+        old_workers = [int(pid) for pid in os.environ.pop(_ENV_OLD_WORKERS, '').split(',') if pid]
+        try:
+            self._load()
+        except Exception:
+            if not old_workers:
+                raise
+            # Keep serving with the previous code
+            logging.exception("Reload failed, keeping the old workers")
+            self.workers = {pid: time.monotonic() for pid in old_workers}
+            old_workers = []
+
+        def on_reload(signum, frame):
+            self._reload = True
+
+        def on_stop(signum, frame):
+            self._stop = True
+
+        signal.signal(signal.SIGHUP, on_reload)
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+
+        logging.info("Listening at %s:%d", *self.socket.getsockname()[:2])
+        if self.app is not None:
+            for _ in range(self.worker_count):
+                self._spawn_worker()
+        if old_workers:
+            self._stop_workers(old_workers)
+
+        while not self._stop:
+            if self._reload:
+                self._reload = False
+                self._exec_reload()
+            self._reap()
+            if self.app is not None:
+                while len(self.workers) < self.worker_count:
+                    self._spawn_worker()
+            time.sleep(0.2)
+
+        logging.info("Shutting down")
+        self._stop_workers(list(self.workers))
+        self.socket.close()
+
+
+def import_app(name: str) -> Callable[[], Callable]:
+    """Returns a loader for an app given as 'module:attribute'."""
+    module_name, attribute = name.split(':', 1)
+
+    def load():
+        return getattr(importlib.import_module(module_name), attribute)
+    return load
+
+
+def parse_bind(bind: str) -> Tuple[str, int]:
+    host, port = bind.rsplit(':', 1)
+    return host.strip('[]'), int(port)
+
+
+def main(argv: List[str] = None, app: str = 'server:app'):
+    from config import config
+    cfg = config['server'] if 'server' in config else {}
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default=app, help="WSGI app as module:attribute")
+    parser.add_argument('--bind', default=cfg.get('bind', '0.0.0.0:8000'), help="host:port to listen on")
+    parser.add_argument('--workers', type=int, default=cfg.get('workers', 2), help="Number of worker processes")
+    parser.add_argument('--threads', type=int, default=cfg.get('threads', 8), help="Threads per worker")
+    parser.add_argument('--backlog', type=int, default=cfg.get('backlog', 2048), help="Listen backlog")
+    parser.add_argument(
+        '--keep-alive', type=float, default=cfg.get('keepAlive', 5), help="Idle seconds before closing a connection"
+    )
+    parser.add_argument(
+        '--graceful-timeout', type=float, default=cfg.get('gracefulTimeout', 30),
+        help="Seconds to wait for in-flight requests when stopping workers"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    PreforkServer(
+        import_app(args.app), parse_bind(args.bind), workers=args.workers, threads=args.threads,
+        backlog=args.backlog, keep_alive=args.keep_alive, graceful_timeout=args.graceful_timeout,
+    ).run()
+
+
+if __name__ == '__main__':
+    main()
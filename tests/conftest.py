@@ -0,0 +1,51 @@
+"""Fixtures of the tests: the application on top of the in-memory mock directory, with an explicit feature config."""
+from typing import Dict, Any, Callable, Tuple
+
+import pytest
+from falcon import testing
+
+from application import Application
+from config import config
+from db_mock import MockDatabaseFactory
+
+# Optional features off (independent of config.yaml), tests enable what they test
+BASE_CONFIG: Dict[str, Any] = {
+    'metrics': {'enabled': False},
+    'deadline': {'enabled': False},
+    'admission': {'enabled': False},
+    'compression': {'enabled': False},
+    'cache': {'enabled': False},
+    'profiler': {'enabled': False},
+    'ldapBudget': {'enabled': True, 'callSites': True},
+    'passwords': {'hashProcesses': 0},
+}
+
+
+@pytest.fixture
+def configure(monkeypatch) -> Callable[..., None]:
+    """Sets top level config sections (e.g. `configure(cache={'enabled': True})`) for this test."""
+    def apply(**sections: Any):
+        for name, section in sections.items():
+            monkeypatch.setitem(config._config, name, section)
+    apply(**BASE_CONFIG)
+    monkeypatch.setitem(config._config, 'auth', {**config['auth'], 'statelessTokens': {'enabled': False}})
+    monkeypatch.setitem(config._config, 'ldap', {**config['ldap'], 'circuitBreaker': {'enabled': False}})
+    return apply
+
+
+@pytest.fixture
+def create_app(configure) -> Callable[..., Tuple[Application, MockDatabaseFactory, testing.TestClient]]:
+    """Creates the app (after configuring the test) on a mock directory of `users` admin users."""
+    # Imported late, the benchmarks read the config on import
+    from bench.common import create_mock_app
+
+    def create(users: int = 10) -> Tuple[Application, MockDatabaseFactory, testing.TestClient]:
+        application, db_factory = create_mock_app(users)
+        return application, db_factory, testing.TestClient(application.app)
+    return create
+
+
+@pytest.fixture
+def login_header() -> Callable[..., Dict[str, str]]:
+    from bench.common import login_header
+    return login_header
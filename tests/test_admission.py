@@ -0,0 +1,47 @@
+import threading
+import time
+
+from model.ldap_budget import assert_ldap_operations
+
+
+def test_cheap_route_completes_while_lists_are_saturated(create_app, configure, login_header, monkeypatch):
+    configure(admission={'enabled': True, 'queueTimeout': 2, 'classes': {
+        'list': {'limit': 2, 'minLimit': 2, 'maxLimit': 2, 'maxQueue': 50},
+        'read': {'limit': 16, 'minLimit': 4, 'maxLimit': 64, 'maxQueue': 200},
+    }})
+    application, db_factory, client = create_app()
+    headers = login_header(application.auth)
+    users = application.views.views['users']
+    get_list = users.get_list
+    entered, release = threading.Semaphore(0), threading.Event()
+
+    def slow_list(user):
+        entered.release()
+        release.wait(10)
+        return get_list(user)
+    monkeypatch.setattr(users, 'get_list', slow_list)
+
+    results = []
+    lists = [
+        threading.Thread(target=lambda: results.append(client.simulate_get('/users', headers=headers)))
+        for _ in range(2)
+    ]
+    for thread in lists:
+        thread.start()
+    try:
+        for _ in lists:
+            assert entered.acquire(timeout=5)
+
+        # The saturated class rejects at once instead of holding a worker thread
+        start = time.monotonic()
+        rejected = client.simulate_get('/users', headers=headers)
+        assert time.monotonic() - start < 1
+        assert rejected.status_code == 503
+        assert rejected.headers['Retry-After'] == '1'
+        assert assert_ldap_operations(client, 'GET', '/auth', 1, headers=headers).status_code == 200
+    finally:
+        release.set()
+        for thread in lists:
+            thread.join()
+    assert [result.status_code for result in results] == [200, 200]
+    assert client.simulate_get('/users', headers=headers).status_code == 200
@@ -0,0 +1,23 @@
+import pytest
+from falcon import testing
+
+from model.db_async import AsyncDatabaseBridge
+
+
+@pytest.fixture(params=['wsgi', 'asgi'])
+def client(request, create_app):
+    application, db_factory, client = create_app()
+    if request.param == 'asgi':
+        client = testing.TestClient(application.create_asgi_app(AsyncDatabaseBridge({'threadPoolSize': 2})))
+    return application, client
+
+
+def test_refresh_returns_a_token(client, login_header):
+    application, client = client
+
+    result = client.simulate_post('/jwt-refresh', headers=login_header(application.auth), json={})
+
+    assert result.status_code == 200, result.text
+    assert set(result.json) == {'token'}
+    refreshed = {'Authorization': '{} {}'.format(application.auth.header_prefix, result.json['token'])}
+    assert client.simulate_get('/auth', headers=refreshed).json['primaryKey'] == 'user0'
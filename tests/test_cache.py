@@ -0,0 +1,56 @@
+import gzip
+
+import pytest
+from falcon import testing
+
+from application import Application
+from model.cache import Cache
+
+
+class Unavailable(Exception):
+    pass
+
+
+def _unavailable():
+    raise Unavailable()
+
+
+@pytest.fixture
+def cache() -> Cache:
+    cache = Cache({'ttl': 0, 'staleTtl': 300})
+    cache.stale_errors = (Unavailable,)
+    return cache
+
+
+def test_stale_value_is_used_while_unavailable(cache):
+    assert cache.get_or_load('list:users', 'lists', lambda: ['user0']) == ['user0']
+    assert cache.get_or_load('list:users', 'lists', _unavailable) == ['user0']
+
+
+def test_access_entries_fail_closed(cache):
+    assert cache.get_or_load('auth:user0', 'user:user0', lambda: {'isAdmin': True}, stale=False) == {'isAdmin': True}
+    with pytest.raises(Unavailable):
+        cache.get_or_load('auth:user0', 'user:user0', _unavailable, stale=False)
+
+
+def test_compressed_lists_are_shared_by_workers(create_app, configure, login_header, tmp_path):
+    configure(
+        cache={'enabled': True, 'backend': 'mmap', 'path': str(tmp_path / 'cache'), 'slots': 16},
+        compression={'enabled': True, 'minSize': 0, 'encodings': ['gzip']},
+    )
+    worker_a, db_factory, client_a = create_app()
+    worker_b = Application(db_factory)
+    client_b = testing.TestClient(worker_b.app)
+    headers = {**login_header(worker_a.auth, 'user0'), 'Accept-Encoding': 'gzip'}
+
+    compressed = client_a.simulate_get('/users', headers=headers)
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+
+    def compress(encoding, data):
+        raise AssertionError("Compressed again")
+    worker_b.compression.compress = compress
+    result = client_b.simulate_get('/users', headers=headers)
+    assert result.headers['Content-Encoding'] == 'gzip'
+    assert result.content == compressed.content
+    plain = client_b.simulate_get('/users', headers={'Authorization': headers['Authorization']})
+    assert gzip.decompress(result.content) == plain.content
@@ -0,0 +1,148 @@
+import time
+
+import pytest
+from ldap3.core.exceptions import LDAPSocketReceiveError, LDAPInvalidCredentialsResult
+
+from config import config
+from model import circuit
+from model.circuit import CircuitBreaker, DirectoryUnavailable, CLOSED, OPEN, HALF_OPEN
+from model.deadline import DeadlineExceeded
+
+OUTAGE = LDAPSocketReceiveError("Simulated outage")
+
+
+class _Clock:
+    """Monotonic time advanced by the test."""
+
+    def __init__(self):
+        self.offset = 0.0
+        self._monotonic = time.monotonic
+
+    def __call__(self) -> float:
+        return self._monotonic() + self.offset
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(circuit.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock) -> CircuitBreaker:
+    breaker = CircuitBreaker({'failureThreshold': 2, 'openSeconds': 10, 'slowCallDuration': 1})
+    breaker.transitions = []
+    breaker.state_observers.append(breaker.transitions.append)
+    return breaker
+
+
+def _operation(breaker: CircuitBreaker, error: BaseException = None, duration: float = 0.01):
+    breaker.before('search')
+    breaker.after('search', duration, 0, error)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    _operation(breaker, OUTAGE)
+    _operation(breaker)
+    _operation(breaker, OUTAGE)
+    # Cut short by the deadline of the request, does not count
+    _operation(breaker, DeadlineExceeded())
+    assert breaker.state == CLOSED
+
+    # Slow operations count as failures
+    _operation(breaker, duration=2)
+
+    assert breaker.state == OPEN
+    with pytest.raises(DirectoryUnavailable) as raised:
+        breaker.before('search')
+    assert raised.value.headers['Retry-After'] == '10'
+
+
+def test_errors_of_the_request_are_successes(breaker):
+    _operation(breaker, OUTAGE)
+    # The directory answered (e.g. wrong password)
+    _operation(breaker, LDAPInvalidCredentialsResult())
+    _operation(breaker, OUTAGE)
+
+    assert breaker.state == CLOSED
+
+
+def test_probe_closes_or_reopens(breaker, clock):
+    _operation(breaker, OUTAGE)
+    _operation(breaker, OUTAGE)
+    clock.offset += 10
+
+    # One probe is let through, further operations fail until it finished
+    breaker.before('search')
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(DirectoryUnavailable):
+        breaker.before('search')
+    breaker.after('search', 0.01, 0, OUTAGE)
+    assert breaker.state == OPEN
+    with pytest.raises(DirectoryUnavailable):
+        breaker.before('search')
+
+    clock.offset += 10
+    _operation(breaker)
+
+    assert breaker.state == CLOSED
+    assert breaker.transitions == [OPEN, HALF_OPEN, OPEN, HALF_OPEN, CLOSED]
+    _operation(breaker)
+
+
+def test_lost_probe_is_replaced(breaker, clock):
+    _operation(breaker, OUTAGE)
+    _operation(breaker, OUTAGE)
+    clock.offset += 10
+    breaker.before('search')
+
+    clock.offset += 10
+    breaker.before('search')
+    assert breaker.state == HALF_OPEN
+
+
+@pytest.fixture
+def outage_app(create_app, configure, clock):
+    """The app with the circuit breaker and stale lists, on a directory whose outage is started by the test."""
+    configure(
+        ldap={**config['ldap'], 'circuitBreaker': {'enabled': True, 'failureThreshold': 2, 'openSeconds': 10}},
+        auth={**config['auth'], 'statelessTokens': {'enabled': True, 'pollInterval': 0}},
+        cache={'enabled': True, 'ttl': 0, 'staleTtl': 300, 'backend': 'lru'},
+    )
+    return create_app()
+
+
+def test_outage_serves_stale_lists_and_fails_fast(outage_app, login_header, clock):
+    application, db_factory, client = outage_app
+    # Auth entries are never served stale, trusted tokens need no directory. Tokens issued before the app started are
+    # checked against the directory once, issue it afterwards
+    time.sleep(1.1)
+    headers = login_header(application.auth)
+    fresh = client.simulate_get('/users', headers=headers)
+    assert fresh.status_code == 200
+
+    db_factory.network.inject(OUTAGE, count=2)
+    for _ in range(2):
+        assert client.simulate_get('/groups/admin', headers=headers).status_code != 200
+    assert application.circuit_breaker.state == OPEN
+
+    # Lists are served stale while the circuit is open
+    stale = client.simulate_get('/users', headers=headers)
+    assert stale.status_code == 200
+    assert 'X-Stale' in stale.headers
+    assert stale.json == fresh.json
+
+    # Fails at once, without an operation, for values that are not cached
+    db_factory.network.inject(OUTAGE)
+    missing = client.simulate_get('/groups/admin', headers=headers)
+    assert missing.status_code == 503
+    assert missing.headers['Retry-After'] == '10'
+
+    # The probe after `openSeconds` reaches the directory again (and gets the injected failure)
+    clock.offset += 10
+    assert client.simulate_get('/groups/admin', headers=headers).status_code != 200
+    clock.offset += 10
+    assert client.simulate_get('/groups/admin', headers=headers).status_code == 200
+    assert application.circuit_breaker.state == CLOSED
+    assert 'X-Stale' not in client.simulate_get('/users', headers=headers).headers
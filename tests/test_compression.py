@@ -0,0 +1,63 @@
+import gzip
+
+import pytest
+
+from model.compression import CompressionMiddleware, parse_accept_encoding
+
+
+@pytest.fixture
+def client(configure, create_app, login_header):
+    configure(compression={'enabled': True, 'minSize': 1024, 'encodings': ['gzip']})
+    application, db_factory, client = create_app(users=20)
+    return client, login_header(application.auth)
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, br;q=0.5, zstd;q=x, , *;Q=0') == {'gzip': 1.0, 'br': 0.5, 'zstd': 0.0, '*': 0.0}
+
+
+def test_unknown_encodings_are_rejected():
+    with pytest.raises(ValueError):
+        CompressionMiddleware({'encodings': ['deflate']})
+
+
+def test_compresses_accepted_encodings(client):
+    client, headers = client
+    plain = client.simulate_get('/users', headers=headers)
+    assert len(plain.content) >= 1024
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+
+    for accept in ('gzip', 'br, gzip;q=0.5', '*'):
+        result = client.simulate_get('/users', headers={**headers, 'Accept-Encoding': accept})
+        assert result.status_code == 200
+        assert result.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(result.content) == plain.content
+
+    for accept in ('br', 'gzip;q=0', '*;q=0', 'identity'):
+        result = client.simulate_get('/users', headers={**headers, 'Accept-Encoding': accept})
+        assert 'Content-Encoding' not in result.headers
+        assert result.content == plain.content
+
+
+def test_small_bodies_are_not_compressed(client):
+    client, headers = client
+    result = client.simulate_get('/users/user0', headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert result.status_code == 200
+    assert len(result.content) < 1024
+    assert 'Content-Encoding' not in result.headers
+    assert result.json['user']['uid'] == 'user0'
+
+
+def test_compressed_etags_are_weak(client):
+    client, headers = client
+    headers = {**headers, 'Accept-Encoding': 'gzip'}
+    plain = client.simulate_get('/config', headers={'Authorization': headers['Authorization']})
+    result = client.simulate_get('/config', headers=headers)
+    assert result.headers['Content-Encoding'] == 'gzip'
+    assert result.headers['ETag'] == 'W/' + plain.headers['ETag']
+    # Compressed once, served again from the response
+    assert client.simulate_get('/config', headers=headers).content == result.content
+
+    result = client.simulate_get('/config', headers={**headers, 'If-None-Match': result.headers['ETag']})
+    assert result.status_code == 304
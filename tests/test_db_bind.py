@@ -0,0 +1,95 @@
+import falcon
+import ldap3
+import pytest
+from ldap3.core.exceptions import LDAPInvalidCredentialsResult, LDAPSocketReceiveError
+
+from model.db_bind import BindPool
+
+
+class _Connection:
+    def __init__(self):
+        self.closed = False
+
+    def unbind(self):
+        self.closed = True
+
+
+class _ScriptedPool(BindPool):
+    """Pool on fake connections, binds fail with the errors queued in `failures` (None: success)."""
+
+    def __init__(self, **config):
+        super().__init__(ldap3.Server('ldap://localhost'), config, timeout=5, start_tls=False, observers=[])
+        self.opened = []
+        self.failures = []
+
+    def _open(self):
+        connection = _Connection()
+        self.opened.append(connection)
+        return connection
+
+    def _bind(self, connection, user, password):
+        failure = self.failures.pop(0) if self.failures else None
+        if failure is not None:
+            raise failure
+        if password != 'secret':
+            raise LDAPInvalidCredentialsResult()
+
+
+def test_connections_are_reused():
+    pool = _ScriptedPool()
+    pool.authenticate('uid=user0', 'secret')
+    pool.authenticate('uid=user1', 'secret')
+
+    assert len(pool.opened) == 1
+    assert not pool.opened[0].closed
+
+
+def test_wrong_password_keeps_the_connection():
+    pool = _ScriptedPool()
+    with pytest.raises(LDAPInvalidCredentialsResult):
+        pool.authenticate('uid=user0', 'wrong')
+    pool.authenticate('uid=user0', 'secret')
+
+    assert len(pool.opened) == 1
+
+
+def test_stale_connection_is_replaced():
+    pool = _ScriptedPool()
+    pool.authenticate('uid=user0', 'secret')
+    # The server closed the idle connection
+    pool.failures.append(LDAPSocketReceiveError())
+
+    pool.authenticate('uid=user0', 'secret')
+
+    assert len(pool.opened) == 2
+    assert pool.opened[0].closed
+    assert not pool.opened[1].closed
+
+
+def test_new_connection_failing_is_not_retried():
+    pool = _ScriptedPool()
+    pool.failures.append(LDAPSocketReceiveError())
+
+    with pytest.raises(LDAPSocketReceiveError):
+        pool.authenticate('uid=user0', 'secret')
+    assert len(pool.opened) == 1
+    assert pool.opened[0].closed
+
+
+def test_idle_connections_expire():
+    pool = _ScriptedPool(idleTimeout=-1)
+    pool.authenticate('uid=user0', 'secret')
+    pool.authenticate('uid=user0', 'secret')
+
+    assert len(pool.opened) == 2
+    assert pool.opened[0].closed
+
+
+def test_busy_slots_reject():
+    pool = _ScriptedPool(maxConcurrent=1, acquireTimeout=0.01)
+    pool._slots.acquire()
+    try:
+        with pytest.raises(falcon.HTTPServiceUnavailable):
+            pool.authenticate('uid=user0', 'secret')
+    finally:
+        pool._slots.release()
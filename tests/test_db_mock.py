@@ -0,0 +1,64 @@
+import sys
+import threading
+
+import ldap3
+
+from db_mock import MockDirectory, MockConnection, parse_filter
+
+BASE = 'ou=people,dc=example,dc=org'
+
+
+def _directory(users: int) -> MockDirectory:
+    directory = MockDirectory()
+    directory.put(BASE, {'objectClass': ('organizationalUnit',), 'ou': ('people',)})
+    for idx in reversed(range(users)):
+        uid = 'user{:03d}'.format(idx)
+        directory.put('uid={},{}'.format(uid, BASE), {
+            'objectClass': ('inetOrgPerson',), 'uid': (uid,), 'sn': ('User',),
+        })
+    return directory
+
+
+def test_indexed_and_scanned_searches_have_the_same_order():
+    directory = _directory(20)
+
+    # objectClass is indexed, sn is not
+    indexed = directory.search(BASE, parse_filter('(objectClass=inetOrgPerson)'), ldap3.LEVEL)
+    scanned = directory.search(BASE, parse_filter('(sn=User)'), ldap3.LEVEL)
+
+    assert [dn for dn, entry in indexed] == [dn for dn, entry in scanned]
+    assert [dn for dn, entry in indexed] == sorted(dn for dn, entry in indexed)
+
+
+def test_search_results_survive_concurrent_deletes():
+    directory = _directory(200)
+    connection = MockConnection('cn=admin', directory)
+    users = [(dn, entry) for dn, entry in directory.entries.items() if dn != BASE]
+    errors = []
+    stop = threading.Event()
+
+    def delete_and_restore():
+        while not stop.is_set():
+            for dn, entry in users[::7]:
+                with directory.lock:
+                    directory.remove(dn)
+                with directory.lock:
+                    directory.put(dn, entry)
+
+    # Switch threads often, such that the writer runs while the results are built
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    writer = threading.Thread(target=delete_and_restore)
+    writer.start()
+    try:
+        for _ in range(200):
+            try:
+                connection.search(BASE, '(objectClass=inetOrgPerson)', ldap3.SUBTREE)
+            except KeyError as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        writer.join()
+        sys.setswitchinterval(switch_interval)
+
+    assert not errors
@@ -0,0 +1,46 @@
+import time
+
+from model.db import DatabaseObserver
+
+
+def _create_user(client, headers, timeout: float, **fields):
+    user = {'uid': 'late', 'givenName': 'Late', 'sn': 'User', 'mail': 'late@localhost.localdomain'}
+    user.update(mobile='0123 456789', **fields)
+    return client.simulate_post('/users', headers={**headers, 'X-Request-Timeout': str(timeout)}, json={'user': user})
+
+
+class _SlowWrites(DatabaseObserver):
+    """Lets the first add exceed the deadline of the request."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def after(self, operation, duration, entries, error):
+        if operation == 'add':
+            time.sleep(self.delay)
+
+
+def test_started_write_is_completed_after_deadline(create_app, configure, login_header):
+    configure(deadline={'enabled': True, 'timeout': 10, 'header': 'X-Request-Timeout', 'maxTimeout': 30})
+    application, db_factory, client = create_app()
+    headers = login_header(application.auth)
+    db_factory.observers.append(_SlowWrites(0.3))
+
+    result = _create_user(client, headers, 0.2, isAdmin=True)
+
+    assert result.status_code == 200, result.text
+    # The membership (written to the group after the user) is complete
+    details = client.simulate_get('/users/late', headers=headers).json
+    assert details['user']['isAdmin'] is True
+
+
+def test_deadline_is_checked_before_the_first_write(create_app, configure, login_header):
+    configure(deadline={'enabled': True, 'timeout': 10, 'header': 'X-Request-Timeout', 'maxTimeout': 30})
+    application, db_factory, client = create_app()
+    headers = login_header(application.auth)
+    db_factory.network.rtt = 0.3
+
+    result = _create_user(client, headers, 0.2)
+
+    assert result.status_code == 504
+    assert client.simulate_get('/users/late', headers=headers).status_code == 404
@@ -0,0 +1,46 @@
+"""Pins the directory operations of the hot endpoints, such that additional round trips do not slip in unnoticed."""
+import pytest
+
+from model.ldap_budget import assert_ldap_operations, track_operations
+
+
+@pytest.mark.parametrize('path, expected', [
+    # Auth entry of the token user
+    ('/auth', 1),
+    # Auth entry and one search of all users, independent of the number of users
+    ('/users', 2),
+    ('/config', 1),
+])
+def test_hot_endpoints(create_app, login_header, path, expected):
+    application, db_factory, client = create_app(users=20)
+    headers = login_header(application.auth)
+
+    result = assert_ldap_operations(client, 'GET', path, expected, headers=headers)
+
+    assert result.status_code == 200
+
+
+def test_list_operations_do_not_grow_with_entries(create_app, login_header):
+    application, db_factory, client = create_app(users=50)
+
+    assert_ldap_operations(client, 'GET', '/users', 2, headers=login_header(application.auth))
+
+
+def test_cached_list_and_auth_entry(create_app, configure, login_header):
+    configure(cache={'enabled': True, 'ttl': 30, 'backend': 'lru'})
+    application, db_factory, client = create_app()
+    headers = login_header(application.auth)
+    assert_ldap_operations(client, 'GET', '/users', 2, headers=headers)
+
+    assert_ldap_operations(client, 'GET', '/users', 0, headers=headers)
+
+
+def test_call_sites_are_outside_of_the_access_layer(create_app, login_header):
+    application, db_factory, client = create_app()
+
+    with track_operations() as operations:
+        client.simulate_get('/users', headers=login_header(application.auth))
+
+    assert operations.call_sites
+    for site in operations.call_sites:
+        assert 'single_flight.py' not in site and 'db.py' not in site, site
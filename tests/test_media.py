@@ -0,0 +1,80 @@
+import falcon
+import pytest
+
+from bench.common import BENCH_PASSWORD
+from model import media
+from model.media import MediaFormats, json_handler
+
+
+def _missing_library():
+    raise ImportError("No module named 'missing'")
+
+
+@pytest.fixture
+def client(monkeypatch, configure, create_app):
+    """The app with the binary formats configured but their libraries missing."""
+    missing = {media_type: _missing_library for media_type in media.OPTIONAL_FORMATS}
+    monkeypatch.setattr(media, 'OPTIONAL_FORMATS', missing)
+    configure(media={'formats': [falcon.MEDIA_MSGPACK, media.MEDIA_CBOR]})
+    application, db_factory, client = create_app()
+    return application, client
+
+
+def test_missing_libraries_are_skipped(monkeypatch):
+    monkeypatch.setattr(media, 'OPTIONAL_FORMATS', {falcon.MEDIA_MSGPACK: _missing_library})
+    assert MediaFormats({'formats': [falcon.MEDIA_JSON, falcon.MEDIA_MSGPACK]}).media_types == [falcon.MEDIA_JSON]
+    with pytest.raises(ValueError):
+        MediaFormats({'formats': ['text/plain']})
+
+
+def test_json_encoders():
+    assert isinstance(json_handler('stdlib'), falcon.media.JSONHandler)
+    with pytest.raises(ValueError):
+        json_handler('bad')
+
+
+def test_negotiates_json_and_rejects_missing_formats(client, login_header):
+    application, client = client
+    headers = login_header(application.auth)
+
+    for accept in (None, '*/*', 'application/json', 'application/msgpack;q=0.5, application/json'):
+        result = client.simulate_get('/users', headers={**headers, 'Accept': accept} if accept else headers)
+        assert result.status_code == 200
+        assert result.headers['Content-Type'] == falcon.MEDIA_JSON
+        assert isinstance(result.json, list)
+
+    for accept in (falcon.MEDIA_MSGPACK, media.MEDIA_CBOR):
+        result = client.simulate_get('/users', headers={**headers, 'Accept': accept})
+        assert result.status_code == 406
+
+
+def test_rejects_unsupported_request_bodies(client, login_header):
+    application, client = client
+    headers = login_header(application.auth)
+    for content_type in ('text/plain', falcon.MEDIA_MSGPACK, None):
+        request_headers = {**headers, 'Content-Type': content_type} if content_type else headers
+        result = client.simulate_post('/users', headers=request_headers, body=b'{}')
+        assert result.status_code == 415
+        assert result.json['description'] == 'This API only supports requests encoded as application/json.'
+
+    # The media type is compared without its parameters
+    body = '{{"username": "user0", "password": "{}"}}'.format(BENCH_PASSWORD)
+    result = client.simulate_post('/jwt-auth', headers={'Content-Type': 'application/json; charset=UTF-8'}, body=body)
+    assert result.status_code == 200
+
+
+def test_cbor_round_trip(configure, create_app, login_header):
+    cbor2 = pytest.importorskip('cbor2')
+    configure(media={'formats': [media.MEDIA_CBOR]})
+    application, db_factory, client = create_app()
+    headers = {**login_header(application.auth), 'Accept': media.MEDIA_CBOR}
+
+    result = client.simulate_get('/users', headers=headers)
+    assert result.status_code == 200
+    assert result.headers['Content-Type'] == media.MEDIA_CBOR
+    assert cbor2.loads(result.content) == client.simulate_get('/users', headers=login_header(application.auth)).json
+
+    result = client.simulate_post('/jwt-auth', headers=headers, content_type=media.MEDIA_CBOR,
+                                  body=cbor2.dumps({'username': 'user0', 'password': BENCH_PASSWORD}))
+    assert result.status_code == 200
+    assert 'token' in cbor2.loads(result.content)
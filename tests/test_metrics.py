@@ -0,0 +1,23 @@
+import os
+
+
+def test_metrics_require_the_token(create_app, configure):
+    configure(metrics={'enabled': True, 'token': 'scrape-token'})
+    application, db_factory, client = create_app()
+
+    assert client.simulate_get('/metrics').status_code == 401
+    assert client.simulate_get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.simulate_get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code == 200
+
+
+def test_series_are_labeled_by_worker(create_app, configure, login_header):
+    configure(metrics={'enabled': True, 'token': 'scrape-token'})
+    application, db_factory, client = create_app()
+    client.simulate_get('/users', headers=login_header(application.auth))
+
+    text = client.simulate_get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).text
+
+    worker = 'worker="{}"'.format(os.getpid())
+    samples = [line for line in text.splitlines() if line and not line.startswith('#')]
+    assert any(line.startswith('http_request_duration_seconds_count{') for line in samples)
+    assert all(worker in line for line in samples)
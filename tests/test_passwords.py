@@ -0,0 +1,93 @@
+import hashlib
+import io
+import os
+
+import passlib.hash
+import pytest
+
+from model.passwords import Passwords, BreachFile, BREACH_FILE_MAGIC, write_breach_file, hash_plain_lines
+
+
+def test_hash_inline_by_default():
+    passwords = Passwords({})
+    assert passwords.hash_processes == 0
+    assert passlib.hash.ldap_salted_sha1.verify('secret', passwords.hash('salted_sha1', 'secret'))
+    assert passwords._pool is None
+
+
+def test_pool_is_not_forked():
+    passwords = Passwords({'hashProcesses': 1})
+    try:
+        assert passlib.hash.ldap_salted_sha1.verify('secret', passwords.hash('salted_sha1', 'secret'))
+        pid, pool = passwords._pool
+        assert pid == os.getpid()
+        assert pool._mp_context.get_start_method() in ('forkserver', 'spawn')
+    finally:
+        passwords.close()
+
+
+def _write(tmp_path, passwords, prefix_bytes: int = 8) -> str:
+    path = str(tmp_path / 'breached.bin')
+    with open(path, 'wb') as output:
+        count = write_breach_file(
+            hash_plain_lines(passwords), output, prefix_bytes=prefix_bytes, presorted=False
+        )
+    assert count == len(set(passwords))
+    return path
+
+
+def test_breach_file_round_trip(tmp_path):
+    breached = ['password{}'.format(index) for index in range(100)]
+    passwords = Passwords({'breachFile': _write(tmp_path, breached + ['password0'])})
+    try:
+        assert passwords.breach_file.count == 100
+        assert all(passwords.is_breached(password) for password in breached)
+        assert not passwords.is_breached('correct horse battery staple')
+    finally:
+        passwords.close()
+
+
+def test_breach_file_search_boundaries(tmp_path):
+    digests = sorted(hashlib.sha1(password.encode()).digest() for password in ('a', 'b', 'c'))
+    path = str(tmp_path / 'breached.bin')
+    with open(path, 'wb') as output:
+        write_breach_file(iter(digests), output, prefix_bytes=20)
+    breach_file = BreachFile(path)
+    try:
+        # First, last and all entries, digests below the first, between and above the last
+        assert all(breach_file.contains_digest(digest) for digest in digests)
+        assert not breach_file.contains_digest(bytes(20))
+        assert not breach_file.contains_digest(b'\xff' * 20)
+        assert not breach_file.contains_digest(digests[0][:-1] + bytes([digests[0][-1] ^ 1]))
+    finally:
+        breach_file.close()
+
+
+def test_empty_breach_file(tmp_path):
+    breach_file = BreachFile(_write(tmp_path, []))
+    try:
+        assert breach_file.count == 0
+        assert 'password' not in breach_file
+    finally:
+        breach_file.close()
+
+
+@pytest.mark.parametrize('content', [
+    b'',
+    BREACH_FILE_MAGIC,
+    b'NOTMAGIC' + bytes(8),
+    BREACH_FILE_MAGIC + bytes(8),
+    BREACH_FILE_MAGIC + bytes([21]) + bytes(7),
+    BREACH_FILE_MAGIC + bytes([8]) + bytes(7) + bytes(12),
+])
+def test_invalid_breach_file(tmp_path, content):
+    path = tmp_path / 'breached.bin'
+    path.write_bytes(content)
+
+    with pytest.raises(ValueError):
+        BreachFile(str(path))
+
+
+def test_unsorted_input_is_rejected():
+    with pytest.raises(ValueError):
+        write_breach_file(iter([b'\x02' * 20, b'\x01' * 20]), io.BytesIO())
@@ -0,0 +1,34 @@
+import pytest
+
+from model.profiler import ProfilerMiddleware
+
+
+@pytest.fixture
+def profiled_app(create_app, configure):
+    configure(profiler={'enabled': True, 'sampleRate': 0.0, 'header': 'X-Profile', 'permissions': ['isAdmin']})
+    return create_app()
+
+
+def test_requested_profile_of_permitted_user(profiled_app, login_header):
+    application, db_factory, client = profiled_app
+
+    result = client.simulate_get('/users', headers={**login_header(application.auth), 'X-Profile': '1'})
+
+    assert result.headers.get('X-Profile-Id') is not None
+    assert len(application.profiler.middleware.profiles) == 1
+
+
+@pytest.mark.parametrize('path, headers', [
+    ('/register-config', {}),
+    ('/users', {'Authorization': 'JWT invalid'}),
+])
+def test_unauthenticated_requests_are_not_profiled(profiled_app, monkeypatch, path, headers):
+    application, db_factory, client = profiled_app
+    started = []
+    monkeypatch.setattr(ProfilerMiddleware, '_start', lambda req, requested: started.append(req))
+
+    result = client.simulate_get(path, headers={**headers, 'X-Profile': '1'})
+
+    assert result.headers.get('X-Profile-Id') is None
+    # Not even profiled and discarded afterwards
+    assert not started
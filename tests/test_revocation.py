@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+from falcon import testing
+
+from application import Application
+from config import config
+from model.revocation import RevocationList, RevocationPoller, SharedRevocationMarks
+
+LIFETIME = 3600
+
+
+def _in_child(fn) -> bytes:
+    """Runs `fn` in a forked process, returns the bytes it returned."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(write_fd, fn())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    try:
+        result = b''
+        chunk = os.read(read_fd, 1024)
+        while chunk:
+            result += chunk
+            chunk = os.read(read_fd, 1024)
+        return result
+    finally:
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+
+def test_mark_of_another_process_is_adopted(tmp_path):
+    path = str(tmp_path / 'revocations')
+    revocations = RevocationList(LIFETIME, shared=SharedRevocationMarks(path))
+    issued_at = time.time() - 10
+    claims = {'primaryKey': 'alice'}
+    assert revocations.lookup('alice', issued_at, claims)[0] is claims
+
+    def revoke_in_other_worker() -> bytes:
+        RevocationList(LIFETIME, shared=SharedRevocationMarks(path)).revoke('alice')
+        return b'ok'
+    assert _in_child(revoke_in_other_worker) == b'ok'
+
+    auth_entry, mark = revocations.lookup('alice', issued_at, claims)
+    assert auth_entry is None
+    # Other users are still trusted
+    assert revocations.lookup('bob', issued_at, claims)[0] is claims
+    # Once verified, the loaded entry is used
+    revocations.verified('alice', mark, {'primaryKey': 'alice', 'isAdmin': False})
+    assert revocations.lookup('alice', issued_at, claims)[0] == {'primaryKey': 'alice', 'isAdmin': False}
+
+
+class _ChangingView:
+    def __init__(self, key: str):
+        self.key = key
+        self.changed = []
+
+    def get_modified_since(self, since):
+        return [change for change in self.changed if change[1] >= since]
+
+
+def test_poller_runs_in_forked_worker():
+    poller = RevocationPoller(_ChangingView('users'), RevocationList(LIFETIME), interval=60)
+    poller.ensure_running()
+
+    def poller_threads() -> bytes:
+        poller.ensure_running()
+        return str(sum(thread.name == 'token-revocation-poller' for thread in threading.enumerate())).encode()
+
+    try:
+        assert _in_child(poller_threads) == b'1'
+    finally:
+        poller.close()
+
+
+def test_changed_group_marks_all_users():
+    users, groups = _ChangingView('users'), _ChangingView('groups')
+    revocations = RevocationList(LIFETIME)
+    poller = RevocationPoller(users, revocations, interval=60, group_views=[groups])
+    issued_at = time.time() - 10
+    claims = {'primaryKey': 'alice'}
+    poller.poll()
+    assert revocations.lookup('alice', issued_at, claims)[0] is claims
+
+    groups.changed.append(('admin', datetime.now(timezone.utc)))
+    poller.poll()
+
+    assert revocations.lookup('alice', issued_at, claims)[0] is None
+
+
+@pytest.fixture
+def two_workers(create_app, configure, tmp_path):
+    """Two applications (like two prefork workers) on one directory, sharing the revocation marks."""
+    configure(auth={**config['auth'], 'statelessTokens': {
+        'enabled': True, 'pollInterval': 0, 'revocationPath': str(tmp_path / 'revocations'),
+    }})
+    worker_a, db_factory, client_a = create_app()
+    worker_b = Application(db_factory)
+    return worker_a, client_a, worker_b, testing.TestClient(worker_b.app)
+
+
+def test_demotion_in_one_worker_is_seen_by_the_other(two_workers, login_header):
+    worker_a, client_a, worker_b, client_b = two_workers
+    # Tokens issued before the worker started are checked once, issue the token afterwards
+    time.sleep(1.1)
+    demoted = login_header(worker_a.auth, 'user0')
+    assert client_b.simulate_get('/users', headers=demoted).status_code == 200
+
+    result = client_a.simulate_patch(
+        '/users/user0', headers=login_header(worker_a.auth, 'user1'), json={'user': {'isAdmin': False}}
+    )
+    assert result.status_code == 200, result.text
+
+    assert client_b.simulate_get('/users', headers=demoted).status_code == 403
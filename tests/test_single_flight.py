@@ -0,0 +1,46 @@
+import threading
+import time
+
+import pytest
+
+from model import deadline
+from model.single_flight import SingleFlight
+
+
+def _start_leader(flight: SingleFlight, release: threading.Event) -> threading.Thread:
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'result'
+    leader = threading.Thread(target=flight.do, args=('key', slow))
+    leader.start()
+    started.wait(5)
+    return leader
+
+
+def test_follower_gets_result_of_leader():
+    flight, release = SingleFlight(), threading.Event()
+    leader = _start_leader(flight, release)
+    threading.Timer(0.05, release.set).start()
+    try:
+        assert flight.do('key', lambda: 'second call') == 'result'
+    finally:
+        release.set()
+        leader.join()
+
+
+def test_follower_waits_within_deadline():
+    flight, release = SingleFlight(), threading.Event()
+    leader = _start_leader(flight, release)
+    token = deadline._deadline.set(time.monotonic() + 0.1)
+    try:
+        start = time.monotonic()
+        with pytest.raises(deadline.DeadlineExceeded):
+            flight.do('key', lambda: 'second call')
+        assert time.monotonic() - start < 1
+    finally:
+        deadline._deadline.reset(token)
+        release.set()
+        leader.join()
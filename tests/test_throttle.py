@@ -0,0 +1,94 @@
+import pytest
+from falcon import testing
+
+from application import Application
+from bench.common import BENCH_PASSWORD
+from config import config
+from model import throttle
+from model.throttle import TokenBuckets
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(throttle.time, 'monotonic', clock)
+    return clock
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    buckets = TokenBuckets({'rate': 0.5, 'burst': 2})
+    assert buckets.take('client') == 0
+    assert buckets.take('client') == 0
+    # Empty: the next token is available in 1 / rate seconds
+    assert buckets.take('client') == pytest.approx(2.0)
+    # Other keys have their own bucket
+    assert buckets.take('other') == 0
+
+    clock.now += 1
+    assert buckets.take('client') == pytest.approx(1.0)
+    clock.now += 2
+    assert buckets.take('client') == 0
+    # Refilled at most up to the burst
+    clock.now += 100
+    assert [buckets.take('client') for _ in range(2)] == [0, 0]
+    assert buckets.take('client') > 0
+
+
+def test_least_recently_used_buckets_are_dropped(clock):
+    buckets = TokenBuckets({'rate': 0.1, 'burst': 1, 'maxKeys': 2})
+    for key in ('a', 'b', 'c'):
+        buckets.take(key)
+    assert len(buckets) == 2
+    # 'a' was dropped, its bucket starts full again
+    assert buckets.take('a') == 0
+
+
+def _login(client, username: str = 'user0', **headers):
+    return client.simulate_post(
+        '/jwt-auth', json={'username': username, 'password': BENCH_PASSWORD}, headers=headers
+    )
+
+
+@pytest.fixture
+def throttled_client(create_app, configure):
+    """Creates a client of an app with the given throttle config (the mock app clears the limits for benchmarks)."""
+    def create(**throttle_config) -> testing.TestClient:
+        configure(auth={**config['auth'], 'statelessTokens': {'enabled': False}, 'throttle': throttle_config})
+        application, db_factory, client = create_app()
+        return testing.TestClient(Application(db_factory).app)
+    return create
+
+
+def test_logins_are_rejected_above_the_limit(throttled_client, clock):
+    client = throttled_client(enabled=True, loginPerUser={'rate': 0.1, 'burst': 2})
+
+    assert [_login(client).status_code for _ in range(2)] == [200, 200]
+    rejected = _login(client, 'USER0')
+    assert rejected.status_code == 429
+    assert rejected.headers['Retry-After'] == '10'
+    assert _login(client, 'user1').status_code == 200
+
+    clock.now += 10
+    assert _login(client).status_code == 200
+
+
+def test_per_ip_limit_uses_forwarded_address(throttled_client, clock):
+    client = throttled_client(enabled=True, trustForwardedFor=True, loginPerIp={'rate': 0.1, 'burst': 1})
+
+    assert _login(client, **{'X-Forwarded-For': '192.0.2.1'}).status_code == 200
+    assert _login(client, **{'X-Forwarded-For': '192.0.2.1'}).status_code == 429
+    assert _login(client, **{'X-Forwarded-For': '192.0.2.2'}).status_code == 200
+
+
+def test_disabled_by_default(throttled_client):
+    client = throttled_client(loginPerUser={'rate': 0.1, 'burst': 1})
+
+    assert [_login(client).status_code for _ in range(3)] == [200, 200, 200]
@@ -0,0 +1,18 @@
+from model.view_api import UserConfigApi
+
+
+def test_config_is_serialized_per_permission_combination_on_demand(create_app, login_header):
+    application, db_factory, client = create_app()
+    config_api = UserConfigApi(application.views.views)
+    assert config_api.responses == {}
+
+    admin = config_api.response({'isAdmin': True})
+    assert config_api.response({'isAdmin': True, 'unrelated': True}) is admin
+    assert len(config_api.responses) == 1
+
+    # The same config as served by the app
+    result = client.simulate_get('/config', headers=login_header(application.auth))
+    assert result.status_code == 200
+    assert result.json == admin.media
+    assert config_api.response({}).media != admin.media
+    assert len(config_api.responses) == 2
@@ -0,0 +1,85 @@
+import pytest
+
+from model.ldap_budget import assert_ldap_operations
+from model.passwords import write_breach_file, hash_plain_lines
+
+BREACHED = 'password1'
+VALID_USER = {
+    'uid': 'new', 'givenName': 'New', 'sn': 'User', 'mail': 'new@localhost.localdomain', 'mobile': '0123 456789',
+}
+
+
+@pytest.fixture
+def app(create_app, configure, login_header, tmp_path):
+    """The app with a local breach file containing `BREACHED`, and the headers of an admin."""
+    breach_file = str(tmp_path / 'breached.bin')
+    with open(breach_file, 'wb') as output:
+        write_breach_file(hash_plain_lines([BREACHED]), output, presorted=False)
+    configure(passwords={'hashProcesses': 0, 'breachFile': breach_file})
+    application, db_factory, client = create_app()
+    return client, login_header(application.auth)
+
+
+def test_create_reports_all_invalid_fields(app):
+    client, headers = app
+    user = dict(VALID_USER, uid='not valid', givenName='1', mail='no mail')
+
+    # Rejected before any directory operation but the auth entry of the token
+    result = assert_ldap_operations(client, 'POST', '/users', 1, headers=headers, json={'user': user})
+
+    assert result.status_code == 400
+    assert result.json['field'] == {'user': {
+        'uid': "Invalid value not valid for uid, expecting alphanumeric characters, '_' and '-'",
+        'givenName': "Invalid value 1 for givenName, expecting letter characters and spaces",
+        'mail': "Invalid value no mail for mail, expecting mail@example.com",
+    }}
+    assert client.simulate_get('/users/not valid', headers=headers).status_code == 404
+
+
+def test_update_reports_invalid_fields_of_all_views(app):
+    client, headers = app
+
+    result = client.simulate_patch('/users/user0', headers=headers, json={
+        'user': {'mail': 'no mail', 'mobile': 'none'},
+        'password': {'_enabled': True, 'userPassword': BREACHED},
+    })
+
+    assert result.status_code == 400
+    assert set(result.json['field']) == {'user', 'password'}
+    assert set(result.json['field']['user']) == {'mail', 'mobile'}
+    assert result.json['field']['password'] == {
+        'userPassword': "Password is in list of leaked passwords, not accepted",
+    }
+    assert client.simulate_get('/users/user0', headers=headers).json['user']['mail'] == 'user0@localhost.localdomain'
+
+
+def test_breached_password_is_rejected(app):
+    client, headers = app
+
+    rejected = client.simulate_post('/users', headers=headers, json={
+        'user': VALID_USER, 'password': {'_enabled': True, 'userPassword': BREACHED},
+    })
+    assert rejected.status_code == 400
+    assert rejected.json['field'] == {
+        'password': {'userPassword': "Password is in list of leaked passwords, not accepted"},
+    }
+
+    accepted = client.simulate_post('/users', headers=headers, json={
+        'user': VALID_USER, 'password': {'_enabled': True, 'userPassword': 'correct horse battery staple'},
+    })
+    assert accepted.status_code == 200, accepted.text
+
+
+def test_created_disabled_by_default(app):
+    client, headers = app
+
+    # Without `_enabled`, the password group is created disabled, its required password is not needed
+    result = client.simulate_post('/users', headers=headers, json={'user': VALID_USER, 'password': {}})
+    assert result.status_code == 200, result.text
+    assert client.simulate_get('/users/new', headers=headers).json['password']['_enabled'] is False
+
+    enabled = client.simulate_post('/users', headers=headers, json={
+        'user': dict(VALID_USER, uid='enabled'), 'password': {'_enabled': True},
+    })
+    assert enabled.status_code == 400
+    assert enabled.json['field'] == {'password': {'userPassword': "userPassword is required"}}
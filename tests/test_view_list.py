@@ -0,0 +1,45 @@
+from model.db import LdapFetch, LdapMods
+from model.view_list import ViewList
+
+
+def test_columns_match_the_objects(create_app, login_header):
+    application, db_factory, client = create_app(users=3)
+    db_factory.connection.modify(application.views.views['users'].get_dn('user1'), {
+        'mobile': [(LdapMods.DELETE, [])],
+    })
+    headers = login_header(application.auth)
+
+    objects = client.simulate_get('/users', headers=headers).json
+    result = client.simulate_get('/users', headers=headers, params={'format': 'columns'})
+    assert result.status_code == 200
+    columns, rows = result.json['columns'], result.json['rows']
+    assert columns[0] == 'uid'
+    assert len(rows) == len(objects) == 3
+    for obj, row in zip(objects, rows):
+        # Missing values are null instead of omitted
+        assert dict(zip(columns, row)) == {column: obj.get(column) for column in columns}
+    assert 'mobile' not in objects[1]
+    assert rows[1][columns.index('mobile')] is None
+
+    result = client.simulate_get('/users', headers=headers, params={'format': 'rows'})
+    assert result.status_code == 400
+
+
+def test_disabled_entries_have_no_values_after_enabled():
+    view_list = ViewList({
+        'cn': {'type': 'text', 'title': "Common Name"},
+        '_enabled': {'type': 'objectClass', 'title': "Enabled", 'objectClass': 'simpleSecurityObject'},
+        'mail': {'type': 'text', 'title': "E-Mail"},
+    })
+    fetches = [
+        LdapFetch('cn=a', {'cn': ['a'], 'objectClass': ['simpleSecurityObject'], 'mail': ['a@localhost']}),
+        LdapFetch('cn=b', {'cn': ['b'], 'objectClass': [], 'mail': ['b@localhost']}),
+    ]
+    assert view_list.get_columns(fetches) == {
+        'columns': ['cn', '_enabled', 'mail'],
+        'rows': [['a', True, 'a@localhost'], ['b', False, None]],
+    }
+    assert view_list.get(fetches) == [
+        {'cn': 'a', '_enabled': True, 'mail': 'a@localhost'},
+        {'cn': 'b', '_enabled': False},
+    ]